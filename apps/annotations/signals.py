@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Tag
+from .tag_cache import tag_cache
+
+
+@receiver(post_save, sender=Tag)
+def clear_cached_tags_on_save(sender, instance, created, **kwargs):
+    # new tags can't be in the cache yet
+    if not created:
+        tag_cache.invalidate_team(instance.team_id)
+
+
+@receiver(post_delete, sender=Tag)
+def clear_cached_tags_on_delete(sender, instance, **kwargs):
+    tag_cache.invalidate_team(instance.team_id)
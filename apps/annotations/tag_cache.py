@@ -0,0 +1,109 @@
+"""Cached lookup of the tags that are added to messages automatically.
+
+Version, bot response and rating tags are a small set per team that is looked up for every message. Tags are cached
+in process and in Redis. The cache keys include a per-team generation token that changes whenever one of the team's
+tags is changed or deleted (see `apps.annotations.signals`) so stale entries are never read.
+
+Tags are only added to the cache once the transaction that loaded or created them is committed so that tags from a
+rolled back transaction are never cached.
+"""
+
+import threading
+from collections import OrderedDict
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.annotations.models import Tag
+from apps.teams.models import Team
+
+TAG_CACHE_TIMEOUT = 60 * 60 * 24
+
+TagKey = tuple[str, str]
+
+
+def _get_generation_key(team_id: int) -> str:
+    return f"tag_cache_generation:{team_id}"
+
+
+class TagCache:
+    def __init__(self, maxsize=1024) -> None:
+        self.maxsize = maxsize
+        self.tags: OrderedDict[str, Tag] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_tag(self, team: Team, name: str, category: str, is_system_tag=True) -> Tag:
+        """Returns the tag, creating it if it doesn't exist"""
+        return self.get_tags(team, [(name, category)], is_system_tag=is_system_tag)[(name, category)]
+
+    def get_tags(self, team: Team, tags: list[TagKey], is_system_tag=True) -> dict[TagKey, Tag]:
+        """Returns the tags for a list of (name, category) tuples, creating any that don't exist"""
+        generation = self._get_generation(team.id)
+        keys = {
+            tag: f"tag:{team.id}:{generation}:{int(is_system_tag)}:{tag[1]}:{tag[0]}" for tag in dict.fromkeys(tags)
+        }
+
+        found = {}
+        with self.lock:
+            for tag, key in keys.items():
+                if key in self.tags:
+                    self.tags.move_to_end(key)
+                    found[tag] = self.tags[key]
+
+        missing = {tag: key for tag, key in keys.items() if tag not in found}
+        if missing:
+            cached = cache.get_many(missing.values())
+            from_redis = {tag: cached[key] for tag, key in missing.items() if key in cached}
+            found.update(from_redis)
+            self._set_local({missing[tag]: obj for tag, obj in from_redis.items()})
+
+        missing = {tag: key for tag, key in keys.items() if tag not in found}
+        if missing:
+            loaded = self._load(team, list(missing), is_system_tag)
+            found.update(loaded)
+            to_cache = {missing[tag]: obj for tag, obj in loaded.items()}
+            transaction.on_commit(lambda: self._set(to_cache))
+
+        return found
+
+    def invalidate_team(self, team_id: int):
+        key = _get_generation_key(team_id)
+        cache.set(key, uuid4().hex, None)
+        # readers in other processes may have cached what they saw before the change was committed
+        transaction.on_commit(lambda: cache.set(key, uuid4().hex, None))
+
+    def clear(self):
+        with self.lock:
+            self.tags.clear()
+
+    def _get_generation(self, team_id: int) -> str:
+        key = _get_generation_key(team_id)
+        generation = cache.get(key)
+        if generation is None:
+            cache.add(key, uuid4().hex, None)
+            generation = cache.get(key)
+        return generation
+
+    def _load(self, team: Team, tags: list[TagKey], is_system_tag: bool) -> dict[TagKey, Tag]:
+        existing = Tag.objects.filter(team=team, is_system_tag=is_system_tag, name__in=[name for name, _ in tags])
+        loaded = {(tag.name, tag.category): tag for tag in existing if (tag.name, tag.category) in tags}
+        for name, category in tags:
+            if (name, category) not in loaded:
+                loaded[(name, category)], _ = Tag.objects.get_or_create(
+                    name=name, team=team, is_system_tag=is_system_tag, category=category
+                )
+        return loaded
+
+    def _set(self, tags: dict[str, Tag]):
+        cache.set_many(tags, TAG_CACHE_TIMEOUT)
+        self._set_local(tags)
+
+    def _set_local(self, tags: dict[str, Tag]):
+        with self.lock:
+            self.tags.update(tags)
+            while len(self.tags) > self.maxsize:
+                self.tags.popitem(last=False)
+
+
+tag_cache = TagCache()
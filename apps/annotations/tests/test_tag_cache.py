@@ -0,0 +1,87 @@
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.annotations.models import CustomTaggedItem, Tag, TagCategories
+from apps.annotations.tag_cache import tag_cache
+from apps.chat.models import ChatMessage, ChatMessageType
+from apps.utils.factories.experiment import ExperimentSessionFactory
+
+
+@pytest.fixture()
+def session(db):
+    return ExperimentSessionFactory()
+
+
+@pytest.fixture()
+def team(session):
+    return session.team
+
+
+def test_get_tag_cached_after_commit(team, django_assert_num_queries, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        tag = tag_cache.get_tag(team, "v1", TagCategories.EXPERIMENT_VERSION)
+    assert tag.is_system_tag
+
+    with django_assert_num_queries(0):
+        assert tag_cache.get_tag(team, "v1", TagCategories.EXPERIMENT_VERSION) == tag
+
+    # the tag is also found by processes that haven't cached it locally
+    tag_cache.clear()
+    with django_assert_num_queries(0):
+        assert tag_cache.get_tag(team, "v1", TagCategories.EXPERIMENT_VERSION) == tag
+
+
+def test_tags_not_cached_before_commit(team, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=False):
+        tag_cache.get_tag(team, "v1", TagCategories.EXPERIMENT_VERSION)
+    tag_cache.clear()
+    Tag.objects.filter(team=team).delete()
+
+    tag = tag_cache.get_tag(team, "v1", TagCategories.EXPERIMENT_VERSION)
+    assert Tag.objects.filter(id=tag.id).exists()
+
+
+def test_system_and_user_tags_cached_separately(team, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        system_tag = tag_cache.get_tag(team, "good", TagCategories.RESPONSE_RATING)
+        user_tag = tag_cache.get_tag(team, "good", TagCategories.RESPONSE_RATING, is_system_tag=False)
+    assert system_tag != user_tag
+    assert not user_tag.is_system_tag
+
+
+@pytest.mark.parametrize("change", ["rename", "delete"])
+def test_cache_invalidated_when_tag_changes(change, team, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        tag = tag_cache.get_tag(team, "v1", TagCategories.EXPERIMENT_VERSION)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        if change == "rename":
+            tag.name = "v2"
+            tag.save()
+        else:
+            tag.delete()
+
+    new_tag = tag_cache.get_tag(team, "v1", TagCategories.EXPERIMENT_VERSION)
+    assert new_tag.id != tag.id
+    assert new_tag.name == "v1"
+
+
+def test_add_system_tags_to_new_message(session, django_capture_on_commit_callbacks):
+    message = ChatMessage.objects.create(chat=session.chat, message_type=ChatMessageType.AI, content="Hi")
+    tags = [("bot", TagCategories.BOT_RESPONSE), ("v1", TagCategories.EXPERIMENT_VERSION)]
+    with django_capture_on_commit_callbacks(execute=True):
+        tag_cache.get_tags(session.team, tags)
+    ContentType.objects.get_for_model(ChatMessage)
+
+    with CaptureQueriesContext(connection) as queries:
+        message.add_system_tags_to_new_message(tags)
+
+    # no tag lookups, one insert for the tagged items and one for their audit events
+    statements = [query["sql"].split()[0] for query in queries.captured_queries]
+    assert statements.count("SELECT") == 0
+    assert statements.count("INSERT") == 2
+
+    assert CustomTaggedItem.objects.filter(object_id=message.id).count() == 2
+    assert sorted(message.tags.values_list("name", flat=True)) == ["bot", "v1"]
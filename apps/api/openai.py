@@ -1,7 +1,15 @@
+import contextvars
+import json
+import logging
+import queue
 import textwrap
+import threading
 import time
 import uuid
+from collections.abc import Iterator
 
+from django.db import connections
+from django.http import StreamingHttpResponse
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiParameter, extend_schema, inline_serializer
 from rest_framework import serializers
@@ -11,9 +19,13 @@ from rest_framework.response import Response
 
 from apps.api.serializers import ExperimentSessionCreateSerializer, MessageSerializer
 from apps.channels.tasks import handle_api_message
+from apps.service_providers.llm_service.callbacks import stream_output_tokens
+
+logger = logging.getLogger("ocs.api")
 
 create_chat_completion_request = inline_serializer(
-    "CreateChatCompletionRequest", {"messages": MessageSerializer(many=True)}
+    "CreateChatCompletionRequest",
+    {"messages": MessageSerializer(many=True), "stream": serializers.BooleanField(required=False, default=False)},
 )
 
 create_chat_completion_response = inline_serializer(
@@ -77,6 +89,9 @@ def chat_completions_schema(versioned: bool):
 
         The last message must be a 'user' message.
 
+        Set `stream` to `true` to receive the response as a stream of Server-Sent Events in the
+        `chat.completion.chunk` format.
+
         Example (Python):
 
         ```python
@@ -147,14 +162,27 @@ def _chat_completions(request, experiment_id: uuid.UUID, version=None):
 
     session = serializer.save()
     experiment_version = session.experiment.get_version(version) if version is not None else session.experiment_version
-    response_message = handle_api_message(
-        request.user,
-        experiment_version,
-        session.experiment_channel,
-        last_message.get("content"),
-        session.participant.identifier,
-        session,
-    )
+
+    def _get_response_message():
+        return handle_api_message(
+            request.user,
+            experiment_version,
+            session.experiment_channel,
+            last_message.get("content"),
+            session.participant.identifier,
+            session,
+        )
+
+    if request.data.get("stream"):
+        response = StreamingHttpResponse(
+            _stream_chat_completion(session, _get_response_message), content_type="text/event-stream"
+        )
+        # don't let proxies buffer the stream
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    response_message = _get_response_message()
     completion = {
         "id": session.external_id,
         "choices": [
@@ -171,6 +199,66 @@ def _chat_completions(request, experiment_id: uuid.UUID, version=None):
     return Response(data=completion)
 
 
+def _stream_chat_completion(session, get_response_message) -> Iterator[str]:
+    """Yields the response as Server-Sent Events in the OpenAI `chat.completion.chunk` format.
+
+    The bot runs in a separate thread and its output tokens are passed back through a queue as they are
+    generated. Bots that can't stream their output (e.g. pipelines, agents or bots with AI safety layers) send
+    the whole response in a single chunk once it is complete. The bot saves the response to the chat history
+    as usual, even if the client disconnects before the stream ends.
+
+    The stream holds a web server thread until the response is complete. This is no longer than a request without
+    streaming holds it for, since this API generates the response within the request either way.
+    """
+    completion_id = str(session.external_id)
+    created = int(time.time())
+    model = session.experiment.get_llm_provider_model_name(raises=False)
+    events = queue.Queue()
+
+    def _run_bot():
+        try:
+            with stream_output_tokens(lambda token: events.put(("token", token))):
+                events.put(("done", get_response_message()))
+        except Exception as e:
+            logger.exception("Error generating streamed chat completion")
+            events.put(("error", str(e)))
+        finally:
+            connections.close_all()
+
+    def _chunk(delta: dict, finish_reason: str | None = None) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(_run_bot,), daemon=True).start()
+
+    yield _chunk({"role": "assistant", "content": ""})
+    streamed = ""
+    while True:
+        event, value = events.get()
+        if event == "token":
+            streamed += value
+            yield _chunk({"content": value})
+        elif event == "done":
+            # Send whatever wasn't streamed e.g. if the bot doesn't support streaming
+            remaining = value.removeprefix(streamed) if value else ""
+            if remaining:
+                yield _chunk({"content": remaining})
+            yield _chunk({}, finish_reason="stop")
+            break
+        else:
+            error = {"error": {"message": value, "type": "error", "param": None, "code": None}}
+            yield f"data: {json.dumps(error)}\n\n"
+            break
+    yield "data: [DONE]\n\n"
+
+
 def _make_error_response(status_code, message):
     data = {"error": {"message": message, "type": "error", "param": None, "code": None}}
     return Response(data=data, status=status_code)
@@ -7,7 +7,7 @@ from rest_framework.exceptions import NotFound
 from taggit.serializers import TaggitSerializer, TagListSerializerField
 
 from apps.channels.models import ChannelPlatform, ExperimentChannel
-from apps.chat.models import ChatMessage, ChatMessageType
+from apps.chat.models import Chat, ChatMessage, ChatMessageType
 from apps.experiments.models import Experiment, ExperimentSession, Participant
 from apps.files.models import File
 from apps.teams.models import Team
@@ -150,6 +150,7 @@ class ExperimentSessionCreateSerializer(serializers.ModelSerializer):
         instance = super().create(validated_data)
         if messages:
             ChatMessage.objects.bulk_create([ChatMessage(chat=instance.chat, **message) for message in messages])
+            Chat.refresh_last_message_fields(Chat.objects.filter(id=instance.chat_id))
         return instance
 
 
@@ -10,6 +10,7 @@ from pytest_django.fixtures import live_server_helper
 from apps.api.models import UserAPIKey
 from apps.experiments.models import ExperimentSession
 from apps.utils.factories.experiment import ExperimentFactory
+from apps.utils.langchain import mock_llm
 from apps.utils.tests.clients import ApiTestClient
 
 
@@ -117,3 +118,44 @@ def test_unsupported_message_type(experiment):
             "type": "error",
         }
     }
+
+
+@pytest.mark.django_db(
+    available_apps=[
+        "apps.annotations",
+        "apps.api",
+        "apps.chat",
+        "apps.events",
+        "apps.experiments",
+        "apps.service_providers",
+        "apps.teams",
+        "apps.users",
+    ],
+    serialized_rollback=True,
+)
+def test_chat_completion_stream(experiment, api_key, live_server):
+    base_url = f"{live_server.url}/api/openai/{experiment.public_id}"
+    client = OpenAI(api_key=api_key, base_url=base_url)
+
+    with mock_llm(responses=["Hello there"]):
+        response = client.chat.completions.with_raw_response.create(
+            model="gpt-3.5-turbo",
+            messages=[{"role": "user", "content": "Hi"}],
+            stream=True,
+        )
+        chunks = list(response.parse())
+
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert response.headers["X-Accel-Buffering"] == "no"
+
+    session = ExperimentSession.objects.first()
+    assert all(chunk.id == str(session.external_id) for chunk in chunks)
+    assert all(chunk.object == "chat.completion.chunk" for chunk in chunks)
+    deltas = [chunk.choices[0].delta.content for chunk in chunks if chunk.choices[0].delta.content]
+    # the fake LLM streams one character at a time
+    assert deltas == list("Hello there")
+    assert chunks[-1].choices[0].finish_reason == "stop"
+    assert [(m.message_type, m.content) for m in session.chat.messages.all()] == [
+        ("human", "Hi"),
+        ("ai", "Hello there"),
+    ]
@@ -57,10 +57,14 @@ files, as well as those provided by the assistant.
 
 import logging
 import pathlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import wraps
 from io import BytesIO
 
 import openai
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
 from django.db.models import Count, Subquery
 from django.forms import ValidationError
 from langchain_core.utils.function_calling import convert_to_openai_tool as lc_convert_to_openai_tool
@@ -70,13 +74,18 @@ from tenacity import before_sleep_log, retry, retry_if_exception_type, stop_afte
 
 from apps.assistants.models import OpenAiAssistant, ToolResources
 from apps.assistants.utils import chunk_list, get_assistant_tool_options
-from apps.files.models import File
+from apps.files.models import File, RemoteFile
 from apps.service_providers.models import LlmProvider, LlmProviderModel, LlmProviderTypes
 from apps.teams.models import Team
 from apps.utils.prompt import validate_prompt_variables
 
 logger = logging.getLogger("ocs.openai_sync")
 
+# the maximum page size of the OpenAI list endpoints
+LIST_PAGE_SIZE = 100
+# the number of files pulled from OpenAI that are saved in each transaction
+IMPORT_BATCH_SIZE = 50
+
 
 class OpenAiSyncError(Exception):
     pass
@@ -120,6 +129,17 @@ def push_assistant_to_openai(assistant: OpenAiAssistant, internal_tools: list |
         assistant.save()
 
 
+@wrap_openai_errors
+def push_assistant_files_to_openai(assistant: OpenAiAssistant):
+    """Uploads the files of the assistant's tool resources that aren't in OpenAI yet.
+
+    Call this before starting a transaction that pushes the assistant. The uploads are saved as they complete, and
+    that progress would be rolled back with the transaction if a later step failed."""
+    client = assistant.llm_provider.get_llm_service().get_raw_client()
+    for resource in assistant.tool_resources.all():
+        create_files_remote(client, resource.files.all(), assistant.llm_provider)
+
+
 def convert_to_openai_tool(tool):
     """Work around some limitiations of OpenAI function calling"""
     function = lc_convert_to_openai_tool(tool, strict=True)
@@ -143,13 +163,21 @@ def convert_to_openai_tool(tool):
 
 @wrap_openai_errors
 def delete_file_from_openai(client: OpenAI, file: File):
+    """Unlinks the file from its OpenAI file. The OpenAI file is only deleted if no other files use it."""
     if not file.external_id or file.external_source != "openai":
         return False
 
-    try:
-        client.files.delete(file.external_id)
-    except openai.NotFoundError:
-        logger.debug("File %s not found in OpenAI", file.external_id)
+    shared = (
+        File.objects.filter(team_id=file.team_id, external_source="openai", external_id=file.external_id)
+        .exclude(id=file.id)
+        .exists()
+    )
+    if not shared:
+        try:
+            client.files.delete(file.external_id)
+        except openai.NotFoundError:
+            logger.debug("File %s not found in OpenAI", file.external_id)
+        RemoteFile.objects.filter(team_id=file.team_id, external_id=file.external_id).delete()
     file.external_id = ""
     file.external_source = ""
     return True
@@ -217,13 +245,10 @@ def delete_openai_assistant(assistant: OpenAiAssistant):
 
 def delete_openai_files_for_resource(client, team, resource: ToolResources):
     files_to_delete = _get_files_to_delete(team, resource.id)
-    files_to_update = []
     for file in files_to_delete:
         if delete_file_from_openai(client, file):
-            files_to_update.append(file.id)
-
-    if files_to_update:
-        File.objects.filter(id__in=files_to_update).update(external_id="", external_source="")
+            # the files are updated as they are unlinked so that the last file sharing an OpenAI file deletes it
+            File.objects.filter(id=file.id).update(external_id="", external_source="")
 
 
 def _get_files_to_delete(team, tool_resource_id):
@@ -269,11 +294,12 @@ def get_out_of_sync_files(assistant: OpenAiAssistant) -> tuple[dict[str, list[st
     # ensure files match
     for resource in tool_resources:
         openai_file_ids = _get_tool_file_ids_from_openai(client, assistant_data, resource.tool_type)
-        ocs_file_ids = [file.external_id for file in resource.files.all() if file.external_id]
-        if missing := set(openai_file_ids) - set(ocs_file_ids):
-            files_missing_local[resource.tool_type] = list(missing)
-        if extra := set(ocs_file_ids) - set(openai_file_ids):
-            files_missing_remote[resource.tool_type] = list(extra)
+        ocs_file_ids = resource.files.exclude(external_id="").values_list("external_id", flat=True)
+        missing, extra = _diff_file_ids(openai_file_ids, ocs_file_ids)
+        if missing:
+            files_missing_local[resource.tool_type] = missing
+        if extra:
+            files_missing_remote[resource.tool_type] = extra
     return files_missing_local, files_missing_remote
 
 
@@ -303,7 +329,36 @@ def _get_tool_file_ids_from_openai(client, assistant_data, tool_type: str) -> li
         vector_store_ids = assistant_data.tool_resources.file_search.vector_store_ids
         if not vector_store_ids:
             return []
-        return [file.id for file in client.beta.vector_stores.files.list(vector_store_id=vector_store_ids[0])]
+        return _list_vector_store_file_ids(client, vector_store_ids[0])
+
+
+def _list_vector_store_file_ids(client, vector_store_id: str) -> list[str]:
+    file_ids = []
+    kwargs = {}
+    while True:
+        vector_store_files = client.beta.vector_stores.files.list(
+            vector_store_id=vector_store_id, order="asc", limit=LIST_PAGE_SIZE, **kwargs
+        )
+        file_ids.extend(v_file.id for v_file in vector_store_files.data)
+        if not vector_store_files.has_more:
+            return file_ids
+        kwargs["after"] = vector_store_files.last_id
+
+
+def _diff_file_ids(source_ids, target_ids) -> tuple[list[str], list[str]]:
+    """Returns the IDs that are only in `source_ids` and the IDs that are only in `target_ids`"""
+    source_ids = dict.fromkeys(source_ids)
+    target_ids = dict.fromkeys(target_ids)
+    return [id_ for id_ in source_ids if id_ not in target_ids], [id_ for id_ in target_ids if id_ not in source_ids]
+
+
+def _run_in_threads(fn, items: list) -> list:
+    """Calls `fn` for each item using a bounded thread pool and returns the results in order. `fn` must not use the
+    database since the threads don't share the caller's transaction."""
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(settings.OPENAI_SYNC_MAX_WORKERS, len(items))) as executor:
+        return list(executor.map(fn, items))
 
 
 @wrap_openai_errors
@@ -334,21 +389,18 @@ def get_diff_with_openai_assistant(assistant: OpenAiAssistant) -> list[str]:
     return diffs
 
 
-def _fetch_file_from_openai(assistant: OpenAiAssistant, file_id: str) -> File:
-    client = assistant.llm_provider.get_llm_service().get_raw_client()
+def _get_openai_filename(client, file_id: str) -> str:
     openai_file = client.files.retrieve(file_id)
     filename = openai_file.filename
     try:
         filename = pathlib.Path(openai_file.filename).name
     except Exception:
         pass
-
-    # Can't retrieve content from openai assistant files
-    # content = client.files.retrieve_content(openai_file.id)
-    return File.from_external_source(filename, None, file_id, "openai", assistant.team_id)
+    return filename
 
 
 def _sync_tool_resources_from_openai(openai_assistant: Assistant, assistant: OpenAiAssistant):
+    client = assistant.llm_provider.get_llm_service().get_raw_client()
     tools = {tool.type for tool in openai_assistant.tools}
     if "code_interpreter" in tools:
         ocs_code_interpreter, _ = ToolResources.objects.get_or_create(assistant=assistant, tool_type="code_interpreter")
@@ -357,7 +409,7 @@ def _sync_tool_resources_from_openai(openai_assistant: Assistant, assistant: Ope
         except AttributeError:
             pass
         else:
-            _sync_tool_resource_files_from_openai(code_file_ids, ocs_code_interpreter)
+            _sync_tool_resource_files_from_openai(client, code_file_ids, ocs_code_interpreter)
 
     if "file_search" in tools:
         ocs_file_search, _ = ToolResources.objects.get_or_create(assistant=assistant, tool_type="file_search")
@@ -374,52 +426,41 @@ def _sync_tool_resources_from_openai(openai_assistant: Assistant, assistant: Ope
             if ocs_file_search.extra.get("vector_store_id") != vector_store_id:
                 ocs_file_search.extra["vector_store_id"] = vector_store_id
                 ocs_file_search.save()
-            client = assistant.llm_provider.get_llm_service().get_raw_client()
-            file_ids = (
-                file.id
-                for file in client.beta.vector_stores.files.list(
-                    vector_store_id=vector_store_id  # there can only be one
-                )
+            file_ids = _list_vector_store_file_ids(client, vector_store_id)  # there can only be one
+            _sync_tool_resource_files_from_openai(client, file_ids, ocs_file_search)
+
+
+def _sync_tool_resource_files_from_openai(client, file_ids, ocs_resource):
+    """Adds the OpenAI files that are missing locally to the resource and deletes the local files that are no longer
+    in OpenAI. The new files are saved in batches so that a sync that fails part way through continues from the last
+    saved batch when it is retried."""
+    resource_files = {file.id: file.external_id for file in ocs_resource.files.all()}
+    missing_ids, unused_ids = _diff_file_ids(file_ids, resource_files.values())
+    for chunk in chunk_list(missing_ids, IMPORT_BATCH_SIZE):
+        filenames = _run_in_threads(lambda file_id: _get_openai_filename(client, file_id), chunk)
+        with transaction.atomic():
+            ocs_resource.files.add(
+                *[
+                    File.from_external_source(filename, None, file_id, "openai", ocs_resource.assistant.team_id)
+                    for file_id, filename in zip(chunk, filenames, strict=True)
+                ]
             )
-            _sync_tool_resource_files_from_openai(file_ids, ocs_file_search)
+        logger.debug("Added %d of %d files from OpenAI to %s", len(chunk), len(missing_ids), ocs_resource)
 
-
-def _sync_tool_resource_files_from_openai(file_ids, ocs_resource):
-    resource_files = ocs_resource.files.all()
-    unused_files = {file.id for file in resource_files}
-    existing_files = {file.external_id: file for file in resource_files if file.external_id}
-    for file_id in file_ids:
-        try:
-            file = existing_files.pop(file_id)
-            unused_files.remove(file.id)
-        except KeyError:
-            ocs_resource.files.add(_fetch_file_from_openai(ocs_resource.assistant, file_id))
-    if unused_files:
+    # files with the same content share the OpenAI file
+    unused_ids = set(unused_ids) | {""}
+    if unused_files := [file_id for file_id, external_id in resource_files.items() if external_id in unused_ids]:
         File.objects.filter(id__in=unused_files).delete()
 
 
 def _sync_vector_store_files_to_openai(client, vector_store_id, files_ids: list[str]):
-    kwargs = {}
-    to_delete_remote = []
+    remote_file_ids = _list_vector_store_file_ids(client, vector_store_id)
+    files_ids, to_delete_remote = _diff_file_ids(files_ids, remote_file_ids)
 
-    while True:
-        vector_store_files = client.beta.vector_stores.files.list(
-            order="asc",
-            vector_store_id=vector_store_id,
-            **kwargs,
-        )
-        for v_file in vector_store_files.data:
-            try:
-                files_ids.remove(v_file.id)
-            except ValueError:
-                to_delete_remote.append(v_file.id)
-
-        if not vector_store_files.has_more:
-            break
-        kwargs["after"] = vector_store_files.last_id
-
-    for file_id in to_delete_remote:
-        client.beta.vector_stores.files.delete(vector_store_id=vector_store_id, file_id=file_id)
+    _run_in_threads(
+        lambda file_id: client.beta.vector_stores.files.delete(vector_store_id=vector_store_id, file_id=file_id),
+        to_delete_remote,
+    )
 
     if files_ids:
         for chunk in chunk_list(files_ids, 500):
@@ -446,11 +487,11 @@ def _sync_tool_resources(assistant):
     resources = {resource.tool_type: resource for resource in assistant.tool_resources.all()}
     client = assistant.llm_provider.get_llm_service().get_raw_client()
     if code_interpreter := resources.get("code_interpreter"):
-        file_ids = create_files_remote(client, code_interpreter.files.all())
+        file_ids = create_files_remote(client, code_interpreter.files.all(), assistant.llm_provider)
         resource_data["code_interpreter"] = {"file_ids": file_ids}
 
     if file_search := resources.get("file_search"):
-        file_ids = create_files_remote(client, file_search.files.all())
+        file_ids = create_files_remote(client, file_search.files.all(), assistant.llm_provider)
         store_id = file_search.extra.get("vector_store_id")
         updated_store_id = _update_or_create_vector_store(
             assistant, f"{assistant.name} - File Search", store_id, file_ids
@@ -513,22 +554,102 @@ def _openai_assistant_to_ocs_kwargs(assistant: Assistant, team=None, llm_provide
     return kwargs
 
 
-def create_files_remote(client, files):
-    file_ids = []
+def create_files_remote(client, files, llm_provider: LlmProvider) -> list[str]:
+    """Uploads the files that aren't in OpenAI yet and returns the OpenAI file IDs. Files with the same content as
+    a file that was already uploaded for `llm_provider` use the existing OpenAI file."""
+    files = list(files)
+    if pending := [file for file in files if not file.external_id]:
+        _push_files_to_openai(client, pending, llm_provider)
+    return list(dict.fromkeys(file.external_id for file in files))
+
+
+def _push_files_to_openai(client, files: list[File], llm_provider: LlmProvider):
+    """Uploads the files using a bounded thread pool. Each file is saved as soon as its upload completes so that
+    a retry doesn't upload it again, unless the caller's transaction is rolled back. See
+    `push_assistant_files_to_openai`."""
+    if unhashed := [file for file in files if not file.content_hash]:
+        # files saved before content hashes were recorded
+        hashes = _run_in_threads(lambda file: File.get_content_hash(ContentFile(_read_file(file))), unhashed)
+        for file, content_hash in zip(unhashed, hashes, strict=True):
+            file.content_hash = content_hash
+
+    remote_ids = _get_remote_file_ids(client, llm_provider, {file.content_hash for file in files})
+    files_by_hash = {}
     for file in files:
-        if not file.external_id:
-            _push_file_to_openai(client, file)
-        file_ids.append(file.external_id)
-    return file_ids
+        files_by_hash.setdefault(file.content_hash, []).append(file)
+        if file.content_hash in remote_ids:
+            logger.debug("Using existing OpenAI file %s for %s", remote_ids[file.content_hash], file.name)
+
+    to_upload = [hash_files[0] for content_hash, hash_files in files_by_hash.items() if content_hash not in remote_ids]
+    for content_hash, external_id in remote_ids.items():
+        _set_openai_file_id(files_by_hash[content_hash], external_id)
+
+    if not to_upload:
+        return
+
+    max_workers = min(settings.OPENAI_SYNC_MAX_WORKERS, len(to_upload))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                lambda file: _openai_create_file_with_retries(client, file.name, BytesIO(_read_file(file))), file
+            ): file
+            for file in to_upload
+        }
+        error = None
+        for future in as_completed(futures):
+            content_hash = futures[future].content_hash
+            try:
+                openai_file = future.result()
+            except Exception as e:
+                # keep saving the files that were uploaded
+                error = error or e
+                continue
+            remote_file, created = RemoteFile.objects.get_or_create(
+                llm_provider=llm_provider,
+                content_hash=content_hash,
+                defaults={"team_id": llm_provider.team_id, "external_id": openai_file.id},
+            )
+            if not created:
+                # the same content was uploaded concurrently
+                client.files.delete(openai_file.id)
+            _set_openai_file_id(files_by_hash[content_hash], remote_file.external_id)
+    if error:
+        raise error
+
+
+def _get_remote_file_ids(client, llm_provider: LlmProvider, content_hashes: set[str]) -> dict[str, str]:
+    """Returns the IDs of the files already uploaded with the provider by content hash. Files that no longer exist in
+    OpenAI are forgotten so that their content is uploaded again."""
+    remote_files = list(RemoteFile.objects.filter(llm_provider=llm_provider, content_hash__in=content_hashes))
+    exists = _run_in_threads(lambda remote_file: _openai_file_exists(client, remote_file.external_id), remote_files)
+    if stale := [remote_file for remote_file, found in zip(remote_files, exists, strict=True) if not found]:
+        logger.info("Uploading %d files again that were not found in OpenAI", len(stale))
+        RemoteFile.objects.filter(id__in=[remote_file.id for remote_file in stale]).delete()
+    return {
+        remote_file.content_hash: remote_file.external_id
+        for remote_file, found in zip(remote_files, exists, strict=True)
+        if found
+    }
 
 
-def _push_file_to_openai(client, file: File):
+def _openai_file_exists(client, file_id: str) -> bool:
+    try:
+        client.files.retrieve(file_id)
+    except openai.NotFoundError:
+        return False
+    return True
+
+
+def _read_file(file: File) -> bytes:
     with file.file.open("rb") as fh:
-        bytesio = BytesIO(fh.read())
-    openai_file = _openai_create_file_with_retries(client, file.name, bytesio)
-    file.external_id = openai_file.id
-    file.external_source = "openai"
-    file.save()
+        return fh.read()
+
+
+def _set_openai_file_id(files: list[File], external_id: str):
+    for file in files:
+        file.external_id = external_id
+        file.external_source = "openai"
+    File.objects.bulk_update(files, ["external_id", "external_source", "content_hash"])
 
 
 @retry(
@@ -3,13 +3,20 @@ import re
 from io import BytesIO
 from unittest.mock import call, patch
 
+import factory
+import httpx
+import openai
 import pytest
 from openai.pagination import SyncCursorPage
 
 from apps.assistants.models import ToolResources
 from apps.assistants.sync import (
     OpenAiSyncError,
+    _sync_tool_resource_files_from_openai,
+    _sync_vector_store_files_to_openai,
     _update_or_create_vector_store,
+    create_files_remote,
+    delete_file_from_openai,
     delete_openai_assistant,
     get_out_of_sync_files,
     import_openai_assistant,
@@ -17,6 +24,7 @@ from apps.assistants.sync import (
     sync_from_openai,
 )
 from apps.chat.agent import tools
+from apps.files.models import File, RemoteFile
 from apps.utils.factories.assistants import OpenAiAssistantFactory
 from apps.utils.factories.files import FileFactory
 from apps.utils.factories.openai import AssistantFactory, FileObjectFactory
@@ -28,6 +36,10 @@ class ObjectWithId:
     id: str
 
 
+def _files_page(files, has_more=False):
+    return SyncCursorPage(data=files, object="list", first_id=None, last_id=None, has_more=has_more)
+
+
 @pytest.mark.django_db()
 @patch("openai.resources.beta.vector_stores.VectorStores.create", return_value=ObjectWithId(id="vs_123"))
 @patch("openai.resources.beta.Assistants.create", return_value=AssistantFactory.build(id="test_id"))
@@ -134,7 +146,9 @@ def test_sync_from_openai(mock_file_retrieve, _, mock_retrieve, mock_vector_stor
     mock_file_retrieve.side_effect = openai_files
 
     # mock the vector store file call
-    mock_vector_store_files.return_value = [FileObjectFactory(id=file.id) for file in file_search_files_expected]
+    mock_vector_store_files.return_value = _files_page(
+        [FileObjectFactory(id=file.id) for file in file_search_files_expected]
+    )
 
     # setup local assistant
     files = FileFactory.create_batch(2)
@@ -190,7 +204,9 @@ def test_import_openai_assistant(_, mock_file_retrieve, mock_vector_store_files,
     mock_retrieve.return_value = remote_assistant
 
     # mock the vector store file call
-    mock_vector_store_files.return_value = [FileObjectFactory(id=file.id) for file in file_search_files_expected]
+    mock_vector_store_files.return_value = _files_page(
+        [FileObjectFactory(id=file.id) for file in file_search_files_expected]
+    )
 
     # this will return one file from the list on each call to the mock
     mock_file_retrieve.side_effect = openai_files
@@ -208,16 +224,16 @@ def test_import_openai_assistant(_, mock_file_retrieve, mock_vector_store_files,
     assert imported_assistant.builtin_tools == ["code_interpreter", "file_search"]
     assert imported_assistant.tool_resources.count() == 2
     code_files = imported_assistant.tool_resources.filter(tool_type="code_interpreter").first().files.all()
-    assert [(f.external_source, f.external_id) for f in code_files] == [
+    assert sorted((f.external_source, f.external_id) for f in code_files) == sorted(
         ("openai", file.id) for file in code_files_expected
-    ]
+    )
     file_search_resource = imported_assistant.tool_resources.filter(tool_type="file_search").first()
     assert file_search_resource.extra["vector_store_id"] == vector_store_id
 
     file_search_files = file_search_resource.files.all()
-    assert [(f.external_source, f.external_id) for f in file_search_files] == [
+    assert sorted((f.external_source, f.external_id) for f in file_search_files) == sorted(
         ("openai", file.id) for file in file_search_files_expected
-    ]
+    )
 
 
 @pytest.mark.django_db()
@@ -237,7 +253,9 @@ def test_import_openai_assistant_raises_for_invalid_instructions(mock_retrieve):
 @patch("openai.resources.beta.vector_stores.VectorStores.delete")
 @patch("openai.resources.Files.delete")
 def test_delete_openai_assistant(mock_file_delete, mock_vector_store_delete, mock_delete):
-    files = FileFactory.create_batch(3, external_id="test_id", external_source="openai")
+    files = FileFactory.create_batch(
+        3, external_id=factory.Sequence(lambda n: f"test_id_{n}"), external_source="openai"
+    )
     local_assistant = OpenAiAssistantFactory(assistant_id="123")
 
     code_resource = ToolResources.objects.create(tool_type="code_interpreter", assistant=local_assistant)
@@ -293,7 +311,7 @@ def test_code_interpreter_are_files_in_sync_with_openai(mock_retrieve):
 def test_file_search_are_files_in_sync_with_openai(mock_retrieve, file_list):
     tool_type = "file_search"
     openai_files = FileObjectFactory.create_batch(2)
-    file_list.return_value = [FileObjectFactory(id=file.id) for file in openai_files]
+    file_list.return_value = _files_page([FileObjectFactory(id=file.id) for file in openai_files])
 
     remote_assistant = AssistantFactory()
     vector_store_id = "vs_123"
@@ -343,3 +361,180 @@ def test_vector_store_create_batch_files(create_file_batch, create_vector_store,
         assert len(create_file_batch.call_args_list[1][1]["file_ids"]) == 180
     else:
         assert create_file_batch.call_count == 0
+
+
+@pytest.mark.django_db()
+@patch("openai.resources.Files.retrieve")
+@patch("openai.resources.Files.create", side_effect=FileObjectFactory.create_batch(2))
+def test_create_files_remote_uploads_content_once(mock_file_create, mock_file_retrieve):
+    llm_provider = LlmProviderFactory()
+    files = FileFactory.create_batch(2, team=llm_provider.team, file__data=b"same content")
+    other_file = FileFactory(team=llm_provider.team, file__data=b"other content")
+    client = llm_provider.get_llm_service().get_raw_client()
+
+    file_ids = create_files_remote(client, [*files, other_file], llm_provider)
+
+    assert mock_file_create.call_count == 2
+    assert files[0].content_hash == files[1].content_hash != other_file.content_hash
+    assert files[0].external_id == files[1].external_id
+    assert file_ids == [files[0].external_id, other_file.external_id]
+
+    # files with the same content in later versions or sessions aren't uploaded again
+    new_file = FileFactory(team=llm_provider.team, file__data=b"same content")
+    assert create_files_remote(client, [new_file], llm_provider) == [files[0].external_id]
+    assert mock_file_create.call_count == 2
+    mock_file_retrieve.assert_called_once_with(files[0].external_id)
+
+
+@pytest.mark.django_db()
+@patch("openai.resources.Files.retrieve")
+@patch("openai.resources.Files.create")
+def test_create_files_remote_uploads_again_when_not_found(mock_file_create, mock_file_retrieve):
+    llm_provider = LlmProviderFactory()
+    file = FileFactory(team=llm_provider.team)
+    RemoteFile.objects.create(
+        team=llm_provider.team, llm_provider=llm_provider, content_hash=file.content_hash, external_id="file_deleted"
+    )
+    mock_file_retrieve.side_effect = openai.NotFoundError(
+        "No such File object", response=httpx.Response(404, request=httpx.Request("GET", "https://api")), body=None
+    )
+    mock_file_create.return_value = FileObjectFactory.build(id="file_new")
+    client = llm_provider.get_llm_service().get_raw_client()
+
+    assert create_files_remote(client, [file], llm_provider) == ["file_new"]
+    mock_file_retrieve.assert_called_once_with("file_deleted")
+    assert list(RemoteFile.objects.filter(llm_provider=llm_provider).values_list("external_id", flat=True)) == [
+        "file_new"
+    ]
+
+
+@pytest.mark.django_db()
+def test_remote_files_cleared_when_provider_credentials_change():
+    llm_provider = LlmProviderFactory()
+    RemoteFile.objects.create(
+        team=llm_provider.team, llm_provider=llm_provider, content_hash="abc", external_id="file_123"
+    )
+
+    llm_provider.name = "renamed"
+    llm_provider.save()
+    assert llm_provider.remote_files.exists()
+
+    llm_provider.config = {**llm_provider.config, "openai_api_key": "new key"}
+    llm_provider.save()
+    assert not llm_provider.remote_files.exists()
+
+
+@pytest.mark.django_db()
+@patch("openai.resources.Files.create", side_effect=FileObjectFactory.create_batch(2))
+def test_create_files_remote_uploads_per_provider(mock_file_create):
+    llm_provider = LlmProviderFactory()
+    other_provider = LlmProviderFactory(team=llm_provider.team)
+    files = FileFactory.create_batch(2, team=llm_provider.team, file__data=b"same content")
+    client = llm_provider.get_llm_service().get_raw_client()
+
+    create_files_remote(client, files[:1], llm_provider)
+    create_files_remote(client, files[1:], other_provider)
+
+    assert mock_file_create.call_count == 2
+    assert files[0].external_id != files[1].external_id
+
+
+@pytest.mark.django_db()
+@patch("openai.resources.Files.delete")
+def test_delete_file_from_openai_keeps_shared_file(mock_file_delete):
+    llm_provider = LlmProviderFactory()
+    files = FileFactory.create_batch(
+        2, team=llm_provider.team, external_id="file_123", external_source="openai", file__data=b"same content"
+    )
+    RemoteFile.objects.create(
+        team=llm_provider.team, llm_provider=llm_provider, content_hash=files[0].content_hash, external_id="file_123"
+    )
+    client = llm_provider.get_llm_service().get_raw_client()
+
+    assert delete_file_from_openai(client, files[0])
+    files[0].save()
+    assert not mock_file_delete.called
+    assert RemoteFile.objects.filter(external_id="file_123").exists()
+
+    assert delete_file_from_openai(client, files[1])
+    mock_file_delete.assert_called_once_with("file_123")
+    assert not RemoteFile.objects.filter(external_id="file_123").exists()
+
+
+@patch("openai.resources.beta.vector_stores.files.Files.delete")
+@patch("openai.resources.beta.vector_stores.file_batches.FileBatches.create")
+@patch("openai.resources.beta.vector_stores.files.Files.list")
+def test_sync_vector_store_files_lists_pages(files_list, create_file_batch, delete_file):
+    files_list.side_effect = [
+        SyncCursorPage(
+            data=FileObjectFactory.build_batch(2), object="list", first_id="a", last_id="file_2", has_more=True
+        ),
+        _files_page([FileObjectFactory.build(id="file_3")]),
+    ]
+    client = LlmProviderFactory.build().get_llm_service().get_raw_client()
+
+    _sync_vector_store_files_to_openai(client, "vs_123", ["file_3", "file_4"])
+
+    assert files_list.call_args_list == [
+        call(vector_store_id="vs_123", order="asc", limit=100),
+        call(vector_store_id="vs_123", order="asc", limit=100, after="file_2"),
+    ]
+    assert delete_file.call_count == 2
+    create_file_batch.assert_called_once_with(vector_store_id="vs_123", file_ids=["file_4"])
+
+
+@pytest.mark.django_db()
+@patch("apps.assistants.sync.IMPORT_BATCH_SIZE", 2)
+@patch("openai.resources.Files.retrieve")
+def test_sync_tool_resource_files_from_openai_resumes(mock_file_retrieve):
+    local_assistant = OpenAiAssistantFactory()
+    resource = ToolResources.objects.create(tool_type="file_search", assistant=local_assistant)
+    resource.files.set([FileFactory(team=local_assistant.team, external_id="old_file")])
+    client = local_assistant.llm_provider.get_llm_service().get_raw_client()
+    file_ids = [f"file_{i}" for i in range(5)]
+
+    def _retrieve(file_id):
+        if file_id == "file_3":
+            raise Exception("Rate limited")
+        return FileObjectFactory.build(id=file_id, filename=f"{file_id}.txt")
+
+    mock_file_retrieve.side_effect = _retrieve
+    with pytest.raises(Exception, match="Rate limited"):
+        _sync_tool_resource_files_from_openai(client, file_ids, resource)
+
+    # the first batch was saved
+    assert set(resource.files.values_list("external_id", flat=True)) == {"old_file", "file_0", "file_1"}
+
+    mock_file_retrieve.reset_mock()
+    mock_file_retrieve.side_effect = lambda file_id: FileObjectFactory.build(id=file_id, filename=f"{file_id}.txt")
+    _sync_tool_resource_files_from_openai(client, file_ids, resource)
+
+    assert sorted(c.args[0] for c in mock_file_retrieve.call_args_list) == ["file_2", "file_3", "file_4"]
+    assert sorted(resource.files.values_list("external_id", flat=True)) == file_ids
+    assert not File.objects.filter(external_id="old_file").exists()
+
+
+@pytest.mark.django_db()
+@patch("openai.resources.Files.create")
+def test_create_files_remote_saves_uploaded_files_on_error(mock_file_create):
+    llm_provider = LlmProviderFactory()
+    files = FileFactory.create_batch(3, team=llm_provider.team)
+    client = llm_provider.get_llm_service().get_raw_client()
+
+    def _create(file, purpose):
+        if file[0] == files[1].name:
+            raise Exception("Upload failed")
+        return FileObjectFactory.build()
+
+    mock_file_create.side_effect = _create
+    with pytest.raises(Exception, match="Upload failed"):
+        create_files_remote(client, files, llm_provider)
+
+    uploaded = {file.id for file in File.objects.filter(id__in=[file.id for file in files]).exclude(external_id="")}
+    assert uploaded == {files[0].id, files[2].id}
+
+    mock_file_create.reset_mock()
+    mock_file_create.side_effect = lambda file, purpose: FileObjectFactory.build()
+    file_ids = create_files_remote(client, File.objects.filter(id__in=[file.id for file in files]), llm_provider)
+    assert mock_file_create.call_count == 1
+    assert len(file_ids) == 3
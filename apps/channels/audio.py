@@ -1,6 +1,8 @@
+import subprocess
 from io import BytesIO
 
 from pydub import AudioSegment
+from pydub.utils import get_encoder_name
 
 
 def convert_audio(audio: BytesIO, target_format: str, source_format="ogg", codec=None) -> BytesIO:
@@ -17,3 +19,16 @@ def convert_audio(audio: BytesIO, target_format: str, source_format="ogg", codec
     new_audio.seek(0)
     new_audio.name = f"some_name.{target_format}"
     return new_audio
+
+
+def transcode_audio(audio: bytes, target_format: str, source_format: str, codec=None) -> bytes:
+    """Converts the audio to mono audio in `target_format` with a single ffmpeg process. Unlike `convert_audio`,
+    the audio is streamed through ffmpeg instead of being decoded in memory first."""
+    command = [get_encoder_name(), "-v", "error", "-f", source_format, "-i", "pipe:0", "-ac", "1"]
+    if codec:
+        command.extend(["-acodec", codec])
+    command.extend(["-f", target_format, "pipe:1"])
+    result = subprocess.run(command, input=audio, capture_output=True, check=False)
+    if result.returncode != 0:
+        raise ValueError(f"Unable to convert audio from {source_format} to {target_format}: {result.stderr.decode()}")
+    return result.stdout
@@ -0,0 +1,124 @@
+"""Coalescing of inbound channel messages.
+
+Participants often send several short messages in quick succession. Instead of running a conversation turn for each
+message, messages from webhooks are buffered per channel and participant and handled together once no new message
+has arrived for `CHANNEL_MESSAGE_DEBOUNCE_SECONDS`.
+
+Turns for a channel and participant are serialized with a Redis lock. A channel only has one active session per
+participant, so this is effectively a per-session lock.
+"""
+
+import logging
+import pickle
+from contextlib import contextmanager
+from uuid import uuid4
+
+from django_redis import get_redis_connection
+from redis.exceptions import LockError
+
+from apps.channels.datamodels import BaseMessage
+from apps.channels.models import ExperimentChannel
+from apps.chat.channels import MESSAGE_TYPES, USER_CONSENT_TEXT
+
+logger = logging.getLogger("ocs.channels")
+
+# How long buffered messages are kept if they are never handled
+BUFFER_TIMEOUT = 60 * 60
+# The maximum duration of a turn. The lock is released after this even if the turn is still running.
+TURN_LOCK_TIMEOUT = 60 * 10
+# How long a message waits for the previous turn to finish when debouncing is disabled before it is buffered instead
+TURN_LOCK_WAIT_TIMEOUT = 10
+
+
+def _get_buffer_key(experiment_channel_id: int, participant_id: str) -> str:
+    return f"channel_message_buffer:{experiment_channel_id}:{participant_id}"
+
+
+def _get_token_key(experiment_channel_id: int, participant_id: str) -> str:
+    return f"channel_message_buffer_token:{experiment_channel_id}:{participant_id}"
+
+
+def _get_lock_key(experiment_channel_id: int, participant_id: str) -> str:
+    return f"channel_turn_lock:{experiment_channel_id}:{participant_id}"
+
+
+def buffer_message(experiment_channel_id: int, message: BaseMessage) -> str:
+    """Adds the message to the participant's buffer and returns a token identifying it as the latest message"""
+    token = uuid4().hex
+    buffer_key = _get_buffer_key(experiment_channel_id, message.participant_id)
+    token_key = _get_token_key(experiment_channel_id, message.participant_id)
+    with get_redis_connection("default").pipeline() as pipe:
+        pipe.rpush(buffer_key, pickle.dumps(message))
+        pipe.expire(buffer_key, BUFFER_TIMEOUT)
+        pipe.set(token_key, token, ex=BUFFER_TIMEOUT)
+        pipe.execute()
+    return token
+
+
+def is_latest_message(experiment_channel_id: int, participant_id: str, token: str) -> bool:
+    """Returns `False` if another message was buffered after the message identified by `token`"""
+    latest_token = get_redis_connection("default").get(_get_token_key(experiment_channel_id, participant_id))
+    return latest_token is None or latest_token.decode() == token
+
+
+def pop_messages(experiment_channel_id: int, participant_id: str) -> list[BaseMessage]:
+    """Removes and returns all the buffered messages for the participant, oldest first"""
+    buffer_key = _get_buffer_key(experiment_channel_id, participant_id)
+    with get_redis_connection("default").pipeline() as pipe:
+        pipe.lrange(buffer_key, 0, -1)
+        pipe.delete(buffer_key)
+        data, _ = pipe.execute()
+    return [pickle.loads(item) for item in data]
+
+
+def merge_messages(messages: list[BaseMessage], merge_text: bool = True) -> list[BaseMessage]:
+    """Merges consecutive text messages into a single message. Messages with other content types or with attachments
+    are kept as separate messages, in order.
+
+    Control messages, such as the reset command or the consent response, only take effect when they are the whole
+    message so they are never merged. Set `merge_text` to `False` to keep every message separate, e.g. while the
+    session is still being set up and each message may be a response to a pre-conversation step.
+    """
+    if not merge_text:
+        return list(messages)
+
+    merged = []
+    for message in messages:
+        previous = merged[-1] if merged else None
+        if previous and _can_merge(previous) and _can_merge(message):
+            message = message.model_copy(update={"message_text": f"{previous.message_text}\n\n{message.message_text}"})
+            merged[-1] = message
+        else:
+            merged.append(message)
+    return merged
+
+
+def _can_merge(message: BaseMessage) -> bool:
+    return message.content_type == MESSAGE_TYPES.TEXT and not message.attachments and not _is_control_message(message)
+
+
+def _is_control_message(message: BaseMessage) -> bool:
+    text = message.message_text.strip()
+    return text.lower() == ExperimentChannel.RESET_COMMAND or text == USER_CONSENT_TEXT
+
+
+@contextmanager
+def turn_lock(experiment_channel_id: int, participant_id: str, blocking=True, blocking_timeout: float | None = None):
+    """Acquires the turn lock for the participant. Yields whether the lock was acquired, which is always `True` when
+    `blocking` is set without a `blocking_timeout`."""
+    lock = get_redis_connection("default").lock(
+        _get_lock_key(experiment_channel_id, participant_id), timeout=TURN_LOCK_TIMEOUT
+    )
+    acquired = lock.acquire(blocking=blocking, blocking_timeout=blocking_timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except LockError:
+                logger.warning(
+                    "Turn lock for participant %s on channel %s expired before the turn completed",
+                    participant_id,
+                    experiment_channel_id,
+                )
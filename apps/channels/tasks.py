@@ -3,22 +3,18 @@ import logging
 import uuid
 
 from celery.app import shared_task
+from django.conf import settings
 from taskbadger.celery import Task as TaskbadgerTask
 from telebot import types
 from twilio.request_validator import RequestValidator
 
+from apps.channels import message_buffer
 from apps.channels.clients.connect_client import CommCareConnectClient, Message
 from apps.channels.datamodels import BaseMessage, SureAdhereMessage, TelegramMessage, TurnWhatsappMessage, TwilioMessage
 from apps.channels.models import ChannelPlatform, ExperimentChannel
-from apps.chat.channels import (
-    ApiChannel,
-    CommCareConnectChannel,
-    FacebookMessengerChannel,
-    SureAdhereChannel,
-    TelegramChannel,
-    WhatsappChannel,
-)
-from apps.experiments.models import ParticipantData
+from apps.chat.channels import ApiChannel, ChannelBase
+from apps.chat.tasks import STATUSES_FOR_COMPLETE_CHATS
+from apps.experiments.models import ExperimentSession, ParticipantData, SessionStatus
 from apps.service_providers.models import MessagingProviderType
 from apps.teams.utils import current_team
 from apps.utils.taskbadger import update_taskbadger_data
@@ -42,11 +38,7 @@ def handle_telegram_message(self, message_data: str, channel_external_id: uuid):
         return
 
     message = TelegramMessage.parse(update)
-    message_handler = TelegramChannel(experiment_channel.experiment.default_version, experiment_channel)
-    update_taskbadger_data(self, message_handler, message)
-
-    with current_team(experiment_channel.team):
-        message_handler.new_user_message(message)
+    handle_channel_message(self, experiment_channel, message)
 
 
 @shared_task(bind=True, base=TaskbadgerTask, ignore_result=True)
@@ -55,14 +47,11 @@ def handle_twilio_message(self, message_data: str, request_uri: str, signature:
     message = TwilioMessage.parse(raw_data)
 
     channel_id_key = ""
-    ChannelClass = None
     match message.platform:
         case ChannelPlatform.WHATSAPP:
             channel_id_key = "number"
-            ChannelClass = WhatsappChannel
         case ChannelPlatform.FACEBOOK:
             channel_id_key = "page_id"
-            ChannelClass = FacebookMessengerChannel
 
     experiment_channel = (
         ExperimentChannel.objects.filter(
@@ -76,12 +65,7 @@ def handle_twilio_message(self, message_data: str, request_uri: str, signature:
         return
 
     validate_twillio_request(experiment_channel, raw_data, request_uri, signature)
-
-    message_handler = ChannelClass(experiment_channel.experiment.default_version, experiment_channel=experiment_channel)
-    update_taskbadger_data(self, message_handler, message)
-
-    with current_team(experiment_channel.team):
-        message_handler.new_user_message(message)
+    handle_channel_message(self, experiment_channel, message)
 
 
 def validate_twillio_request(experiment_channel, raw_data, request_uri, signature):
@@ -115,10 +99,7 @@ def handle_sureadhere_message(self, sureadhere_tenant_id: str, message_data: dic
     if not experiment_channel:
         log.info(f"No experiment channel found for SureAdhere tenant ID: {sureadhere_tenant_id}")
         return
-    channel = SureAdhereChannel(experiment_channel.experiment.default_version, experiment_channel)
-    update_taskbadger_data(self, channel, message)
-    with current_team(experiment_channel.team):
-        channel.new_user_message(message)
+    handle_channel_message(self, experiment_channel, message)
 
 
 @shared_task(bind=True, base=TaskbadgerTask, ignore_result=True)
@@ -136,11 +117,7 @@ def handle_turn_message(self, experiment_id: uuid, message_data: dict):
     if not experiment_channel:
         log.info(f"No experiment channel found for experiment_id: {experiment_id}")
         return
-    channel = WhatsappChannel(experiment_channel.experiment.default_version, experiment_channel)
-    update_taskbadger_data(self, channel, message)
-
-    with current_team(experiment_channel.team):
-        channel.new_user_message(message)
+    handle_channel_message(self, experiment_channel, message)
 
 
 def handle_api_message(
@@ -162,7 +139,7 @@ def handle_commcare_connect_message(
     self, experiment_channel_id: int, participant_data_id: int, messages: list[Message]
 ):
     participant_data = ParticipantData.objects.prefetch_related("participant").get(id=participant_data_id)
-    experiment_channel = ExperimentChannel.objects.prefetch_related("experiment").get(id=experiment_channel_id)
+    experiment_channel = ExperimentChannel.objects.select_related("experiment", "team").get(id=experiment_channel_id)
 
     # Ensure the messages are in the correct order according to timestamp
     messages.sort(key=lambda x: x["timestamp"])
@@ -174,10 +151,91 @@ def handle_commcare_connect_message(
     user_message = "\n\n".join(decrypted_messages)
 
     message = BaseMessage(participant_id=participant_data.participant.identifier, message_text=user_message)
-    channel = CommCareConnectChannel(
-        experiment=experiment_channel.experiment.default_version, experiment_channel=experiment_channel
+    handle_channel_message(self, experiment_channel, message)
+
+
+def handle_channel_message(task, experiment_channel: ExperimentChannel, message: BaseMessage):
+    """Handles a message received through a channel webhook. Unless debouncing is disabled, the message is
+    buffered and handled together with any other messages the participant sends within the debounce window.
+    """
+    debounce_seconds = settings.CHANNEL_MESSAGE_DEBOUNCE_SECONDS
+    if debounce_seconds <= 0:
+        with message_buffer.turn_lock(
+            experiment_channel.id, message.participant_id, blocking_timeout=message_buffer.TURN_LOCK_WAIT_TIMEOUT
+        ) as acquired:
+            if acquired:
+                _new_user_message(task, experiment_channel, message)
+                return
+        # A turn is still running for this participant. Buffer the message so that it is handled once the turn is
+        # done rather than holding up a worker.
+        debounce_seconds = 1
+
+    token = message_buffer.buffer_message(experiment_channel.id, message)
+    handle_buffered_messages.apply_async(
+        args=[experiment_channel.id, message.participant_id, token], countdown=debounce_seconds
     )
 
-    update_taskbadger_data(self, channel, message)
+
+@shared_task(bind=True, base=TaskbadgerTask, ignore_result=True)
+def handle_buffered_messages(self, experiment_channel_id: int, participant_id: str, token: str):
+    """Handles the participant's buffered messages as a single turn. `token` identifies the message that
+    scheduled this task. If a newer message has been buffered since, the task that it scheduled will handle both.
+    """
+    if not message_buffer.is_latest_message(experiment_channel_id, participant_id, token):
+        return
+
+    with message_buffer.turn_lock(experiment_channel_id, participant_id, blocking=False) as acquired:
+        if not acquired:
+            # A turn is still running for this participant. Check again later rather than holding up a worker.
+            handle_buffered_messages.apply_async(
+                args=[experiment_channel_id, participant_id, token],
+                countdown=max(settings.CHANNEL_MESSAGE_DEBOUNCE_SECONDS, 1),
+            )
+            return
+
+        messages = message_buffer.pop_messages(experiment_channel_id, participant_id)
+        if not messages:
+            return
+
+        experiment_channel = (
+            ExperimentChannel.objects.filter(id=experiment_channel_id).select_related("experiment", "team").first()
+        )
+        if not experiment_channel:
+            log.info(f"Experiment channel {experiment_channel_id} no longer exists")
+            return
+
+        merge_text = _has_active_session(experiment_channel, participant_id)
+        for message in message_buffer.merge_messages(messages, merge_text=merge_text):
+            # The messages have been removed from the buffer so a failed turn must not stop the others from running
+            try:
+                _new_user_message(self, experiment_channel, message)
+            except Exception:
+                log.exception(
+                    "Error handling buffered message from participant %s on channel %s",
+                    participant_id,
+                    experiment_channel_id,
+                )
+
+
+def _has_active_session(experiment_channel: ExperimentChannel, participant_id: str) -> bool:
+    """Returns whether the participant's current session on the channel has been set up. Until then, each message
+    may be a response to a pre-conversation step such as the consent prompt."""
+    status = (
+        ExperimentSession.objects.filter(
+            experiment=experiment_channel.experiment.get_working_version(), participant__identifier=participant_id
+        )
+        .exclude(status__in=STATUSES_FOR_COMPLETE_CHATS)
+        .order_by("-created_at")
+        .values_list("status", flat=True)
+        .first()
+    )
+    return status == SessionStatus.ACTIVE
+
+
+def _new_user_message(task, experiment_channel: ExperimentChannel, message: BaseMessage):
+    channel_class = ChannelBase.get_channel_class_for_platform(experiment_channel.platform)
+    channel = channel_class(experiment_channel.experiment.default_version, experiment_channel=experiment_channel)
+    update_taskbadger_data(task, channel, message)
+
     with current_team(experiment_channel.team):
         channel.new_user_message(message)
@@ -4,6 +4,12 @@ from apps.service_providers.models import MessagingProviderType
 from apps.utils.factories.service_provider_factories import MessagingProviderFactory
 
 
+@pytest.fixture(autouse=True)
+def _disable_message_debounce(settings):
+    """Handle channel messages immediately so that tests can call the webhook tasks directly"""
+    settings.CHANNEL_MESSAGE_DEBOUNCE_SECONDS = 0
+
+
 @pytest.fixture()
 def twilio_provider(db):
     return MessagingProviderFactory(
@@ -4,6 +4,7 @@ intended. It utilizes the Telegram channel subclass to serve as a testing framew
 """
 
 import re
+from io import BytesIO
 from unittest.mock import Mock, patch
 
 import pytest
@@ -17,7 +18,7 @@ from apps.chat.channels import (
     TelegramChannel,
     strip_urls_and_emojis,
 )
-from apps.chat.exceptions import VersionedExperimentSessionsNotAllowedException
+from apps.chat.exceptions import AudioSynthesizeException, VersionedExperimentSessionsNotAllowedException
 from apps.chat.models import ChatMessageType
 from apps.experiments.models import (
     ExperimentRoute,
@@ -27,6 +28,7 @@ from apps.experiments.models import (
     SessionStatus,
     VoiceResponseBehaviours,
 )
+from apps.service_providers.speech_service import SynthesizedAudio
 from apps.utils.factories.channels import ExperimentChannelFactory
 from apps.utils.factories.experiment import ExperimentFactory, ExperimentSessionFactory
 from apps.utils.factories.team import MembershipFactory
@@ -912,3 +914,29 @@ class TestBaseChannelMethods:
             assert ExperimentSession.objects.filter(participant__identifier="testy-pie").count() == 2
         else:
             assert ExperimentSession.objects.filter(participant__identifier="testy-pie").count() == 1
+
+
+@pytest.mark.django_db()
+@patch("apps.service_providers.models.VoiceProvider.get_speech_service")
+@patch("apps.chat.channels.TelegramChannel.send_text_to_user")
+@patch("apps.chat.channels.TelegramChannel.send_voice_to_user")
+@patch("apps.chat.channels.Flag.get")
+def test_voice_reply_sent_in_chunks(
+    get_flag, send_voice_to_user, send_text_to_user, get_speech_service, telegram_channel
+):
+    get_flag.return_value.is_active_for_team.return_value = True
+    audio = [SynthesizedAudio(audio=BytesIO(b"one"), duration=1.0, format="mp3")]
+
+    def _synthesize_voice_chunks(chunks, synthetic_voice):
+        yield from audio
+        raise AudioSynthesizeException("failed")
+
+    get_speech_service.return_value.synthesize_voice_chunks.side_effect = _synthesize_voice_chunks
+    text = "A long reply. With a few sentences. That is sent in chunks."
+    with patch("apps.chat.channels.split_into_chunks", return_value=["one", "two", "three"]) as split_into_chunks:
+        telegram_channel._reply_voice_message(text)
+
+    split_into_chunks.assert_called_once_with(text)
+    send_voice_to_user.assert_called_once_with(audio[0])
+    # the text of the chunks that couldn't be synthesized is sent instead
+    send_text_to_user.assert_called_once_with("two three")
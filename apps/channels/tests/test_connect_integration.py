@@ -65,7 +65,7 @@ def _setup(experiment, message_spec: dict | None = None) -> tuple:
 
 @pytest.mark.django_db()
 class TestHandleConnectMessageTask:
-    @patch("apps.channels.tasks.CommCareConnectChannel")
+    @patch("apps.chat.channels.CommCareConnectChannel")
     @override_settings(COMMCARE_CONNECT_SERVER_SECRET="123", COMMCARE_CONNECT_SERVER_ID="123")
     def test_multiple_messages_are_sorted_and_concatenated(self, CommCareConnectChannelMock, experiment):
         channel_instance = CommCareConnectChannelMock.return_value
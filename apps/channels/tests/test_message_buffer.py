@@ -0,0 +1,200 @@
+from unittest.mock import Mock, patch
+from uuid import uuid4
+
+import pytest
+
+from apps.channels import message_buffer
+from apps.channels.datamodels import Attachment, BaseMessage
+from apps.channels.models import ChannelPlatform
+from apps.channels.tasks import handle_buffered_messages, handle_channel_message
+from apps.chat.channels import MESSAGE_TYPES
+from apps.experiments.models import SessionStatus
+from apps.utils.factories.channels import ExperimentChannelFactory
+from apps.utils.factories.experiment import ExperimentSessionFactory
+
+
+@pytest.fixture()
+def experiment_channel(db):
+    return ExperimentChannelFactory(platform=ChannelPlatform.TELEGRAM)
+
+
+@pytest.fixture()
+def _debounce(settings):
+    settings.CHANNEL_MESSAGE_DEBOUNCE_SECONDS = 2
+
+
+@pytest.fixture()
+def participant_id():
+    # make sure tests don't share buffers
+    return f"participant-{uuid4().hex}"
+
+
+@pytest.fixture()
+def active_session(experiment_channel, participant_id):
+    return ExperimentSessionFactory(
+        experiment=experiment_channel.experiment,
+        experiment_channel=experiment_channel,
+        participant__identifier=participant_id,
+        status=SessionStatus.ACTIVE,
+    )
+
+
+@pytest.fixture()
+def apply_async():
+    with patch("apps.channels.tasks.handle_buffered_messages.apply_async") as apply_async:
+        yield apply_async
+
+
+def _text(participant_id, text):
+    return BaseMessage(participant_id=participant_id, message_text=text)
+
+
+@pytest.mark.usefixtures("_debounce", "active_session")
+@patch("apps.chat.channels.TelegramChannel")
+def test_burst_of_messages_handled_as_single_turn(channel_cls, experiment_channel, participant_id, apply_async):
+    for text in ["Hi", "I have a question", "about my results"]:
+        handle_channel_message(Mock(), experiment_channel, _text(participant_id, text))
+
+    assert apply_async.call_count == 3
+    assert all(call.kwargs["countdown"] == 2 for call in apply_async.call_args_list)
+    channel_cls.return_value.new_user_message.assert_not_called()
+
+    tokens = [call.kwargs["args"][2] for call in apply_async.call_args_list]
+    for token in tokens[:-1]:
+        handle_buffered_messages(experiment_channel.id, participant_id, token)
+    channel_cls.return_value.new_user_message.assert_not_called()
+
+    handle_buffered_messages(experiment_channel.id, participant_id, tokens[-1])
+    channel_cls.return_value.new_user_message.assert_called_once()
+    message = channel_cls.return_value.new_user_message.call_args[0][0]
+    assert message.message_text == "Hi\n\nI have a question\n\nabout my results"
+    assert message_buffer.pop_messages(experiment_channel.id, participant_id) == []
+
+
+@pytest.mark.usefixtures("_debounce")
+@patch("apps.chat.channels.TelegramChannel")
+def test_buffered_messages_wait_for_running_turn(channel_cls, experiment_channel, participant_id, apply_async):
+    handle_channel_message(Mock(), experiment_channel, _text(participant_id, "Hi"))
+    token = apply_async.call_args.kwargs["args"][2]
+    apply_async.reset_mock()
+
+    with message_buffer.turn_lock(experiment_channel.id, participant_id):
+        handle_buffered_messages(experiment_channel.id, participant_id, token)
+
+    channel_cls.return_value.new_user_message.assert_not_called()
+    apply_async.assert_called_once_with(args=[experiment_channel.id, participant_id, token], countdown=2)
+
+    handle_buffered_messages(experiment_channel.id, participant_id, token)
+    channel_cls.return_value.new_user_message.assert_called_once()
+
+
+@patch("apps.chat.channels.TelegramChannel")
+def test_messages_handled_immediately_without_debounce(channel_cls, experiment_channel, participant_id, apply_async):
+    handle_channel_message(Mock(), experiment_channel, _text(participant_id, "Hi"))
+    apply_async.assert_not_called()
+    channel_cls.return_value.new_user_message.assert_called_once()
+
+
+@patch("apps.channels.message_buffer.TURN_LOCK_WAIT_TIMEOUT", 0.1)
+@patch("apps.chat.channels.TelegramChannel")
+def test_message_buffered_without_debounce_while_turn_runs(
+    channel_cls, experiment_channel, participant_id, apply_async
+):
+    with message_buffer.turn_lock(experiment_channel.id, participant_id):
+        handle_channel_message(Mock(), experiment_channel, _text(participant_id, "Hi"))
+
+    channel_cls.return_value.new_user_message.assert_not_called()
+    apply_async.assert_called_once()
+    assert apply_async.call_args.kwargs["countdown"] == 1
+
+    handle_buffered_messages(*apply_async.call_args.kwargs["args"])
+    channel_cls.return_value.new_user_message.assert_called_once()
+
+
+def _handle_burst(experiment_channel, participant_id, apply_async, texts):
+    for text in texts:
+        handle_channel_message(Mock(), experiment_channel, _text(participant_id, text))
+    handle_buffered_messages(*apply_async.call_args.kwargs["args"])
+
+
+@pytest.mark.usefixtures("_debounce")
+@patch("apps.chat.channels.TelegramChannel")
+def test_messages_not_merged_before_session_is_active(channel_cls, experiment_channel, participant_id, apply_async):
+    ExperimentSessionFactory(
+        experiment=experiment_channel.experiment,
+        experiment_channel=experiment_channel,
+        participant__identifier=participant_id,
+        status=SessionStatus.PENDING,
+    )
+    _handle_burst(experiment_channel, participant_id, apply_async, ["1", "hello"])
+
+    texts = [call.args[0].message_text for call in channel_cls.return_value.new_user_message.call_args_list]
+    assert texts == ["1", "hello"]
+
+
+@pytest.mark.usefixtures("_debounce", "active_session")
+@patch("apps.chat.channels.TelegramChannel")
+def test_reset_command_not_merged(channel_cls, experiment_channel, participant_id, apply_async):
+    _handle_burst(experiment_channel, participant_id, apply_async, ["Hi", " /RESET ", "hi", "again"])
+
+    texts = [call.args[0].message_text for call in channel_cls.return_value.new_user_message.call_args_list]
+    assert texts == ["Hi", " /RESET ", "hi\n\nagain"]
+
+
+@pytest.mark.usefixtures("_debounce")
+@patch("apps.chat.channels.TelegramChannel")
+def test_failed_turn_does_not_drop_later_messages(channel_cls, experiment_channel, participant_id, apply_async):
+    new_user_message = channel_cls.return_value.new_user_message
+    new_user_message.side_effect = [Exception("Bot error"), None]
+    handle_channel_message(Mock(), experiment_channel, _text(participant_id, "Hi"))
+    voice = BaseMessage(participant_id=participant_id, message_text="", content_type=MESSAGE_TYPES.VOICE)
+    handle_channel_message(Mock(), experiment_channel, voice)
+
+    handle_buffered_messages(*apply_async.call_args.kwargs["args"])
+
+    assert [call.args[0].content_type for call in new_user_message.call_args_list] == [
+        MESSAGE_TYPES.TEXT,
+        MESSAGE_TYPES.VOICE,
+    ]
+    assert message_buffer.pop_messages(experiment_channel.id, participant_id) == []
+
+
+def test_turn_lock_is_exclusive(participant_id):
+    with message_buffer.turn_lock(1, participant_id) as acquired:
+        assert acquired
+        with message_buffer.turn_lock(1, participant_id, blocking=False) as acquired_again:
+            assert not acquired_again
+        with message_buffer.turn_lock(2, participant_id, blocking=False) as other_channel:
+            assert other_channel
+
+    with message_buffer.turn_lock(1, participant_id, blocking=False) as acquired:
+        assert acquired
+
+
+def test_merge_messages_keeps_non_text_messages_separate():
+    attachment = Attachment(file_id=1, type="code_interpreter", name="results.pdf", size=10)
+    messages = [
+        _text("p1", "Hi"),
+        _text("p1", "listen to this"),
+        BaseMessage(participant_id="p1", message_text="", content_type=MESSAGE_TYPES.VOICE),
+        _text("p1", "and this file"),
+        BaseMessage(participant_id="p1", message_text="results", attachments=[attachment]),
+        _text("p1", "thanks"),
+    ]
+    merged = message_buffer.merge_messages(messages)
+    assert [message.message_text for message in merged] == [
+        "Hi\n\nlisten to this",
+        "",
+        "and this file",
+        "results",
+        "thanks",
+    ]
+
+
+def test_merge_messages_keeps_control_messages_separate():
+    messages = [_text("p1", "Hi"), _text("p1", "1"), _text("p1", "/reset"), _text("p1", "hello"), _text("p1", "there")]
+    merged = message_buffer.merge_messages(messages)
+    assert [message.message_text for message in merged] == ["Hi", "1", "/reset", "hello\n\nthere"]
+
+    merged = message_buffer.merge_messages(messages[3:], merge_text=False)
+    assert [message.message_text for message in merged] == ["hello", "there"]
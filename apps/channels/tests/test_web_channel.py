@@ -18,7 +18,7 @@ def pipeline():
 @pytest.mark.django_db()
 @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
 @pytest.mark.parametrize("with_seed_message", [True, False])
-@patch("apps.events.tasks.enqueue_static_triggers", Mock())
+@patch("apps.events.tasks.fire_static_triggers", Mock())
 @patch("apps.chat.bots.TopicBot.get_ai_message_id")
 @patch("apps.chat.channels.WebChannel.new_user_message")
 def test_start_new_session(new_user_message, get_ai_message_id, with_seed_message, experiment):
@@ -52,7 +52,7 @@ def test_start_new_session(new_user_message, get_ai_message_id, with_seed_messag
 @pytest.mark.django_db()
 @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
 @pytest.mark.parametrize("with_seed_message", [True, False])
-@patch("apps.events.tasks.enqueue_static_triggers", Mock())
+@patch("apps.events.tasks.fire_static_triggers", Mock())
 @patch("apps.chat.bots.PipelineBot.get_ai_message_id")
 @patch("apps.chat.channels.WebChannel.new_user_message")
 def test_start_new_session_pipeline(
@@ -95,7 +95,7 @@ def test_404_raised_when_version_is_not_found(experiment):
 
 @pytest.mark.django_db()
 class TestVersioning:
-    @patch("apps.events.tasks.enqueue_static_triggers", Mock())
+    @patch("apps.events.tasks.fire_static_triggers", Mock())
     @patch("apps.chat.channels.WebChannel.check_and_process_seed_message")
     def test_start_new_session_uses_default_version(self, check_and_process_seed_message, experiment):
         new_version = experiment.create_new_version()
@@ -109,7 +109,7 @@ class TestVersioning:
         assert session.experiment == experiment
         assert session.chat.metadata.get(Chat.MetadataKeys.EXPERIMENT_VERSION) == experiment.DEFAULT_VERSION_NUMBER
 
-    @patch("apps.events.tasks.enqueue_static_triggers", Mock())
+    @patch("apps.events.tasks.fire_static_triggers", Mock())
     @patch("apps.chat.channels.WebChannel.check_and_process_seed_message")
     def test_start_new_session_uses_specified_version(self, check_and_process_seed_message, experiment):
         new_version = experiment.create_new_version()
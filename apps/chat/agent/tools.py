@@ -307,7 +307,7 @@ def get_tool_instances(tools_list, experiment_session: ExperimentSession | None
 
 
 def get_custom_action_tools(action_holder: Union[Experiment, "OpenAiAssistant"]) -> list[BaseTool]:
-    operations = action_holder.get_custom_action_operations().select_related("custom_action__auth_provider").all()
+    operations = action_holder.get_custom_action_operations()
     return list(filter(None, [get_tool_for_custom_action_operation(operation) for operation in operations]))
 
 
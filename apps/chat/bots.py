@@ -1,9 +1,16 @@
+import copy
+import logging
 import textwrap
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING, Any
 
 from langchain.memory import ConversationBufferMemory
 from langchain_core.language_models import BaseChatModel
 from langchain_core.runnables import chain
+from langchain_core.runnables import config as runnable_config
 from pydantic import ValidationError
 
 from apps.annotations.models import TagCategories
@@ -11,16 +18,31 @@ from apps.chat.conversation import BasicConversation, Conversation
 from apps.chat.exceptions import ChatException
 from apps.chat.models import ChatMessageType
 from apps.events.models import StaticTriggerType
-from apps.events.tasks import enqueue_static_triggers
-from apps.experiments.models import Experiment, ExperimentRoute, ExperimentSession, SafetyLayer
+from apps.events.static_triggers import queue_static_trigger
+from apps.experiments.models import (
+    Experiment,
+    ExperimentRoute,
+    ExperimentRouteType,
+    ExperimentSession,
+    SafetyLayer,
+)
 from apps.pipelines.nodes.base import PipelineState
+from apps.service_providers.llm_service.callbacks import STREAM_OUTPUT_TAG
 from apps.service_providers.llm_service.default_models import get_default_model
 from apps.service_providers.llm_service.prompt_context import PromptTemplateContext
-from apps.service_providers.llm_service.runnables import create_experiment_runnable
+from apps.service_providers.llm_service.runnables import (
+    AgentAssistantChat,
+    AgentLLMChat,
+    SimpleLLMChat,
+    create_experiment_runnable,
+)
+from apps.teams.models import Flag
 
 if TYPE_CHECKING:
     from apps.channels.datamodels import Attachment
 
+logger = logging.getLogger("ocs.bots")
+
 
 def create_conversation(
     prompt_str: str,
@@ -44,6 +66,95 @@ def notify_users_of_violation(session_id: int, safety_layer_id: int):
     notify_users_of_safety_violations_task.delay(session_id, safety_layer_id)
 
 
+def run_safety_checks(safety_bots: list["SafetyBot"], message: str) -> "SafetyBot | None":
+    """Runs the safety checks for `message` concurrently and returns the first bot, in the order given, that
+    flagged the message as unsafe."""
+    if len(safety_bots) <= 1:
+        return next((bot for bot in safety_bots if not bot.is_safe(message)), None)
+
+    with runnable_config.ContextThreadPoolExecutor(max_workers=len(safety_bots)) as executor:
+        futures = [executor.submit(bot.is_safe, message) for bot in safety_bots]
+        return _get_first_unsafe(safety_bots, futures)
+
+
+def _get_first_unsafe(safety_bots: list["SafetyBot"], futures: list[Future]) -> "SafetyBot | None":
+    for safety_bot, future in zip(safety_bots, futures, strict=True):
+        if not future.result():
+            return safety_bot
+
+
+@dataclass
+class ExperimentRoutes:
+    """The child experiments that an experiment routes messages to"""
+
+    processors: dict[str, Experiment] = field(default_factory=dict)
+    default_keyword: str | None = None
+    terminal: Experiment | None = None
+
+    @classmethod
+    def for_experiment(cls, experiment: Experiment) -> "ExperimentRoutes":
+        routes = cls()
+        for route in ExperimentRoute.objects.select_related("child").filter(parent=experiment).order_by("id"):
+            keyword = route.keyword.lower().strip()
+            if route.type == ExperimentRouteType.PROCESSOR:
+                routes.processors[keyword] = route.child
+                if route.is_default:
+                    routes.default_keyword = keyword
+            elif route.type == ExperimentRouteType.TERMINAL and routes.terminal is None:
+                routes.terminal = route.child
+
+        if routes.processors and not routes.default_keyword:
+            routes.default_keyword = next(iter(routes.processors))
+        return routes
+
+    def copy(self) -> "ExperimentRoutes":
+        """Returns a copy with fresh model instances so that related objects loaded while handling one message
+        aren't shared with others"""
+        return ExperimentRoutes(
+            processors={keyword: copy.copy(child) for keyword, child in self.processors.items()},
+            default_keyword=self.default_keyword,
+            terminal=copy.copy(self.terminal),
+        )
+
+
+class ExperimentRoutesCache:
+    """A per-process LRU cache of experiment routes.
+
+    Only the routes of experiment versions are cached since versions can't be edited. The routes of a working
+    experiment are loaded on every lookup.
+    """
+
+    def __init__(self, maxsize=256) -> None:
+        self.maxsize = maxsize
+        self.routes: OrderedDict[int, ExperimentRoutes] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, experiment: Experiment) -> ExperimentRoutes:
+        if experiment.working_version_id is None:
+            return ExperimentRoutes.for_experiment(experiment)
+
+        with self.lock:
+            routes = self.routes.get(experiment.id)
+            if routes is not None:
+                self.routes.move_to_end(experiment.id)
+                return routes.copy()
+
+        logger.debug("Loading routes for experiment version %s", experiment.id)
+        routes = ExperimentRoutes.for_experiment(experiment)
+        with self.lock:
+            self.routes[experiment.id] = routes
+            while len(self.routes) > self.maxsize:
+                self.routes.popitem(last=False)
+        return routes.copy()
+
+    def clear(self):
+        with self.lock:
+            self.routes.clear()
+
+
+experiment_routes_cache = ExperimentRoutesCache()
+
+
 def get_bot(session: ExperimentSession, experiment: Experiment | None = None, disable_tools: bool = False):
     experiment = experiment or session.experiment_version
     if experiment.pipeline_id:
@@ -79,44 +190,26 @@ class TopicBot:
         self.input_tokens = 0
         self.output_tokens = 0
 
-        # maps keywords to child experiments.
-        self.child_experiment_routes = (
-            ExperimentRoute.objects.select_related("child").filter(parent=self.experiment, type="processor").all()
-        )
+        self.routes = experiment_routes_cache.get(self.experiment)
+        # runnables for the child experiments, built when the router first picks them
         self.child_chains = {}
-        self.default_child_chain = None
-        self.default_tag = None
         self.terminal_chain = None
         self.processor_experiment = None
         self.trace_service = self.experiment.trace_service
 
         # The chain that generated the AI message
         self.generator_chain = None
+        # Set while the response is being generated before the human safety checks have passed
+        self.holding_back_response = False
         self._initialize()
 
     def _initialize(self):
-        for child_route in self.child_experiment_routes:
-            child_runnable = create_experiment_runnable(
-                child_route.child, self.session, self.disable_tools, trace_service=self.trace_service
-            )
-            self.child_chains[child_route.keyword.lower().strip()] = child_runnable
-            if child_route.is_default:
-                self.default_child_chain = child_runnable
-                self.default_tag = child_route.keyword.lower().strip()
-
-        if self.child_chains and not self.default_child_chain:
-            self.default_tag, self.default_child_chain = list(self.child_chains.items())[0]
-
         self.chain = create_experiment_runnable(
             self.experiment, self.session, self.disable_tools, trace_service=self.trace_service
         )
-
-        terminal_route = (
-            ExperimentRoute.objects.select_related("child").filter(parent=self.experiment, type="terminal").first()
-        )
-        if terminal_route:
+        if self.routes.terminal:
             self.terminal_chain = create_experiment_runnable(
-                terminal_route.child, self.session, trace_service=self.trace_service
+                self.routes.terminal, self.session, trace_service=self.trace_service
             )
 
         # load up the safety bots. They should not be agents. We don't want them using tools (for now)
@@ -124,8 +217,14 @@ class TopicBot:
             SafetyBot(safety_layer, self.llm, self.source_material) for safety_layer in self.safety_layers
         ]
 
-    def _call_predict(self, input_str, save_input_to_history=True, attachments: list["Attachment"] | None = None):
-        if self.child_chains:
+    def _call_predict(
+        self,
+        input_str,
+        save_input_to_history=True,
+        attachments: list["Attachment"] | None = None,
+        enqueue_triggers=True,
+    ):
+        if self.routes.processors:
             tag, chain = self._get_child_chain(input_str, attachments)
         else:
             tag, chain = None, self.chain
@@ -135,11 +234,12 @@ class TopicBot:
         result = chain.invoke(
             input_str,
             config={
+                "tags": self._get_output_tags(chain) if self.terminal_chain is None else [],
                 "configurable": {
                     "save_input_to_history": save_input_to_history,
                     "save_output_to_history": self.terminal_chain is None,
                     "experiment_tag": tag,
-                }
+                },
             },
             attachments=attachments,
         )
@@ -150,6 +250,7 @@ class TopicBot:
                 result.output,
                 config={
                     "run_name": "terminal_chain",
+                    "tags": self._get_output_tags(chain),
                     "configurable": {
                         "save_input_to_history": False,
                         "experiment_tag": tag,
@@ -160,11 +261,24 @@ class TopicBot:
 
         self.generator_chain = chain
 
-        enqueue_static_triggers.delay(self.session.id, StaticTriggerType.NEW_BOT_MESSAGE)
+        if enqueue_triggers:
+            queue_static_trigger(self.session, StaticTriggerType.NEW_BOT_MESSAGE)
         self.input_tokens = self.input_tokens + result.prompt_tokens
         self.output_tokens = self.output_tokens + result.completion_tokens
         return result.output
 
+    def _get_output_tags(self, chain) -> list[str]:
+        """Tags for the run that generates the response to the user. The tag allows the response tokens to be
+        streamed, which can't be done if the response still needs to be checked by a safety layer.
+
+        Agents aren't streamed either. The tag is inherited by every LLM call the agent makes, so text that the
+        model writes before calling a tool would be streamed as part of the response."""
+        if isinstance(chain, AgentLLMChat | AgentAssistantChat):
+            return []
+        if self.holding_back_response or any(safety_bot.filter_ai_messages() for safety_bot in self.safety_bots):
+            return []
+        return [STREAM_OUTPUT_TAG]
+
     def _get_child_chain(self, input_str: str, attachments: list["Attachment"] | None = None) -> tuple[str, Any]:
         result = self.chain.invoke(
             input_str,
@@ -181,31 +295,44 @@ class TopicBot:
         self.output_tokens = self.output_tokens + result.completion_tokens
 
         keyword = result.output.lower().strip()
-        try:
-            return keyword, self.child_chains[keyword]
-        except KeyError:
-            return self.default_tag, self.default_child_chain
+        if keyword not in self.routes.processors:
+            keyword = self.routes.default_keyword
+        return keyword, self._get_child_runnable(keyword)
+
+    def _get_child_runnable(self, keyword: str):
+        if keyword not in self.child_chains:
+            self.child_chains[keyword] = create_experiment_runnable(
+                self.routes.processors[keyword], self.session, self.disable_tools, trace_service=self.trace_service
+            )
+        return self.child_chains[keyword]
 
     def process_input(self, user_input: str, save_input_to_history=True, attachments: list["Attachment"] | None = None):
+        human_safety_bots = [safety_bot for safety_bot in self.safety_bots if safety_bot.filter_human_messages()]
+        ai_safety_bots = [safety_bot for safety_bot in self.safety_bots if safety_bot.filter_ai_messages()]
+
         @chain
         def main_bot_chain(user_input):
-            # human safety layers
-            for safety_bot in self.safety_bots:
-                if safety_bot.filter_human_messages() and not safety_bot.is_safe(user_input):
-                    self._save_message_to_history(user_input, ChatMessageType.HUMAN)
-                    enqueue_static_triggers.delay(self.session.id, StaticTriggerType.HUMAN_SAFETY_LAYER_TRIGGERED)
-                    notify_users_of_violation(self.session.id, safety_layer_id=safety_bot.safety_layer.id)
-                    return self._get_safe_response(safety_bot.safety_layer)
-
-            response = self._call_predict(
-                user_input, save_input_to_history=save_input_to_history, attachments=attachments
-            )
-
-            # ai safety layers
-            for safety_bot in self.safety_bots:
-                if safety_bot.filter_ai_messages() and not safety_bot.is_safe(response):
-                    enqueue_static_triggers.delay(self.session.id, StaticTriggerType.BOT_SAFETY_LAYER_TRIGGERED)
-                    return self._get_safe_response(safety_bot.safety_layer)
+            if human_safety_bots and self._can_run_human_safety_checks_with_response():
+                unsafe_bot, response = self._call_predict_with_human_safety_checks(
+                    user_input, human_safety_bots, save_input_to_history=save_input_to_history, attachments=attachments
+                )
+            else:
+                unsafe_bot, response = run_safety_checks(human_safety_bots, user_input), None
+
+            if unsafe_bot:
+                self._save_message_to_history(user_input, ChatMessageType.HUMAN)
+                queue_static_trigger(self.session, StaticTriggerType.HUMAN_SAFETY_LAYER_TRIGGERED)
+                notify_users_of_violation(self.session.id, safety_layer_id=unsafe_bot.safety_layer.id)
+                return self._get_safe_response(unsafe_bot.safety_layer)
+
+            if response is None:
+                response = self._call_predict(
+                    user_input, save_input_to_history=save_input_to_history, attachments=attachments
+                )
+
+            if unsafe_bot := run_safety_checks(ai_safety_bots, response):
+                queue_static_trigger(self.session, StaticTriggerType.BOT_SAFETY_LAYER_TRIGGERED)
+                return self._get_safe_response(unsafe_bot.safety_layer)
 
             return response
 
@@ -231,6 +358,55 @@ class TopicBot:
             if self.trace_service:
                 self.trace_service.end()
 
+    def _can_run_human_safety_checks_with_response(self) -> bool:
+        """The response can only be generated before the human safety checks have passed if generating it has no
+        side effects other than the history, which is held back until the checks pass. Assistants and tools
+        make changes outside OCS so they always wait for the checks."""
+        if self.routes.processors or self.terminal_chain or not isinstance(self.chain, SimpleLLMChat):
+            return False
+        return Flag.get("safety_layers_with_response").is_active_for_team(self.experiment.team)
+
+    def _call_predict_with_human_safety_checks(
+        self,
+        user_input: str,
+        human_safety_bots: list["SafetyBot"],
+        save_input_to_history=True,
+        attachments: list["Attachment"] | None = None,
+    ) -> tuple["SafetyBot | None", str | None]:
+        """Generates the response while the human safety checks are running. The response, and the messages the
+        chain saves to the history, are held back until all the checks have passed. If any of them fail, the
+        messages are discarded so that the outcome is the same as running the checks first.
+
+        Returns the first safety bot that flagged the input, or the response if there is none.
+        """
+        history_manager = self.chain.history_manager
+        save_history = False
+        history_manager.hold_back_messages()
+        try:
+            with runnable_config.ContextThreadPoolExecutor(max_workers=len(human_safety_bots)) as executor:
+                futures = [executor.submit(safety_bot.is_safe, user_input) for safety_bot in human_safety_bots]
+                self.holding_back_response = True
+                try:
+                    response = self._call_predict(
+                        user_input,
+                        save_input_to_history=save_input_to_history,
+                        attachments=attachments,
+                        enqueue_triggers=False,
+                    )
+                finally:
+                    self.holding_back_response = False
+                # The results are only collected once the response has been generated so that an error in a check
+                # doesn't replace the chain's error. The executor still waits for the checks when the chain fails.
+                unsafe_bot = _get_first_unsafe(human_safety_bots, futures)
+            save_history = unsafe_bot is None
+        finally:
+            history_manager.release_held_back_messages(save=save_history)
+
+        if unsafe_bot:
+            return unsafe_bot, None
+        queue_static_trigger(self.session, StaticTriggerType.NEW_BOT_MESSAGE)
+        return None, response
+
     def get_ai_message_id(self) -> int | None:
         """Returns the generated AI message's ID. The caller can use this to fetch more information on this message"""
         if self.generator_chain and self.generator_chain.history_manager.ai_message:
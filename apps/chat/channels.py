@@ -28,7 +28,7 @@ from apps.chat.exceptions import (
 from apps.chat.models import Chat, ChatMessage, ChatMessageType
 from apps.chat.tasks import STATUSES_FOR_COMPLETE_CHATS
 from apps.events.models import StaticTriggerType
-from apps.events.tasks import enqueue_static_triggers
+from apps.events.static_triggers import batch_static_triggers, queue_static_trigger
 from apps.experiments.models import (
     Experiment,
     ExperimentSession,
@@ -38,8 +38,9 @@ from apps.experiments.models import (
     VoiceResponseBehaviours,
 )
 from apps.service_providers.llm_service.runnables import GenerationCancelled
-from apps.service_providers.speech_service import SynthesizedAudio
+from apps.service_providers.speech_service import SpeechService, SynthesizedAudio, split_into_chunks
 from apps.slack.utils import parse_session_external_id
+from apps.teams.models import Flag
 from apps.users.models import CustomUser
 
 if TYPE_CHECKING:
@@ -289,7 +290,8 @@ class ChannelBase(ABC):
         """
         self._is_user_message = True
         try:
-            return self._new_user_message(message)
+            with batch_static_triggers():
+                return self._new_user_message(message)
         except GenerationCancelled:
             return ""
 
@@ -323,7 +325,7 @@ class ChannelBase(ABC):
                     # status is ACTIVE
                     self.experiment_session.update_status(SessionStatus.ACTIVE)
 
-            enqueue_static_triggers.delay(self.experiment_session.id, StaticTriggerType.NEW_HUMAN_MESSAGE)
+            queue_static_trigger(self.experiment_session, StaticTriggerType.NEW_HUMAN_MESSAGE)
             response = self._handle_supported_message()
             return response
         except Exception as e:
@@ -452,17 +454,34 @@ class ChannelBase(ABC):
             synthetic_voice = self.bot.processor_experiment.synthetic_voice
 
         speech_service = voice_provider.get_speech_service()
-        try:
-            synthetic_voice_audio = speech_service.synthesize_voice(text, synthetic_voice)
-            self.send_voice_to_user(synthetic_voice_audio)
-        except AudioSynthesizeException as e:
-            logger.exception(e)
-            self.send_text_to_user(text)
+        if Flag.get("chunked_voice_replies").is_active_for_team(self.experiment.team):
+            self._reply_voice_message_in_chunks(speech_service, text, synthetic_voice)
+        else:
+            try:
+                synthetic_voice_audio = speech_service.synthesize_voice(text, synthetic_voice)
+                self.send_voice_to_user(synthetic_voice_audio)
+            except AudioSynthesizeException as e:
+                logger.exception(e)
+                self.send_text_to_user(text)
 
         if extracted_urls:
             urls_text = "\n".join(extracted_urls)
             self.send_text_to_user(urls_text)
 
+    def _reply_voice_message_in_chunks(self, speech_service: SpeechService, text: str, synthetic_voice):
+        """Sends the reply as several voice messages, one per chunk of sentences. The chunks are synthesized
+        concurrently and each one is sent as soon as it and the chunks before it are ready, so that participants
+        don't have to wait for the audio of the whole reply."""
+        chunks = split_into_chunks(text)
+        sent = 0
+        try:
+            for synthetic_voice_audio in speech_service.synthesize_voice_chunks(chunks, synthetic_voice):
+                self.send_voice_to_user(synthetic_voice_audio)
+                sent += 1
+        except AudioSynthesizeException as e:
+            logger.exception(e)
+            self.send_text_to_user(" ".join(chunks[sent:]))
+
     def _get_voice_transcript(self) -> str:
         # Indicate to the user that the bot is busy processing the message
         self.transcription_started()
@@ -973,6 +992,6 @@ def _start_experiment_session(
             participant.update_memory(data={"timezone": timezone}, experiment=working_experiment)
 
     if participant.experimentsession_set.count() == 1:
-        enqueue_static_triggers.delay(session.id, StaticTriggerType.PARTICIPANT_JOINED_EXPERIMENT)
-    enqueue_static_triggers.delay(session.id, StaticTriggerType.CONVERSATION_START)
+        queue_static_trigger(session, StaticTriggerType.PARTICIPANT_JOINED_EXPERIMENT)
+    queue_static_trigger(session, StaticTriggerType.CONVERSATION_START)
     return session
@@ -1,6 +1,10 @@
+import hashlib
 import logging
 from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+from itertools import islice
 
+from django.core.cache import cache
 from langchain.chains.conversation.base import ConversationChain
 from langchain.chains.llm import LLMChain
 from langchain.memory.prompt import SUMMARY_PROMPT
@@ -23,6 +27,10 @@ SUMMARY_TOO_LARGE_ERROR_MESSAGE = "Unable to compress chat history: existing sum
 INITIAL_SUMMARY_TOKENS_ESTIMATE = 20
 # The maximum number of messages that can be uncompressed
 MAX_UNCOMPRESSED_MESSAGES = 1000
+# Token counts for a given message and model never change so they can be cached for a long time
+TOKEN_COUNT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# The number of history messages that are token counted at a time while loading a history window
+HISTORY_WINDOW_BATCH_SIZE = 50
 
 log = logging.getLogger("ocs.bots")
 
@@ -117,8 +125,16 @@ def compress_chat_history(
     keep_history_len: int = 10,
     history_mode: str = None,
 ) -> list[BaseMessage]:
-    history_messages = chat.get_langchain_messages_until_summary()
+    history_messages = None
     try:
+        history_messages = get_history_window(
+            chat.iter_langchain_messages_until_summary(),
+            llm,
+            max_token_limit,
+            keep_history_len,
+            history_mode,
+            get_summary_message=chat.get_last_summary_message,
+        )
         history, last_message, summary = _compress_chat_history(
             history=history_messages,
             llm=llm,
@@ -137,6 +153,8 @@ def compress_chat_history(
     except (NameError, ImportError, ValueError, NotImplementedError):
         # typically this is because a library required to count tokens isn't installed
         log.exception("Unable to compress history")
+        if history_messages is None:
+            history_messages = chat.get_langchain_messages_until_summary()
         return history_messages
 
 
@@ -148,8 +166,16 @@ def compress_pipeline_chat_history(
     keep_history_len: int = 10,
     history_mode: str = None,
 ) -> list[BaseMessage]:
-    history_messages = pipeline_chat_history.get_langchain_messages_until_summary()
+    history_messages = None
     try:
+        history_messages = get_history_window(
+            pipeline_chat_history.iter_langchain_messages_until_summary(),
+            llm,
+            max_token_limit,
+            keep_history_len,
+            history_mode,
+            get_summary_message=pipeline_chat_history.get_last_summary_message,
+        )
         history, last_message, summary = _compress_chat_history(
             history=history_messages,
             llm=llm,
@@ -169,9 +195,53 @@ def compress_pipeline_chat_history(
     except (NameError, ImportError, ValueError, NotImplementedError):
         # typically this is because a library required to count tokens isn't installed
         log.exception("Unable to compress history")
+        if history_messages is None:
+            history_messages = pipeline_chat_history.get_langchain_messages_until_summary()
         return history_messages
 
 
+def get_history_window(
+    messages: Iterator[BaseMessage],
+    llm: BaseChatModel,
+    max_token_limit: int,
+    keep_history_len: int = 10,
+    history_mode: str = None,
+    get_summary_message: Callable[[], BaseMessage | None] | None = None,
+) -> list[BaseMessage]:
+    """Reads history messages (newest first) until the budget for the history mode is met and returns them in
+    chronological order.
+
+    Messages outside the budget would be discarded during compression anyway so there is no need to load them.
+    The summarize mode has no budget since every message since the last summary needs to be summarized.
+
+    `messages` ends with the most recent summary. If the window stops before it, the summary is loaded with
+    `get_summary_message` and added to the start of the window so that it is kept during compression.
+    """
+    messages = iter(messages)
+    has_more = False
+    if history_mode == PipelineChatHistoryModes.MAX_HISTORY_LENGTH and keep_history_len is not None:
+        window = list(islice(messages, keep_history_len))
+        has_more = next(messages, None) is not None
+    elif history_mode == PipelineChatHistoryModes.TRUNCATE_TOKENS and max_token_limit > 0:
+        window = []
+        token_count = llm.get_num_tokens_from_messages([])
+        while token_count <= max_token_limit and (batch := list(islice(messages, HISTORY_WINDOW_BATCH_SIZE))):
+            _, token_counts = get_message_token_counts(llm, batch)
+            for i, (message, message_tokens) in enumerate(zip(batch, token_counts, strict=True)):
+                window.append(message)
+                token_count += message_tokens
+                if token_count > max_token_limit:
+                    has_more = i < len(batch) - 1
+                    break
+        has_more = has_more or next(messages, None) is not None
+    else:
+        window = list(messages)
+
+    if has_more and get_summary_message and (summary := get_summary_message()):
+        window.append(summary)
+    return list(reversed(window))
+
+
 def _compress_chat_history(
     history: list,
     llm: BaseChatModel,
@@ -189,7 +259,7 @@ def _compress_chat_history(
 
     total_messages = history.copy()
     total_messages.extend(input_messages)
-    current_token_count = llm.get_num_tokens_from_messages(total_messages)
+    current_token_count = count_tokens(*get_message_token_counts(llm, total_messages))
     if history_mode in [PipelineChatHistoryModes.SUMMARIZE, PipelineChatHistoryModes.TRUNCATE_TOKENS, None]:
         if current_token_count <= max_token_limit and len(total_messages) <= MAX_UNCOMPRESSED_MESSAGES:
             log.info("Skipping chat history compression: %s <= %s", current_token_count, max_token_limit)
@@ -216,15 +286,17 @@ def _compress_chat_history(
 def truncate_tokens(history, max_token_limit, llm, input_message_tokens):
     """Removes old messages until the token count is below the max limit."""
     pruned_memory = []
-    history_tokens = llm.get_num_tokens_from_messages(history)
+    overhead, token_counts = get_message_token_counts(llm, history)
+    history_tokens = count_tokens(overhead, token_counts)
     while history and history_tokens + input_message_tokens > max_token_limit:
         pruned_memory.append(history.pop(0))
-        history_tokens = llm.get_num_tokens_from_messages(history)
+        history_tokens -= token_counts.pop(0)
     return history, pruned_memory
 
 
 def summarize_history(llm, history, max_token_limit, input_message_tokens, summary, input_messages, pruned_memory):
-    history_tokens = llm.get_num_tokens_from_messages(history)
+    overhead, token_counts = get_message_token_counts(llm, history)
+    history_tokens = count_tokens(overhead, token_counts)
     summary_tokens = (
         llm.get_num_tokens_from_messages([SystemMessage(content=summary)])
         if summary
@@ -245,7 +317,8 @@ def summarize_history(llm, history, max_token_limit, input_message_tokens, summa
 
             pruned_messages, history = history[:prune_count], history[prune_count:]
             pruned_memory.extend(pruned_messages)
-            history_tokens = llm.get_num_tokens_from_messages(history)
+            history_tokens -= sum(token_counts[:prune_count])
+            token_counts = token_counts[prune_count:]
         # Generate a new summary after pruning messages
         summary = _get_new_summary(llm, pruned_memory, summary, max_token_limit)
         summary_tokens = llm.get_num_tokens_from_messages([SystemMessage(content=summary)])
@@ -274,14 +347,15 @@ def compress_chat_history_from_messages(
         history, pruned_memory, summary = summarize_history(
             llm, history, max_token_limit, input_message_tokens, summary, input_messages, pruned_memory
         )
+        # these counts are served from the cache populated during summarization
+        history_tokens = count_tokens(*get_message_token_counts(llm, history))
+        summary_tokens = llm.get_num_tokens_from_messages([SystemMessage(content=summary)])
         log.info(
             "Compressed chat history to %s tokens (%s prompt + %s summary + %s history)",
-            input_message_tokens
-            + llm.get_num_tokens_from_messages(history)
-            + llm.get_num_tokens_from_messages([SystemMessage(content=summary)]),
+            input_message_tokens + history_tokens + summary_tokens,
             input_message_tokens,
-            llm.get_num_tokens_from_messages([SystemMessage(content=summary)]),
-            llm.get_num_tokens_from_messages(history),
+            summary_tokens,
+            history_tokens,
         )
     if history:
         last_message = history[0]
@@ -328,3 +402,47 @@ def _get_summary_tokens_with_context(llm, summary, pruned_memory):
     context = {"summary": summary or "", "new_lines": new_lines}
     tokens = llm.get_num_tokens_from_messages(SUMMARY_PROMPT.format_prompt(**context).to_messages())
     return tokens, context
+
+
+def get_message_token_counts(llm, messages: list) -> tuple[int, list[int]]:
+    """Returns the token overhead of the request along with the token count of each individual message.
+
+    Counting messages individually allows callers to keep a running total as messages are pruned instead of
+    re-counting the whole history each time. Counts for langchain messages are cached per model family
+    since the same history is counted again on every turn of a conversation.
+    """
+    overhead = llm.get_num_tokens_from_messages([])
+    cache_keys = {
+        index: _get_token_count_cache_key(llm, message)
+        for index, message in enumerate(messages)
+        if isinstance(message, BaseMessage)
+    }
+    cached_counts = cache.get_many(list(cache_keys.values())) if cache_keys else {}
+
+    token_counts = []
+    new_counts = {}
+    for index, message in enumerate(messages):
+        cache_key = cache_keys.get(index)
+        if cache_key in cached_counts:
+            token_counts.append(cached_counts[cache_key])
+            continue
+
+        token_count = llm.get_num_tokens_from_messages([message]) - overhead
+        token_counts.append(token_count)
+        if cache_key:
+            new_counts[cache_key] = token_count
+
+    if new_counts:
+        cache.set_many(new_counts, timeout=TOKEN_COUNT_CACHE_TIMEOUT)
+    return overhead, token_counts
+
+
+def count_tokens(overhead: int, token_counts: list[int]) -> int:
+    return overhead + sum(token_counts)
+
+
+def _get_token_count_cache_key(llm, message: BaseMessage) -> str:
+    llm_class = type(llm)
+    model_name = getattr(llm, "model_name", None) or getattr(llm, "model", None) or ""
+    digest = hashlib.sha1(f"{message.type}:{message.content}".encode()).hexdigest()
+    return f"token_count:{llm_class.__module__}.{llm_class.__qualname__}:{model_name}:{digest}"
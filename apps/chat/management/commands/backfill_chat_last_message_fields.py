@@ -0,0 +1,37 @@
+from django.core.management import BaseCommand, CommandError
+
+from apps.chat.models import Chat
+
+
+class Command(BaseCommand):
+    help = "Populate the denormalized last message fields on chats from their messages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--team", help="The team slug", required=False)
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of chats to update per query")
+        parser.add_argument(
+            "--recompute-all",
+            action="store_true",
+            help="Recompute all chats instead of only those that are missing the fields",
+        )
+
+    def handle(self, team, batch_size, recompute_all, **options):
+        from apps.teams.models import Team
+
+        chats = Chat.objects.all()
+        if team:
+            try:
+                chats = chats.filter(team=Team.objects.get(slug=team))
+            except Team.DoesNotExist:
+                raise CommandError(f"Team {team} does not exist.")
+        if not recompute_all:
+            chats = chats.filter(last_message_at__isnull=True, messages__isnull=False).distinct()
+
+        chat_ids = list(chats.order_by("id").values_list("id", flat=True))
+        self.stdout.write(f"Updating {len(chat_ids)} chats")
+        updated = 0
+        for start in range(0, len(chat_ids), batch_size):
+            batch = chat_ids[start : start + batch_size]
+            updated += Chat.refresh_last_message_fields(Chat.objects.filter(id__in=batch))
+            self.stdout.write(f"Updated {updated} of {len(chat_ids)} chats")
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0017_change_chatmessage_metadata'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['chat', 'created_at'], name='chat_chatme_chat_id_45c5e0_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:12
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 1000
+
+
+def _backfill_last_message_fields(apps, schema_editor):
+    Chat = apps.get_model("chat", "Chat")
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+    messages = ChatMessage.objects.filter(chat_id=OuterRef("pk")).order_by("-created_at", "-id")
+    human_messages = messages.filter(message_type="human")
+    chat_ids = list(
+        Chat.objects.filter(last_message_at__isnull=True, messages__isnull=False)
+        .distinct()
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    for start in range(0, len(chat_ids), BATCH_SIZE):
+        Chat.objects.filter(id__in=chat_ids[start : start + BATCH_SIZE]).update(
+            last_message_at=Subquery(messages.values("created_at")[:1]),
+            last_human_message_at=Subquery(human_messages.values("created_at")[:1]),
+            last_human_message_id=Subquery(human_messages.values("id")[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0019_chat_last_message_fields"),
+    ]
+
+    operations = [
+        migrations.RunPython(_backfill_last_message_fields, reverse_code=migrations.RunPython.noop),
+    ]
@@ -1,14 +1,18 @@
+from collections.abc import Iterator
 from enum import StrEnum
 from urllib.parse import quote
 
 from django.db import models
-from django.db.models import Q
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Greatest
 from django.utils.functional import classproperty
 from langchain_core.messages import BaseMessage, messages_from_dict
 
-from apps.annotations.models import Tag, TagCategories, TaggedModelMixin, UserCommentsMixin
+from apps.annotations.models import CustomTaggedItem, TagCategories, TaggedModelMixin, UserCommentsMixin
+from apps.annotations.tag_cache import tag_cache
 from apps.files.models import File
 from apps.teams.models import BaseTeamModel
+from apps.utils.django_db import iterate_newest_first
 from apps.utils.models import BaseModel
 
 
@@ -24,6 +28,13 @@ class Chat(BaseTeamModel, TaggedModelMixin, UserCommentsMixin):
     # must match or be greater than experiment name field
     name = models.CharField(max_length=128, default="Unnamed Chat")
     metadata = models.JSONField(default=dict)
+    # Denormalized pointers to the latest messages. These are kept up to date when messages are saved
+    # (see `ChatMessage.save`) so that session listings and event queries don't need to scan the messages.
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_human_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_human_message = models.ForeignKey(
+        "ChatMessage", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
 
     def get_metadata(self, key: MetadataKeys):
         return self.metadata.get(key, None)
@@ -31,22 +42,44 @@ class Chat(BaseTeamModel, TaggedModelMixin, UserCommentsMixin):
     def set_metadata(self, key: MetadataKeys, value, commit=True):
         self.metadata[key] = value
         if commit:
-            self.save()
+            # don't write back the last message pointers, which may have moved since the chat was loaded
+            self.save(update_fields=["metadata", "updated_at"])
+
+    @staticmethod
+    def refresh_last_message_fields(chats: models.QuerySet) -> int:
+        """Recompute the denormalized last message fields of the given chats from their messages.
+
+        This is needed when messages are written without calling `ChatMessage.save` e.g. with `bulk_create`.
+        """
+        messages = ChatMessage.objects.filter(chat_id=OuterRef("pk")).order_by("-created_at", "-id")
+        human_messages = messages.filter(message_type=ChatMessageType.HUMAN)
+        return chats.update(
+            last_message_at=Subquery(messages.values("created_at")[:1]),
+            last_human_message_at=Subquery(human_messages.values("created_at")[:1]),
+            last_human_message_id=Subquery(human_messages.values("id")[:1]),
+        )
 
     def get_langchain_messages(self) -> list[BaseMessage]:
         return messages_from_dict([m.to_langchain_dict() for m in self.messages.all()])
 
     def get_langchain_messages_until_summary(self) -> list[BaseMessage]:
-        messages = []
+        return list(reversed(list(self.iter_langchain_messages_until_summary())))
+
+    def iter_langchain_messages_until_summary(self) -> Iterator[BaseMessage]:
+        """Yields messages from newest to oldest, ending with the most recent summary (if any).
+        Messages are loaded lazily so callers that only need part of the history can stop early."""
         for message in self.message_iterator():
-            messages.append(message.to_langchain_dict())
+            yield message.to_langchain_message()
             if message.is_summary:
                 break
 
-        return messages_from_dict(list(reversed(messages)))
+    def get_last_summary_message(self) -> BaseMessage | None:
+        """Returns the most recent summary, i.e. the last message yielded by `iter_langchain_messages_until_summary`"""
+        message = self.messages.filter(summary__isnull=False).exclude(summary="").order_by("-created_at", "-id").first()
+        return message.get_summary_message().to_langchain_message() if message else None
 
     def message_iterator(self, with_summaries=True):
-        for message in self.messages.order_by("-created_at").iterator(100):
+        for message in iterate_newest_first(self.messages.all()):
             yield message
             if with_summaries and message.summary:
                 yield message.get_summary_message()
@@ -106,6 +139,7 @@ class ChatMessage(BaseModel, TaggedModelMixin, UserCommentsMixin):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [models.Index(fields=["chat", "created_at"])]
 
     @classmethod
     def make_summary_message(cls, message):
@@ -121,7 +155,41 @@ class ChatMessage(BaseModel, TaggedModelMixin, UserCommentsMixin):
     def save(self, *args, **kwargs):
         if self.is_summary:
             raise ValueError("Cannot save a summary message")
+        is_new = self._state.adding
         super().save(*args, **kwargs)
+        if is_new:
+            self._update_chat_last_message_fields([self])
+
+    @classmethod
+    def bulk_create_for_chat(cls, messages: list["ChatMessage"]) -> list["ChatMessage"]:
+        """Saves new messages belonging to the same chat with a single insert. Use this instead of `bulk_create`
+        so that the chat's last message pointers are updated."""
+        if not messages:
+            return messages
+        if len({message.chat_id for message in messages}) > 1:
+            raise ValueError("All messages must belong to the same chat")
+        messages = cls.objects.bulk_create(messages)
+        cls._update_chat_last_message_fields(messages)
+        return messages
+
+    @staticmethod
+    def _update_chat_last_message_fields(messages: list["ChatMessage"]):
+        """Advance the denormalized last message pointers on the chat in a single atomic update.
+        The pointers only ever move forward so concurrent or out of order saves can't regress them."""
+        latest = max(messages, key=lambda message: message.created_at)
+        updates = {"last_message_at": Greatest(F("last_message_at"), Value(latest.created_at))}
+        human_messages = [message for message in messages if message.message_type == ChatMessageType.HUMAN]
+        if human_messages:
+            latest_human = max(human_messages, key=lambda message: message.created_at)
+            created_at = Value(latest_human.created_at)
+            is_newer = Q(last_human_message_at__isnull=True) | Q(last_human_message_at__lte=latest_human.created_at)
+            updates["last_human_message_at"] = Case(When(is_newer, then=created_at), default=F("last_human_message_at"))
+            updates["last_human_message_id"] = Case(
+                When(is_newer, then=Value(latest_human.id)),
+                default=F("last_human_message_id"),
+                output_field=models.BigIntegerField(),
+            )
+        Chat.objects.filter(id=latest.chat_id).update(**updates)
 
     @property
     def trace_info(self):
@@ -199,27 +267,30 @@ class ChatMessage(BaseModel, TaggedModelMixin, UserCommentsMixin):
         return self.metadata.get(key, None)
 
     def add_system_tag(self, tag: str, tag_category: TagCategories):
-        tag, _ = Tag.objects.get_or_create(
-            name=tag,
-            team=self.chat.team,
-            is_system_tag=True,
-            category=tag_category,
-        )
+        tag = tag_cache.get_tag(self.chat.team, tag, tag_category)
         self.add_tag(tag, team=self.chat.team, added_by=None)
 
+    def add_system_tags_to_new_message(self, tags: list[tuple[str, TagCategories]]):
+        """Adds several system tags with a single insert. `tags` is a list of (name, category) tuples.
+        Only use this for messages that were just created since it doesn't check for existing tags."""
+        team = self.chat.team
+        tags_by_key = tag_cache.get_tags(team, tags)
+        CustomTaggedItem.bulk_add([(self, tags_by_key[key]) for key in dict.fromkeys(tags)], team=team)
+
     def add_version_tag(self, version_number: int, is_a_version: bool):
+        self.add_system_tag(
+            tag=self.get_version_tag_name(version_number, is_a_version), tag_category=TagCategories.EXPERIMENT_VERSION
+        )
+
+    @staticmethod
+    def get_version_tag_name(version_number: int, is_a_version: bool) -> str:
         tag = f"v{version_number}"
         if not is_a_version:
             tag = f"{tag}-unreleased"
-        self.add_system_tag(tag=tag, tag_category=TagCategories.EXPERIMENT_VERSION)
+        return tag
 
     def add_rating(self, tag: str):
-        tag, _ = Tag.objects.get_or_create(
-            name=tag,
-            team=self.chat.team,
-            is_system_tag=False,
-            category=TagCategories.RESPONSE_RATING,
-        )
+        tag = tag_cache.get_tag(self.chat.team, tag, TagCategories.RESPONSE_RATING, is_system_tag=False)
         self.add_tag(tag, team=self.chat.team, added_by=None)
 
     def rating(self) -> str | None:
@@ -4,13 +4,15 @@ from unittest import mock
 
 import pytest
 from langchain_core.language_models import BaseLanguageModel
-from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 
 from apps.chat.conversation import (
     SUMMARY_TOO_LARGE_ERROR_MESSAGE,
     _get_new_summary,
     _get_summary_tokens_with_context,
     compress_chat_history,
+    get_history_window,
+    get_message_token_counts,
     truncate_tokens,
 )
 from apps.chat.models import Chat, ChatMessage, ChatMessageType
@@ -270,3 +272,115 @@ def test_truncate_tokens():
     assert llm.get_num_tokens_from_messages(new_history) + input_message_tokens <= max_token_limit
     remaining_after_pruning = [{"content": "Another one"}, {"content": "Final message"}]
     assert new_history == remaining_after_pruning
+
+
+def test_message_token_counts_are_cached():
+    llm = FakeLlmSimpleTokenCount(responses=[])
+    messages = [HumanMessage("Hello there"), AIMessage("General Kenobi")]
+    assert get_message_token_counts(llm, messages) == (0, [3, 3])
+
+    with mock.patch.object(FakeLlmSimpleTokenCount, "get_num_tokens", side_effect=AssertionError("not cached")):
+        assert get_message_token_counts(llm, messages) == (0, [3, 3])
+
+
+def _exhaustible(messages, limit):
+    """Yields `messages` but fails if more than `limit` messages are consumed"""
+    for i, message in enumerate(messages):
+        if i >= limit:
+            raise AssertionError("Read more messages than needed")
+        yield message
+
+
+def test_history_window_max_history_length_stops_reading():
+    llm = FakeLlmSimpleTokenCount(responses=[])
+    messages = [HumanMessage(f"Hello {i}") for i in reversed(range(20))]
+    # one message past the window is read to check if there are older messages
+    window = get_history_window(
+        _exhaustible(messages, 6),
+        llm,
+        100,
+        keep_history_len=5,
+        history_mode=PipelineChatHistoryModes.MAX_HISTORY_LENGTH,
+    )
+    assert [message.content for message in window] == [f"Hello {i}" for i in range(15, 20)]
+
+
+@pytest.mark.parametrize(
+    ("history_mode", "keep_history_len"),
+    [(PipelineChatHistoryModes.MAX_HISTORY_LENGTH, 5), (PipelineChatHistoryModes.TRUNCATE_TOKENS, None)],
+)
+def test_history_window_includes_summary(history_mode, keep_history_len):
+    llm = FakeLlmSimpleTokenCount(responses=[])
+    summary = SystemMessage("Summary")
+    messages = [HumanMessage(f"Hello {i}") for i in reversed(range(20))] + [summary]
+    window = get_history_window(
+        iter(messages),
+        llm,
+        10,
+        keep_history_len=keep_history_len,
+        history_mode=history_mode,
+        get_summary_message=lambda: summary,
+    )
+    assert window[0] == summary
+    assert window[-1].content == "Hello 19"
+
+
+def test_history_window_summary_not_duplicated():
+    llm = FakeLlmSimpleTokenCount(responses=[])
+    messages = [HumanMessage("Hello"), SystemMessage("Summary")]
+    get_summary_message = mock.Mock()
+    window = get_history_window(
+        iter(messages),
+        llm,
+        100,
+        keep_history_len=5,
+        history_mode=PipelineChatHistoryModes.MAX_HISTORY_LENGTH,
+        get_summary_message=get_summary_message,
+    )
+    assert [message.content for message in window] == ["Summary", "Hello"]
+    assert not get_summary_message.called
+
+
+@mock.patch("apps.chat.conversation.HISTORY_WINDOW_BATCH_SIZE", 2)
+def test_history_window_truncate_tokens_stops_reading():
+    llm = FakeLlmSimpleTokenCount(responses=[])
+    # each message is 3 tokens
+    messages = [HumanMessage(f"Hello {i}") for i in reversed(range(20))]
+    window = get_history_window(
+        _exhaustible(messages, 5), llm, 10, history_mode=PipelineChatHistoryModes.TRUNCATE_TOKENS
+    )
+    # the last message in the window exceeds the limit and will be removed during truncation
+    assert [message.content for message in window] == [f"Hello {i}" for i in range(16, 20)]
+
+
+def test_compress_history_max_history_length_loads_window(chat, django_assert_num_queries):
+    ChatMessage.objects.bulk_create(
+        [ChatMessage(chat=chat, content=f"Hello {i}", message_type=ChatMessageType.HUMAN) for i in range(150)]
+    )
+    llm = FakeLlmSimpleTokenCount(responses=[])
+    # the window and the last summary
+    with django_assert_num_queries(2):
+        result = compress_chat_history(
+            chat,
+            llm,
+            100,
+            input_messages=[],
+            keep_history_len=5,
+            history_mode=PipelineChatHistoryModes.MAX_HISTORY_LENGTH,
+        )
+    assert [message.content for message in result] == [f"Hello {i}" for i in range(145, 150)]
+
+
+@pytest.mark.parametrize(
+    "history_mode", [PipelineChatHistoryModes.MAX_HISTORY_LENGTH, PipelineChatHistoryModes.TRUNCATE_TOKENS]
+)
+def test_compress_history_keeps_summary_outside_window(chat, history_mode):
+    messages = ChatMessage.objects.bulk_create(
+        [ChatMessage(chat=chat, content=f"Hello {i}", message_type=ChatMessageType.HUMAN) for i in range(150)]
+    )
+    ChatMessage.objects.filter(id=messages[10].id).update(summary="Summary of the first messages")
+    llm = FakeLlmSimpleTokenCount(responses=[])
+    result = compress_chat_history(chat, llm, 30, input_messages=[], keep_history_len=5, history_mode=history_mode)
+    assert result[0].type == "system"
+    assert result[0].content == "Summary of the first messages"
+    assert result[-1].content == "Hello 149"
@@ -1,7 +1,13 @@
+import importlib
+from functools import partial
+from unittest import mock
+
 import pytest
+from django.apps import apps
 
 from apps.annotations.models import TagCategories
-from apps.chat.models import ChatMessage, ChatMessageType
+from apps.chat.models import Chat, ChatMessage, ChatMessageType
+from apps.utils.django_db import iterate_newest_first
 from apps.utils.factories.assistants import OpenAiAssistantFactory
 from apps.utils.factories.experiment import ExperimentSessionFactory
 from apps.utils.factories.files import FileFactory
@@ -59,3 +65,84 @@ class TestChatMessage:
 
         assert chat_message1.tags.first().name == "v1"
         assert chat_message2.tags.first().name == "v1-unreleased"
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("page_size", [1, 2, 100])
+def test_message_iterator_pages(page_size):
+    session = ExperimentSessionFactory()
+    chat = session.chat
+    messages = ChatMessage.objects.bulk_create(
+        [ChatMessage(chat=chat, content=f"Hello {i}", message_type=ChatMessageType.HUMAN) for i in range(5)]
+    )
+    messages[2].summary = "Summary"
+    messages[2].save()
+
+    with mock.patch("apps.chat.models.iterate_newest_first", partial(iterate_newest_first, page_size=page_size)):
+        history = chat.get_langchain_messages_until_summary()
+    assert [message.content for message in history] == ["Summary", "Hello 2", "Hello 3", "Hello 4"]
+
+
+@pytest.mark.django_db()
+def test_last_message_fields_updated_on_save():
+    chat = ExperimentSessionFactory().chat
+    human_message = ChatMessage.objects.create(chat=chat, content="Hi", message_type=ChatMessageType.HUMAN)
+    ai_message = ChatMessage.objects.create(chat=chat, content="Hello", message_type=ChatMessageType.AI)
+
+    chat.refresh_from_db()
+    assert chat.last_message_at == ai_message.created_at
+    assert chat.last_human_message_at == human_message.created_at
+    assert chat.last_human_message == human_message
+
+    # updating an existing message doesn't move the pointers
+    human_message.content = "Hi there"
+    human_message.save()
+    chat.refresh_from_db()
+    assert chat.last_message_at == ai_message.created_at
+
+
+@pytest.mark.django_db()
+def test_refresh_last_message_fields():
+    chat = ExperimentSessionFactory().chat
+    human_message, ai_message = ChatMessage.objects.bulk_create(
+        [
+            ChatMessage(chat=chat, content="Hi", message_type=ChatMessageType.HUMAN),
+            ChatMessage(chat=chat, content="Hello", message_type=ChatMessageType.AI),
+        ]
+    )
+    chat.refresh_from_db()
+    assert chat.last_message_at is None
+
+    Chat.refresh_last_message_fields(Chat.objects.filter(id=chat.id))
+    chat.refresh_from_db()
+    assert chat.last_message_at == ai_message.created_at
+    assert chat.last_human_message == human_message
+
+
+@pytest.mark.django_db()
+def test_backfill_last_message_fields_migration():
+    chat = ExperimentSessionFactory().chat
+    human_message, ai_message = ChatMessage.objects.bulk_create(
+        [
+            ChatMessage(chat=chat, content="Hi", message_type=ChatMessageType.HUMAN),
+            ChatMessage(chat=chat, content="Hello", message_type=ChatMessageType.AI),
+        ]
+    )
+
+    migration = importlib.import_module("apps.chat.migrations.0020_backfill_chat_last_message_fields")
+    migration._backfill_last_message_fields(apps, None)
+    chat.refresh_from_db()
+    assert chat.last_message_at == ai_message.created_at
+    assert chat.last_human_message == human_message
+
+
+@pytest.mark.django_db()
+def test_set_metadata_keeps_last_message_fields():
+    chat = ExperimentSessionFactory().chat
+    stale_chat = Chat.objects.get(id=chat.id)
+    message = ChatMessage.objects.create(chat=chat, content="Hi", message_type=ChatMessageType.HUMAN)
+
+    stale_chat.set_metadata(Chat.MetadataKeys.OPENAI_THREAD_ID, "thread_123")
+    chat.refresh_from_db()
+    assert chat.get_metadata(Chat.MetadataKeys.OPENAI_THREAD_ID) == "thread_123"
+    assert chat.last_human_message == message
@@ -1,11 +1,12 @@
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, call, patch
 
 import pytest
 from langchain_core.messages import HumanMessage, SystemMessage
 
-from apps.chat.bots import TopicBot
+from apps.chat.bots import TopicBot, experiment_routes_cache
 from apps.chat.models import ChatMessageType
 from apps.experiments.models import ExperimentRoute
+from apps.service_providers.llm_service.runnables import create_experiment_runnable
 from apps.service_providers.models import TraceProvider
 from apps.utils.factories.assistants import OpenAiAssistantFactory
 from apps.utils.factories.experiment import ExperimentFactory, ExperimentSessionFactory
@@ -121,3 +122,41 @@ def _make_experiment_with_routing(with_default=True, assistant_children=False):
         ]
     )
     return router
+
+
+@pytest.mark.django_db()
+def test_only_the_selected_child_runnable_is_built():
+    experiment = _make_experiment_with_routing()
+    session = ExperimentSessionFactory(experiment=experiment)
+    fake_service = build_fake_llm_service(responses=["keyword3", "How can I help today?"], token_counts=[0])
+    with (
+        patch("apps.experiments.models.Experiment.get_llm_service", new=lambda x: fake_service),
+        patch("apps.chat.bots.create_experiment_runnable", wraps=create_experiment_runnable) as create_runnable,
+    ):
+        bot = TopicBot(session)
+        assert create_runnable.call_count == 1
+        bot.process_input("Hi")
+
+    child = ExperimentRoute.objects.get(parent=experiment, keyword="keyword3").child
+    assert [call.args[0] for call in create_runnable.call_args_list] == [experiment, child]
+    assert list(bot.child_chains) == ["keyword3"]
+
+
+@pytest.mark.django_db()
+def test_experiment_version_routes_are_cached():
+    experiment = _make_experiment_with_routing()
+    version = experiment.create_new_version()
+    experiment_routes_cache.clear()
+
+    routes = experiment_routes_cache.get(version)
+    assert list(routes.processors) == ["keyword1", "keyword2", "keyword3"]
+    assert routes.default_keyword == "keyword2"
+
+    with patch("apps.chat.bots.ExperimentRoutes.for_experiment") as for_experiment:
+        cached = experiment_routes_cache.get(version)
+        experiment_routes_cache.get(experiment)
+    # the working experiment's routes are always loaded
+    assert for_experiment.call_args_list == [call(experiment)]
+    assert cached.processors == routes.processors
+    # each lookup gets its own model instances
+    assert cached.processors["keyword1"] is not routes.processors["keyword1"]
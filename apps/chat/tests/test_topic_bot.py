@@ -1,12 +1,14 @@
+import threading
 from unittest import mock
 from unittest.mock import Mock, patch
 
 import pytest
 
 from apps.annotations.models import TagCategories
-from apps.chat.bots import TopicBot
+from apps.chat.bots import TopicBot, _get_first_unsafe
 from apps.chat.models import ChatMessage, ChatMessageType
-from apps.experiments.models import ExperimentRoute, ExperimentRouteType, ExperimentSession, SafetyLayer
+from apps.experiments.models import AgentTools, ExperimentRoute, ExperimentRouteType, ExperimentSession, SafetyLayer
+from apps.service_providers.llm_service.callbacks import STREAM_OUTPUT_TAG
 from apps.service_providers.models import TraceProvider
 from apps.utils.factories.experiment import ExperimentFactory, ExperimentSessionFactory
 from apps.utils.langchain import build_fake_llm_service, mock_llm
@@ -123,3 +125,104 @@ def test_tracing_service_reentry():
         # reload the session from the DB
         session = ExperimentSession.objects.get(id=session.id)
         _run_bot_with_wrapped_service(session, "response2")
+
+
+def _add_safety_layers(experiment, messages_to_review: str, count: int) -> list[SafetyLayer]:
+    layers = []
+    for i in range(count):
+        layer = SafetyLayer.objects.create(
+            prompt_text=f"Is this message safe? {i}",
+            team=experiment.team,
+            messages_to_review=messages_to_review,
+            default_response_to_user=f"Unsafe {i}",
+        )
+        experiment.safety_layers.add(layer)
+        layers.append(layer)
+    return layers
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("messages_to_review", ["human", "ai"])
+@patch("apps.chat.bots.notify_users_of_violation", Mock())
+def test_safety_checks_run_concurrently(messages_to_review):
+    session = ExperimentSessionFactory()
+    layers = _add_safety_layers(session.experiment, messages_to_review, count=3)
+    unsafe_prompts = {layers[1].prompt_text, layers[2].prompt_text}
+    # each check waits for all the others to start, which would time out if they ran one after another
+    barrier = threading.Barrier(len(layers), timeout=5)
+
+    def is_safe(safety_bot, input_str):
+        barrier.wait()
+        return safety_bot.prompt not in unsafe_prompts
+
+    with patch("apps.chat.bots.SafetyBot.is_safe", autospec=True, side_effect=is_safe), mock_llm(["response"]):
+        response = TopicBot(session).process_input("hi")
+
+    # the first layer in order that flags the message decides the response
+    assert response == "Unsafe 1"
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("is_safe", [True, False])
+@patch("apps.chat.bots.notify_users_of_violation", Mock())
+@patch("apps.chat.bots.Flag.get", Mock(return_value=Mock(is_active_for_team=Mock(return_value=True))))
+def test_human_safety_checks_with_response(is_safe):
+    session = ExperimentSessionFactory()
+    _add_safety_layers(session.experiment, "human", count=2)
+
+    def _check_history_held_back(safety_bots, futures):
+        # the response has been generated but the history is held back until the checks have passed
+        assert not session.chat.messages.exists()
+        return _get_first_unsafe(safety_bots, futures)
+
+    with (
+        patch("apps.chat.bots.SafetyBot.is_safe", return_value=is_safe),
+        patch("apps.chat.bots._get_first_unsafe", side_effect=_check_history_held_back) as get_first_unsafe_mock,
+        mock_llm(["response"]),
+    ):
+        bot = TopicBot(session)
+        response = bot.process_input("hi")
+    get_first_unsafe_mock.assert_called_once()
+
+    expected = "response" if is_safe else "Unsafe 0"
+    assert response == expected
+    messages = list(session.chat.messages.order_by("created_at").values_list("message_type", "content"))
+    assert messages == [(ChatMessageType.HUMAN, "hi"), (ChatMessageType.AI, expected)]
+    assert ChatMessage.objects.get(id=bot.get_ai_message_id()).content == expected
+
+
+@pytest.mark.django_db()
+@patch("apps.chat.bots.Flag.get", Mock(return_value=Mock(is_active_for_team=Mock(return_value=True))))
+def test_human_safety_checks_with_response_keep_chain_error():
+    """An error in a safety check doesn't hide the error raised while generating the response"""
+    session = ExperimentSessionFactory()
+    _add_safety_layers(session.experiment, "human", count=1)
+    with (
+        patch("apps.chat.bots.SafetyBot.is_safe", side_effect=Exception("safety check error")),
+        patch("apps.chat.bots.TopicBot._call_predict", side_effect=Exception("chain error")),
+        mock_llm(["response"]),
+    ):
+        bot = TopicBot(session)
+        with pytest.raises(Exception, match="chain error"):
+            bot.process_input("hi")
+    assert not session.chat.messages.exists()
+    assert bot.chain.history_manager.held_back_messages is None
+
+
+@pytest.mark.django_db()
+@patch("apps.chat.bots.Flag.get", Mock(return_value=Mock(is_active_for_team=Mock(return_value=True))))
+def test_human_safety_checks_wait_for_tools():
+    """Tools have side effects outside the history so the response isn't generated until the checks pass"""
+    session = ExperimentSessionFactory(experiment__tools=[AgentTools.ONE_OFF_REMINDER])
+    _add_safety_layers(session.experiment, "human", count=1)
+    with mock_llm(["response"]):
+        bot = TopicBot(session)
+    assert not bot._can_run_human_safety_checks_with_response()
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize(("tools", "expected_tags"), [([], [STREAM_OUTPUT_TAG]), ([AgentTools.ONE_OFF_REMINDER], [])])
+def test_agent_output_not_streamed(tools, expected_tags):
+    session = ExperimentSessionFactory(experiment__tools=tools)
+    bot = TopicBot(session)
+    assert bot._get_output_tags(bot.chain) == expected_tags
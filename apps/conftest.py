@@ -43,3 +43,14 @@ def _django_db_restore_serialized(request: pytest.FixtureRequest, django_db_keep
 @pytest.fixture(autouse=True, scope="session")
 def _set_env():
     os.environ["UNIT_TESTING"] = "True"
+
+
+def pytest_collection_modifyitems(config, items):
+    """Benchmarks don't test anything and timings are noisy when the whole suite runs, so they only run when
+    asked for with `RUN_BENCHMARKS=1 pytest -m benchmark -s`."""
+    if os.environ.get("RUN_BENCHMARKS"):
+        return
+    skip_benchmark = pytest.mark.skip(reason="set RUN_BENCHMARKS=1 to run benchmarks")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
@@ -9,8 +9,11 @@ class CustomActionOperationMixin:
     def get_custom_action_operations(self) -> QuerySet:
         if self.is_working_version:
             # only include operations that are still enabled by the action
-            return self.custom_action_operations.select_related("custom_action").filter(
+            return self.custom_action_operations.select_related("custom_action__auth_provider").filter(
                 custom_action__allowed_operations__contains=[F("operation_id")]
             )
+        elif "custom_action_operations" in getattr(self, "_prefetched_objects_cache", {}):
+            # e.g. an experiment version snapshot
+            return self.custom_action_operations.all()
         else:
-            return self.custom_action_operations.select_related("custom_action")
+            return self.custom_action_operations.select_related("custom_action__auth_provider")
@@ -7,16 +7,17 @@ from dateutil.relativedelta import relativedelta
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.db import models, transaction
-from django.db.models import F, Func, OuterRef, Q, Subquery, functions
+from django.db.models import DateTimeField, ExpressionWrapper, F, Func, OuterRef, Q, Subquery, Value, functions
 from django.utils import timezone
 
-from apps.chat.models import ChatMessage, ChatMessageType
+from apps.chat.models import Chat, ChatMessage
 from apps.events import actions
 from apps.events.const import TOTAL_FAILURES
 from apps.experiments.models import Experiment, ExperimentSession, VersionsMixin, VersionsObjectManagerMixin
 from apps.experiments.versioning import VersionDetails, VersionField
 from apps.teams.models import BaseTeamModel
 from apps.teams.utils import current_team
+from apps.utils.django_db import MakeInterval
 from apps.utils.models import BaseModel
 from apps.utils.slug import get_next_unique_id
 from apps.utils.time import pretty_date
@@ -38,7 +39,36 @@ class StaticTriggerObjectManager(VersionsObjectManagerMixin, models.Manager):
 
 
 class TimeoutTriggerObjectManager(VersionsObjectManagerMixin, models.Manager):
-    pass
+    def timed_out_trigger_sessions(self):
+        """Finds the timed out sessions for all active triggers in a single query. See
+        `TimeoutTrigger.timed_out_sessions` for the criteria. Stale sessions are excluded.
+
+        Returns a queryset of `(trigger_id, session_id)` tuples.
+        """
+        from apps.channels.models import ChannelPlatform
+
+        # All the trigger fields are referenced through annotations so that they share a single join
+        sessions = (
+            _get_sessions_with_timeout_stats()
+            .annotate(
+                trigger_id=F("experiment__timeout_triggers__id"),
+                trigger_is_archived=F("experiment__timeout_triggers__is_archived"),
+                trigger_total_num_triggers=F("experiment__timeout_triggers__total_num_triggers"),
+                trigger_time=ExpressionWrapper(
+                    Value(timezone.now()) - MakeInterval("secs", F("experiment__timeout_triggers__delay")),
+                    output_field=DateTimeField(),
+                ),
+            )
+            .filter(trigger_id__isnull=False, trigger_is_archived=False)
+            .filter(last_human_message_created_at__lt=F("trigger_time"))
+            .filter(Q(log_count__lt=F("trigger_total_num_triggers")) | Q(log_count__isnull=True))
+            .filter(
+                # Exclude stale sessions i.e. the channel has been repurposed to point to another experiment
+                Q(experiment_channel__platform__in=ChannelPlatform.team_global_platforms())
+                | Q(experiment_channel__experiment_id=F("experiment_id"))
+            )
+        )
+        return sessions.values_list("trigger_id", "id")
 
 
 class EventActionType(models.TextChoices):
@@ -119,6 +149,12 @@ class StaticTrigger(BaseModel, VersionsMixin):
     def trigger_type(self):
         return "StaticTrigger"
 
+    def save(self, *args, **kwargs):
+        from apps.events.static_triggers import clear_configured_trigger_types
+
+        super().save(*args, **kwargs)
+        clear_configured_trigger_types(self.experiment_id)
+
     def fire(self, session):
         try:
             result = ACTION_HANDLERS[self.action.action_type]().invoke(session, self.action)
@@ -130,8 +166,11 @@ class StaticTrigger(BaseModel, VersionsMixin):
 
     @transaction.atomic()
     def delete(self, *args, **kwargs):
+        from apps.events.static_triggers import clear_configured_trigger_types
+
         result = super().delete(*args, **kwargs)
         self.action.delete(*args, **kwargs)
+        clear_configured_trigger_types(self.experiment_id)
         return result
 
     @transaction.atomic()
@@ -199,77 +238,23 @@ class TimeoutTrigger(BaseModel, VersionsMixin):
         - The last human message was sent at a time earlier than the trigger time
         - There have been fewer trigger attempts than the total number defined by the trigger
         """
-        from apps.chat.tasks import STATUSES_FOR_COMPLETE_CHATS
-
         trigger_time = timezone.now() - timedelta(seconds=self.delay)
-
-        last_human_message_created_at = (
-            ChatMessage.objects.filter(
-                chat__experiment_session=OuterRef("pk"),
-                message_type=ChatMessageType.HUMAN,
-            )
-            .order_by("-created_at")
-            .values("created_at")[:1]
-        )
-        last_human_message_id = (
-            ChatMessage.objects.filter(
-                chat__experiment_session=OuterRef("session_id"),
-                message_type=ChatMessageType.HUMAN,
-            )
-            .order_by("-created_at")
-            .values("id")[:1]
-        )
-        log_count_for_last_message = (
-            EventLog.objects.filter(
-                session=OuterRef("pk"),
-                chat_message_id=Subquery(last_human_message_id),
-                status=EventLogStatusChoices.SUCCESS,
-            )
-            .annotate(
-                count=Func(F("chat_message_id"), function="Count")
-            )  # We don't use Count here because otherwise Django wants to do a group_by, which messes up the subquery: https://stackoverflow.com/a/69031027
-            .values("count")
-        )
-        failure_count_for_last_message = (
-            EventLog.objects.filter(
-                session=OuterRef("pk"),
-                chat_message_id=Subquery(last_human_message_id),
-                status=EventLogStatusChoices.FAILURE,
-            )
-            .annotate(count=Func(F("chat_message_id"), function="Count"))
-            .values("count")
-        )
-
         sessions = (
-            ExperimentSession.objects.filter(
-                experiment=self.experiment,
-                ended_at=None,
-            )
-            .exclude(status__in=STATUSES_FOR_COMPLETE_CHATS)
-            .annotate(
-                last_human_message_created_at=Subquery(last_human_message_created_at),
-                log_count=Subquery(log_count_for_last_message),
-                failure_count=Subquery(failure_count_for_last_message),
-            )
+            _get_sessions_with_timeout_stats()
+            .filter(experiment=self.experiment)
             .filter(
                 last_human_message_created_at__lt=trigger_time,
-                last_human_message_created_at__isnull=False,
             )  # The last message was received before the trigger time
             .filter(
                 Q(log_count__lt=self.total_num_triggers) | Q(log_count__isnull=True)
             )  # There were either no tries yet, or fewer tries than the required number for this message
-            .filter(
-                Q(failure_count__lt=TOTAL_FAILURES)
-                # There are still failures left
-            )
         )
         return sessions.select_related("experiment_channel", "experiment").all()
 
     def fire(self, session) -> str | None:
-        last_human_message = ChatMessage.objects.filter(
-            chat_id=session.chat_id,
-            message_type=ChatMessageType.HUMAN,
-        ).last()
+        last_human_message = (
+            Chat.objects.select_related("last_human_message").get(id=session.chat_id).last_human_message
+        )
 
         result = None
 
@@ -284,9 +269,9 @@ class TimeoutTrigger(BaseModel, VersionsMixin):
             )
 
         if not self._has_triggers_left(session, last_human_message):
-            from apps.events.tasks import enqueue_static_triggers
+            from apps.events.static_triggers import queue_static_trigger
 
-            enqueue_static_triggers.delay(session.id, StaticTriggerType.LAST_TIMEOUT)
+            queue_static_trigger(session, StaticTriggerType.LAST_TIMEOUT)
 
         return result
 
@@ -332,6 +317,48 @@ class TimeoutTrigger(BaseModel, VersionsMixin):
         )
 
 
+def _get_sessions_with_timeout_stats():
+    """Active sessions annotated with the timestamp of their last human message and the number of successful and
+    failed trigger attempts for that message. Sessions that have used up their failures are excluded."""
+    from apps.chat.tasks import STATUSES_FOR_COMPLETE_CHATS
+
+    log_count_for_last_message = (
+        EventLog.objects.filter(
+            session=OuterRef("pk"),
+            chat_message_id=OuterRef("chat__last_human_message_id"),
+            status=EventLogStatusChoices.SUCCESS,
+        )
+        .annotate(
+            count=Func(F("chat_message_id"), function="Count")
+        )  # We don't use Count here because otherwise Django wants to do a group_by, which messes up the subquery: https://stackoverflow.com/a/69031027
+        .values("count")
+    )
+    failure_count_for_last_message = (
+        EventLog.objects.filter(
+            session=OuterRef("pk"),
+            chat_message_id=OuterRef("chat__last_human_message_id"),
+            status=EventLogStatusChoices.FAILURE,
+        )
+        .annotate(count=Func(F("chat_message_id"), function="Count"))
+        .values("count")
+    )
+
+    return (
+        ExperimentSession.objects.filter(ended_at=None)
+        .exclude(status__in=STATUSES_FOR_COMPLETE_CHATS)
+        .annotate(
+            last_human_message_created_at=F("chat__last_human_message_at"),
+            log_count=Subquery(log_count_for_last_message),
+            failure_count=Subquery(failure_count_for_last_message),
+        )
+        .filter(last_human_message_created_at__isnull=False)
+        .filter(
+            Q(failure_count__lt=TOTAL_FAILURES)
+            # There are still failures left
+        )
+    )
+
+
 class ScheduledMessageManager(models.Manager):
     def get_messages_to_fire(self):
         return (
@@ -0,0 +1,79 @@
+"""Dispatching of static trigger events.
+
+Events are only sent to Celery when the session's experiment has a trigger for them. Events raised inside a
+`batch_static_triggers` block, such as during a single conversation turn, are sent as one task when the block exits.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.events.models import StaticTrigger, StaticTriggerType
+
+TRIGGER_TYPES_CACHE_TIMEOUT = 60 * 60
+
+_pending_events: ContextVar[list[tuple[int, str]] | None] = ContextVar("pending_static_trigger_events", default=None)
+
+
+def _get_trigger_types_cache_key(experiment_id: int) -> str:
+    return f"static_trigger_types:{experiment_id}"
+
+
+def get_configured_trigger_types(experiment_id: int) -> set[str]:
+    """Returns the types of the static triggers configured for the experiment"""
+    cache_key = _get_trigger_types_cache_key(experiment_id)
+    trigger_types = cache.get(cache_key)
+    if trigger_types is None:
+        trigger_types = set(
+            StaticTrigger.objects.filter(experiment_id=experiment_id).values_list("type", flat=True).distinct()
+        )
+        cache.set(cache_key, trigger_types, TRIGGER_TYPES_CACHE_TIMEOUT)
+    return trigger_types
+
+
+def clear_configured_trigger_types(experiment_id: int):
+    cache_key = _get_trigger_types_cache_key(experiment_id)
+    cache.delete(cache_key)
+    # clear it again once the change is committed in case another process cached the old types in the meantime
+    transaction.on_commit(lambda: cache.delete(cache_key))
+
+
+def queue_static_trigger(session, trigger_type: StaticTriggerType):
+    """Fires the static triggers of `trigger_type` for the session. Nothing is sent if the experiment doesn't have
+    any triggers of that type."""
+    from apps.events.tasks import fire_static_triggers
+
+    if trigger_type not in get_configured_trigger_types(session.experiment_id):
+        return
+
+    pending_events = _pending_events.get()
+    if pending_events is not None:
+        pending_events.append((session.id, trigger_type))
+    else:
+        fire_static_triggers.delay(session.id, [trigger_type])
+
+
+@contextmanager
+def batch_static_triggers():
+    """Collects the static trigger events raised inside the block and sends them as a single task per session
+    when the block exits. Nested blocks are part of the outermost batch."""
+    from apps.events.tasks import fire_static_triggers
+
+    if _pending_events.get() is not None:
+        yield
+        return
+
+    pending_events = []
+    token = _pending_events.set(pending_events)
+    try:
+        yield
+    finally:
+        _pending_events.reset(token)
+        trigger_types_by_session = defaultdict(list)
+        for session_id, trigger_type in pending_events:
+            trigger_types_by_session[session_id].append(trigger_type)
+        for session_id, trigger_types in trigger_types_by_session.items():
+            fire_static_triggers.delay(session_id, trigger_types)
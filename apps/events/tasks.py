@@ -1,5 +1,7 @@
 import logging
+from collections import defaultdict
 
+from celery import group
 from celery.app import shared_task
 
 from apps.events.models import ScheduledMessage, StaticTrigger, TimeoutTrigger
@@ -8,8 +10,23 @@ from apps.experiments.models import ExperimentSession
 logger = logging.getLogger("ocs.events")
 
 
+@shared_task(ignore_result=True)
+def fire_static_triggers(session_id, trigger_types: list[str]):
+    """Fires the session's static triggers for each event in `trigger_types`, in the order the events happened"""
+    session = ExperimentSession.objects.get(id=session_id)
+    triggers_by_type = defaultdict(list)
+    triggers = StaticTrigger.objects.filter(experiment_id=session.experiment_id, type__in=set(trigger_types))
+    for trigger in triggers.select_related("action").order_by("id"):
+        triggers_by_type[trigger.type].append(trigger)
+
+    for trigger_type in trigger_types:
+        for trigger in triggers_by_type[trigger_type]:
+            trigger.fire(session)
+
+
 @shared_task(ignore_result=True)
 def enqueue_static_triggers(session_id, trigger_type):
+    """Deprecated: use `apps.events.static_triggers.queue_static_trigger` instead"""
     session = ExperimentSession.objects.get(id=session_id)
 
     trigger_ids = StaticTrigger.objects.filter(experiment_id=session.experiment_id, type=trigger_type).values_list(
@@ -29,18 +46,13 @@ def fire_static_trigger(trigger_id, session_id):
 
 @shared_task(ignore_result=True)
 def enqueue_timed_out_events():
-    active_triggers = TimeoutTrigger.objects.all()
-    for trigger in active_triggers:
-        for session in trigger.timed_out_sessions():
-            if session.is_stale():
-                logger.warning(
-                    f"ExperimentChannel is pointing to experiment '{session.experiment.name}'"
-                    "whereas the current experiment session points to experiment"
-                    f"'{session.experiment.name}'"
-                )
-                continue
-            else:
-                fire_trigger.delay(trigger.id, session.id)
+    trigger_sessions = list(TimeoutTrigger.objects.timed_out_trigger_sessions())
+    if not trigger_sessions:
+        return
+
+    logger.info("Firing %d timed out triggers", len(trigger_sessions))
+    # one task per session so that a slow or failing action doesn't hold up the others
+    group(fire_trigger.s(trigger_id, session_id) for trigger_id, session_id in trigger_sessions).apply_async()
 
 
 @shared_task(ignore_result=True)
@@ -2,6 +2,7 @@ from datetime import timedelta
 from unittest import mock
 
 import pytest
+from django.core.cache import cache
 from django.test import override_settings
 from django.utils import timezone
 
@@ -13,6 +14,12 @@ from apps.events.models import (
     StaticTriggerType,
     TimeoutTrigger,
 )
+from apps.events.static_triggers import (
+    _get_trigger_types_cache_key,
+    batch_static_triggers,
+    get_configured_trigger_types,
+    queue_static_trigger,
+)
 from apps.events.views import _delete_event_view
 from apps.utils.factories.experiment import (
     ExperimentFactory,
@@ -27,17 +34,17 @@ def session():
 
 
 @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
-@mock.patch("apps.events.tasks.fire_static_trigger.run")
 @pytest.mark.django_db()
-def test_end_conversation_fires_event(mock_fire_trigger, session):
+def test_end_conversation_fires_event(session):
     static_trigger = StaticTrigger.objects.create(
         experiment=session.experiment,
         action=EventAction.objects.create(action_type=EventActionType.LOG),
         type=StaticTriggerType.CONVERSATION_END,
     )
-    session.end()
+    with mock.patch("apps.events.models.StaticTrigger.fire", autospec=True) as mock_fire:
+        session.end()
 
-    mock_fire_trigger.assert_called_with(static_trigger.id, session.id)
+    mock_fire.assert_called_once_with(static_trigger, session)
 
 
 @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
@@ -97,3 +104,81 @@ def test_delete():
     )
     static_trigger.refresh_from_db()
     assert static_trigger.is_archived, "The static trigger should be archived"
+
+
+@pytest.mark.django_db()
+@mock.patch("apps.events.tasks.fire_static_triggers.delay")
+def test_no_task_sent_without_configured_triggers(fire_static_triggers, session, django_capture_on_commit_callbacks):
+    queue_static_trigger(session, StaticTriggerType.NEW_HUMAN_MESSAGE)
+    fire_static_triggers.assert_not_called()
+
+    trigger = StaticTrigger.objects.create(
+        experiment=session.experiment,
+        action=EventAction.objects.create(action_type=EventActionType.LOG),
+        type=StaticTriggerType.NEW_HUMAN_MESSAGE,
+    )
+    assert get_configured_trigger_types(session.experiment_id) == {StaticTriggerType.NEW_HUMAN_MESSAGE}
+    queue_static_trigger(session, StaticTriggerType.NEW_HUMAN_MESSAGE)
+    fire_static_triggers.assert_called_once_with(session.id, [StaticTriggerType.NEW_HUMAN_MESSAGE])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        trigger.delete()
+    assert get_configured_trigger_types(session.experiment_id) == set()
+
+
+@pytest.mark.django_db()
+def test_configured_trigger_types_cleared_on_commit(session, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        StaticTrigger.objects.create(
+            experiment=session.experiment,
+            action=EventAction.objects.create(action_type=EventActionType.LOG),
+            type=StaticTriggerType.NEW_HUMAN_MESSAGE,
+        )
+        # another process reads the types before the trigger is committed
+        cache.set(_get_trigger_types_cache_key(session.experiment_id), set())
+    assert get_configured_trigger_types(session.experiment_id) == {StaticTriggerType.NEW_HUMAN_MESSAGE}
+
+
+@pytest.mark.django_db()
+@mock.patch("apps.events.tasks.fire_static_triggers.delay")
+def test_events_are_batched(fire_static_triggers, session):
+    for trigger_type in [StaticTriggerType.NEW_HUMAN_MESSAGE, StaticTriggerType.NEW_BOT_MESSAGE]:
+        StaticTrigger.objects.create(
+            experiment=session.experiment,
+            action=EventAction.objects.create(action_type=EventActionType.LOG),
+            type=trigger_type,
+        )
+
+    with batch_static_triggers():
+        queue_static_trigger(session, StaticTriggerType.NEW_HUMAN_MESSAGE)
+        with batch_static_triggers():
+            queue_static_trigger(session, StaticTriggerType.CONVERSATION_END)
+            queue_static_trigger(session, StaticTriggerType.NEW_BOT_MESSAGE)
+        fire_static_triggers.assert_not_called()
+
+    fire_static_triggers.assert_called_once_with(
+        session.id, [StaticTriggerType.NEW_HUMAN_MESSAGE, StaticTriggerType.NEW_BOT_MESSAGE]
+    )
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+@pytest.mark.django_db()
+def test_batched_triggers_fire_in_order(session):
+    triggers = {
+        trigger_type: StaticTrigger.objects.create(
+            experiment=session.experiment,
+            action=EventAction.objects.create(action_type=EventActionType.LOG),
+            type=trigger_type,
+        )
+        for trigger_type in [StaticTriggerType.NEW_BOT_MESSAGE, StaticTriggerType.NEW_HUMAN_MESSAGE]
+    }
+
+    with mock.patch("apps.events.models.StaticTrigger.fire", autospec=True) as mock_fire:
+        with batch_static_triggers():
+            queue_static_trigger(session, StaticTriggerType.NEW_HUMAN_MESSAGE)
+            queue_static_trigger(session, StaticTriggerType.NEW_BOT_MESSAGE)
+
+    assert mock_fire.call_args_list == [
+        mock.call(triggers[StaticTriggerType.NEW_HUMAN_MESSAGE], session),
+        mock.call(triggers[StaticTriggerType.NEW_BOT_MESSAGE], session),
+    ]
@@ -354,3 +354,32 @@ def test_delete():
     )
     timeout_trigger.refresh_from_db()
     assert timeout_trigger.is_archived, "The timeout trigger should be archived"
+
+
+@pytest.mark.django_db()
+def test_timed_out_trigger_sessions(session, experiment):
+    def _create_trigger(delay, **kwargs):
+        return TimeoutTrigger.objects.create(
+            experiment=experiment,
+            action=EventAction.objects.create(action_type=EventActionType.LOG),
+            delay=delay,
+            **kwargs,
+        )
+
+    short_trigger = _create_trigger(delay=5 * 60)
+    _create_trigger(delay=30 * 60)  # not timed out yet
+    _create_trigger(delay=5 * 60, is_archived=True)
+
+    stale_session = ExperimentSessionFactory(
+        experiment=experiment,
+        experiment_channel=ExperimentChannelFactory(experiment=ExperimentFactory(team=experiment.team)),
+    )
+
+    with freeze_time("2024-04-02") as frozen_time:
+        for experiment_session in [session, stale_session]:
+            ChatMessage.objects.create(
+                chat=experiment_session.chat, content="Hello", message_type=ChatMessageType.HUMAN
+            )
+
+        frozen_time.tick(delta=timedelta(minutes=15))
+        assert list(TimeoutTrigger.objects.timed_out_trigger_sessions()) == [(short_trigger.id, session.id)]
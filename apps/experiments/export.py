@@ -1,14 +1,60 @@
 import csv
+import gzip
 import io
 
+from django.db import models
+
 from apps.annotations.models import Tag, UserComment
+from apps.chat.models import ChatMessage
 from apps.experiments.filters import apply_dynamic_filters
 from apps.experiments.models import ExperimentSession
+from apps.utils.django_db import iterate_in_pages
+
+EXPORT_SESSION_BATCH_SIZE = 100
+EXPORT_MESSAGE_BATCH_SIZE = 1000
+
+EXPORT_HEADER = [
+    "Message ID",
+    "Message Date",
+    "Message Type",
+    "Message Content",
+    "Platform",
+    "Chat Tags",
+    "Chat Comments",
+    "Session ID",
+    "Session LLM",
+    "Experiment ID",
+    "Experiment Name",
+    "Participant Name",
+    "Participant Identifier",
+    "Participant Public ID",
+    "Message Tags",
+    "Message Comments",
+    "Trace ID",
+]
+
+
+class ExportFormat(models.TextChoices):
+    CSV = "csv", "CSV"
+    CSV_GZIP = "csv.gz", "CSV (gzip)"
+    PARQUET = "parquet", "Parquet"
+
+    @property
+    def content_type(self):
+        return {
+            ExportFormat.CSV: "text/csv",
+            ExportFormat.CSV_GZIP: "application/gzip",
+            ExportFormat.PARQUET: "application/vnd.apache.parquet",
+        }[self]
+
 
+def _get_tag_names(tags: list[Tag]) -> list[str]:
+    return [t.name for t in tags]
 
-def _format_tags(tags: list[Tag]) -> str:
-    """Returns `tags` parsed into a single string in the format 'tag1, tag2, tag3'"""
-    return ", ".join([t.name for t in tags])
+
+def _format_tags(tag_names: list[str]) -> str:
+    """Returns `tag_names` joined into a single string in the format 'tag1, tag2, tag3'"""
+    return ", ".join(tag_names)
 
 
 def _format_comments(user_comments: list[UserComment]) -> str:
@@ -34,62 +80,129 @@ def get_filtered_sessions(request, experiment, query_params, include_api=False):
     return sessions_queryset
 
 
-def filtered_export_to_csv(experiment, sessions_queryset):
-    csv_in_memory = io.StringIO()
-    writer = csv.writer(csv_in_memory, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL)
+def filtered_export_to_csv(experiment, sessions_queryset, csv_file=None, progress_callback=None):
+    """Write the messages of the filtered sessions to `csv_file` as CSV.
+
+    Sessions are read in batches and their messages are fetched by keyset pagination so that memory use
+    doesn't grow with the size of the export. `progress_callback` is called with the number of sessions
+    exported after each batch.
+    """
+    if csv_file is None:
+        csv_file = io.StringIO()
+    writer = csv.writer(csv_file, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL)
+    writer.writerow(EXPORT_HEADER)
+    for row in iter_export_rows(experiment, sessions_queryset, progress_callback):
+        writer.writerow([_format_tags(value) if isinstance(value, list) else value for value in row])
+    return csv_file
+
+
+def filtered_export_to_parquet(experiment, sessions_queryset, parquet_file, progress_callback=None):
+    """Write the messages of the filtered sessions to `parquet_file` (a binary file object) as Parquet.
 
-    queryset = sessions_queryset.prefetch_related(
-        "chat",
-        "chat__messages",
-        "participant",
-        "experiment_channel",
-        "chat__tags",
-        "chat__messages__tags",
-        "chat__messages__comments",
-        "chat__messages__comments__user",
+    Dates, ids and tags are stored as typed columns. Rows are written one row group at a time so
+    memory use is bounded by `EXPORT_MESSAGE_BATCH_SIZE`.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ("Message ID", pa.int64()),
+            ("Message Date", pa.timestamp("us", tz="UTC")),
+            ("Message Type", pa.string()),
+            ("Message Content", pa.string()),
+            ("Platform", pa.string()),
+            ("Chat Tags", pa.list_(pa.string())),
+            ("Chat Comments", pa.string()),
+            ("Session ID", pa.string()),
+            ("Session LLM", pa.string()),
+            ("Experiment ID", pa.string()),
+            ("Experiment Name", pa.string()),
+            ("Participant Name", pa.string()),
+            ("Participant Identifier", pa.string()),
+            ("Participant Public ID", pa.string()),
+            ("Message Tags", pa.list_(pa.string())),
+            ("Message Comments", pa.string()),
+            ("Trace ID", pa.string()),
+        ]
+    )
+
+    def _write_batch(rows):
+        columns = [pa.array(column, type=field.type) for column, field in zip(zip(*rows), schema, strict=True)]
+        writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+
+    with pq.ParquetWriter(parquet_file, schema, compression="snappy") as writer:
+        rows = []
+        for row in iter_export_rows(experiment, sessions_queryset, progress_callback):
+            rows.append(row)
+            if len(rows) >= EXPORT_MESSAGE_BATCH_SIZE:
+                _write_batch(rows)
+                rows = []
+        if rows:
+            _write_batch(rows)
+    return parquet_file
+
+
+def write_export(experiment, sessions_queryset, export_format: ExportFormat, export_file, progress_callback=None):
+    """Write an export of the filtered sessions in `export_format` to the binary file object `export_file`"""
+    if export_format == ExportFormat.PARQUET:
+        filtered_export_to_parquet(experiment, sessions_queryset, export_file, progress_callback)
+        return
+
+    if export_format == ExportFormat.CSV_GZIP:
+        output = gzip.GzipFile(fileobj=export_file, mode="wb")
+    else:
+        output = export_file
+    csv_file = io.TextIOWrapper(output, encoding="utf-8", newline="")
+    filtered_export_to_csv(experiment, sessions_queryset, csv_file, progress_callback)
+    csv_file.flush()
+    csv_file.detach()
+    if output is not export_file:
+        output.close()
+
+
+def iter_export_rows(experiment, sessions_queryset, progress_callback=None):
+    """Yields one row per message of the filtered sessions. Tag columns are lists of tag names."""
+    llm_provider_model_name = experiment.get_llm_provider_model_name(raises=False)
+    sessions_queryset = sessions_queryset.select_related("chat", "participant", "experiment_channel").prefetch_related(
+        "chat__tags", "chat__comments__user"
     )
-    header = [
-        "Message ID",
-        "Message Date",
-        "Message Type",
-        "Message Content",
-        "Platform",
-        "Chat Tags",
-        "Chat Comments",
-        "Session ID",
-        "Session LLM",
-        "Experiment ID",
-        "Experiment Name",
-        "Participant Name",
-        "Participant Identifier",
-        "Participant Public ID",
-        "Message Tags",
-        "Message Comments",
-        "Trace ID",
+    exported_sessions = 0
+    for sessions in iterate_in_pages(sessions_queryset, ordering=["id"], page_size=EXPORT_SESSION_BATCH_SIZE):
+        sessions_by_chat_id = {session.chat_id: session for session in sessions}
+        messages_queryset = ChatMessage.objects.filter(chat_id__in=sessions_by_chat_id).prefetch_related(
+            "tags", "comments__user"
+        )
+        for messages in iterate_in_pages(
+            messages_queryset, ordering=["chat_id", "created_at", "id"], page_size=EXPORT_MESSAGE_BATCH_SIZE
+        ):
+            for message in messages:
+                session = sessions_by_chat_id[message.chat_id]
+                yield _get_message_row(experiment, llm_provider_model_name, session, message)
+
+        exported_sessions += len(sessions)
+        if progress_callback:
+            progress_callback(exported_sessions)
+
+
+def _get_message_row(experiment, llm_provider_model_name, session, message) -> list:
+    trace_id = message.trace_info.get("trace_id", "") if message.trace_info else ""
+    return [
+        message.id,
+        message.created_at,
+        message.message_type,
+        message.content,
+        session.get_platform_name(),
+        _get_tag_names(session.chat.tags.all()),
+        _format_comments(session.chat.comments.all()),
+        str(session.external_id),
+        llm_provider_model_name,
+        str(experiment.public_id),
+        experiment.name,
+        session.participant.name,
+        session.participant.identifier,
+        str(session.participant.public_id),
+        _get_tag_names(message.tags.all()),
+        _format_comments(message.comments.all()),
+        trace_id,
     ]
-    writer.writerow(header)
-
-    for session in queryset:
-        for message in session.chat.messages.all():
-            trace_id = message.trace_info.get("trace_id", "") if message.trace_info else ""
-            row = [
-                message.id,
-                message.created_at,
-                message.message_type,
-                message.content,
-                session.get_platform_name(),
-                _format_tags(message.chat.tags.all()),
-                _format_comments(message.chat.comments.all()),
-                session.external_id,
-                experiment.get_llm_provider_model_name(raises=False),
-                experiment.public_id,
-                experiment.name,
-                session.participant.name,
-                session.participant.identifier,
-                session.participant.public_id,
-                _format_tags(message.tags.all()),
-                _format_comments(message.comments.all()),
-                trace_id,
-            ]
-            writer.writerow(row)
-    return csv_in_memory
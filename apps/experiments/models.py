@@ -199,10 +199,10 @@ class ExperimentObjectManager(VersionsObjectManagerMixin, AuditingManager):
         if family_member.is_default_version:
             return family_member
 
+        from apps.experiments.snapshots import experiment_snapshots
+
         working_version_id = family_member.working_version_id or family_member.id
-        experiment = self.filter(
-            working_version_id=working_version_id, is_default_version=True, team_id=family_member.team_id
-        ).first()
+        experiment = experiment_snapshots.get_default_version(working_version_id, family_member.team_id)
         return experiment if experiment else family_member
 
 
@@ -841,7 +841,13 @@ class Experiment(BaseTeamModel, VersionsMixin, CustomActionOperationMixin):
             return working_version.default_version
         elif working_version.version_number == version:
             return working_version
-        return working_version.versions.get(version_number=version)
+
+        from apps.experiments.snapshots import experiment_snapshots
+
+        experiment = experiment_snapshots.get_version(working_version.id, working_version.team_id, version)
+        if experiment is None:
+            raise Experiment.DoesNotExist(f"Version {version} of experiment {working_version.id} does not exist")
+        return experiment
 
     @property
     def tools_enabled(self):
@@ -978,8 +984,11 @@ class Experiment(BaseTeamModel, VersionsMixin, CustomActionOperationMixin):
         Archive the experiment and all versions in the case where this is the working version. The linked assistant and
         pipeline for the working version should not be archived.
         """
+        from apps.events.static_triggers import clear_configured_trigger_types
+
         super().archive()
         self.static_triggers.update(is_archived=True)
+        clear_configured_trigger_types(self.id)
 
         if self.is_working_version:
             self.delete_experiment_channels()
@@ -1575,14 +1584,7 @@ class ExperimentSessionObjectManager(models.Manager):
         return self.filter(participant__identifier=chat_id)
 
     def with_last_message_created_at(self):
-        last_message_created_at = (
-            ChatMessage.objects.filter(
-                chat__experiment_session=models.OuterRef("pk"),
-            )
-            .order_by("-created_at")
-            .values("created_at")[:1]
-        )
-        return self.annotate(last_message_created_at=models.Subquery(last_message_created_at))
+        return self.annotate(last_message_created_at=F("chat__last_message_at"))
 
 
 class ExperimentSession(BaseTeamModel):
@@ -1710,9 +1712,9 @@ class ExperimentSession(BaseTeamModel):
             self.save()
         if commit and propagate:
             from apps.events.models import StaticTriggerType
-            from apps.events.tasks import enqueue_static_triggers
+            from apps.events.static_triggers import queue_static_trigger
 
-            enqueue_static_triggers.delay(self.id, StaticTriggerType.CONVERSATION_END)
+            queue_static_trigger(self, StaticTriggerType.CONVERSATION_END)
 
     def ad_hoc_bot_message(self, instruction_prompt: str, fail_silently=True, use_experiment: Experiment | None = None):
         """Sends a bot message to this session. The bot message will be crafted using `instruction_prompt` and
@@ -1,10 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from apps.custom_actions.models import CustomAction
+from apps.service_providers.models import AuthProvider, LlmProvider, LlmProviderModel, TraceProvider, VoiceProvider
 from apps.teams.models import Team
 
 from .const import DEFAULT_CONSENT_TEXT
-from .models import ConsentForm
+from .models import ConsentForm, Experiment
+from .snapshots import experiment_snapshots
 
 
 @receiver(post_save, sender=Team)
@@ -22,3 +25,20 @@ def create_default_consent_for_team(team):
             "consent_text": DEFAULT_CONSENT_TEXT,
         },
     )
+
+
+@receiver([post_save, post_delete], sender=Experiment)
+def clear_experiment_snapshots(sender, instance, **kwargs):
+    experiment_snapshots.invalidate_family(instance.working_version_id or instance.id)
+
+
+def clear_team_experiment_snapshots(sender, instance, **kwargs):
+    team_id = instance.id if sender is Team else instance.team_id
+    if team_id:
+        experiment_snapshots.invalidate_team(team_id)
+
+
+# Experiment snapshots include these objects, which aren't versioned
+for model in (Team, LlmProvider, LlmProviderModel, VoiceProvider, TraceProvider, AuthProvider, CustomAction):
+    post_save.connect(clear_team_experiment_snapshots, sender=model, dispatch_uid=f"experiment_snapshots_{model}")
+    post_delete.connect(clear_team_experiment_snapshots, sender=model, dispatch_uid=f"experiment_snapshots_{model}")
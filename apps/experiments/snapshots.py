@@ -0,0 +1,192 @@
+"""Cached snapshots of published experiment versions.
+
+Experiment versions can't be edited, so the configuration needed to build a bot for a version (the experiment and
+its providers, models, source material, safety layers etc.) is loaded once and cached, pickled, in Redis and in
+process.
+
+Provider configs hold decrypted credentials once loaded so the providers are left out of the snapshots stored in
+Redis. They are loaded from the database, by ID, when a snapshot is read from Redis.
+
+The cache keys include a generation token for the experiment family and one for the team. The family token
+changes whenever any experiment in the family is saved, e.g. when the working version is saved or a new version is
+published. The team token changes when one of the team's providers is saved. Old snapshots are never read again and
+expire or get evicted.
+"""
+
+import logging
+import pickle
+import threading
+from collections import OrderedDict, defaultdict
+from collections.abc import Iterator
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import models, transaction
+
+from apps.experiments.models import Experiment
+
+logger = logging.getLogger("ocs.experiments")
+
+SNAPSHOT_CACHE_TIMEOUT = 60 * 60 * 24
+
+SNAPSHOT_SELECT_RELATED = [
+    "team",
+    "working_version",
+    "llm_provider",
+    "llm_provider_model",
+    "assistant__llm_provider",
+    "assistant__llm_provider_model",
+    "pipeline",
+    "source_material",
+    "consent_form",
+    "pre_survey",
+    "post_survey",
+    "voice_provider",
+    "synthetic_voice__voice_provider",
+    "trace_provider",
+]
+
+# relations to models with encrypted configs. These are only stored in Redis as IDs.
+SNAPSHOT_PROVIDER_RELATIONS = [
+    "llm_provider",
+    "assistant__llm_provider",
+    "voice_provider",
+    "synthetic_voice__voice_provider",
+    "trace_provider",
+]
+
+
+def _get_family_generation_key(working_experiment_id: int) -> str:
+    return f"experiment_snapshot_generation:{working_experiment_id}"
+
+
+def _get_team_generation_key(team_id: int) -> str:
+    return f"experiment_snapshot_generation:team:{team_id}"
+
+
+class ExperimentSnapshotCache:
+    def __init__(self, maxsize=256) -> None:
+        self.maxsize = maxsize
+        self.snapshots: OrderedDict[str, bytes] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_default_version(self, working_experiment_id: int, team_id: int) -> Experiment | None:
+        """Returns the published version of the experiment family, or `None` if no version has been published"""
+        return self._get(working_experiment_id, team_id, Experiment.DEFAULT_VERSION_NUMBER)
+
+    def get_version(self, working_experiment_id: int, team_id: int, version_number: int) -> Experiment | None:
+        return self._get(working_experiment_id, team_id, version_number)
+
+    def invalidate_family(self, working_experiment_id: int):
+        self._bump_generation(_get_family_generation_key(working_experiment_id))
+
+    def invalidate_team(self, team_id: int):
+        self._bump_generation(_get_team_generation_key(team_id))
+
+    def clear(self):
+        with self.lock:
+            self.snapshots.clear()
+
+    def _bump_generation(self, key: str):
+        cache.set(key, uuid4().hex, None)
+        # readers in other processes may have cached what they saw before the change was committed
+        transaction.on_commit(lambda: cache.set(key, uuid4().hex, None))
+
+    def _get_generations(self, working_experiment_id: int, team_id: int) -> tuple[str, str]:
+        keys = [_get_family_generation_key(working_experiment_id), _get_team_generation_key(team_id)]
+        generations = cache.get_many(keys)
+        for key in keys:
+            if key not in generations:
+                cache.add(key, uuid4().hex, None)
+                generations[key] = cache.get(key)
+        return generations[keys[0]], generations[keys[1]]
+
+    def _get(self, working_experiment_id: int, team_id: int, version_number: int) -> Experiment | None:
+        family_generation, team_generation = self._get_generations(working_experiment_id, team_id)
+        key = f"experiment_snapshot:{working_experiment_id}:{version_number}:{family_generation}:{team_generation}"
+        with self.lock:
+            data = self.snapshots.get(key)
+            if data is not None:
+                self.snapshots.move_to_end(key)
+
+        if data is None:
+            if (shared_data := cache.get(key)) is not None:
+                experiment = pickle.loads(shared_data)
+                _load_providers(experiment)
+                data = pickle.dumps(experiment)
+            else:
+                logger.debug("Building snapshot of version %s of experiment %s", version_number, working_experiment_id)
+                experiment = self._load(working_experiment_id, team_id, version_number)
+                data = pickle.dumps(experiment)
+                _clear_providers(experiment)
+                cache.set(key, pickle.dumps(experiment), SNAPSHOT_CACHE_TIMEOUT)
+            with self.lock:
+                self.snapshots[key] = data
+                while len(self.snapshots) > self.maxsize:
+                    self.snapshots.popitem(last=False)
+
+        # each caller gets its own copy of the instances
+        return pickle.loads(data)
+
+    def _load(self, working_experiment_id: int, team_id: int, version_number: int) -> Experiment | None:
+        from apps.custom_actions.models import CustomActionOperation
+
+        queryset = Experiment.objects.filter(working_version_id=working_experiment_id, team_id=team_id)
+        if version_number == Experiment.DEFAULT_VERSION_NUMBER:
+            queryset = queryset.filter(is_default_version=True)
+        else:
+            queryset = queryset.filter(version_number=version_number)
+        return (
+            queryset.select_related(*SNAPSHOT_SELECT_RELATED)
+            .prefetch_related(
+                "safety_layers",
+                models.Prefetch(
+                    "custom_action_operations",
+                    queryset=CustomActionOperation.objects.select_related("custom_action__auth_provider"),
+                ),
+            )
+            .first()
+        )
+
+
+def _get_provider_relations(experiment: Experiment | None) -> Iterator[tuple[models.Model, models.ForeignKey]]:
+    """Yields the instances in the snapshot that refer to a provider along with the field that refers to it"""
+    if experiment is None:
+        return
+
+    for relation in SNAPSHOT_PROVIDER_RELATIONS:
+        *path, field_name = relation.split("__")
+        instance = experiment
+        for name in path:
+            instance = instance._state.fields_cache.get(name)
+            if instance is None:
+                break
+        else:
+            yield instance, instance._meta.get_field(field_name)
+
+    for operation in experiment.custom_action_operations.all():
+        custom_action = operation.custom_action
+        yield custom_action, custom_action._meta.get_field("auth_provider")
+
+
+def _clear_providers(experiment: Experiment | None):
+    for instance, field in _get_provider_relations(experiment):
+        instance._state.fields_cache.pop(field.name, None)
+
+
+def _load_providers(experiment: Experiment | None):
+    relations = [
+        (instance, field)
+        for instance, field in _get_provider_relations(experiment)
+        if getattr(instance, field.attname) is not None
+    ]
+    ids_by_model = defaultdict(set)
+    for instance, field in relations:
+        ids_by_model[field.related_model].add(getattr(instance, field.attname))
+    providers = {model: model.objects.in_bulk(ids) for model, ids in ids_by_model.items()}
+    for instance, field in relations:
+        if provider := providers[field.related_model].get(getattr(instance, field.attname)):
+            field.set_cached_value(instance, provider)
+
+
+experiment_snapshots = ExperimentSnapshotCache()
@@ -1,39 +1,60 @@
 import logging
+import tempfile
 import time
 
 from celery.app import shared_task
-from django.core.files.base import ContentFile
+from celery.signals import task_postrun
+from django.core.files.base import File as DjangoFile
 from django.utils import timezone
 from field_audit.models import AuditAction
 from langchain_core.messages import AIMessage, HumanMessage
 from taskbadger.celery import Task as TaskbadgerTask
 
+from apps.assistants.models import OpenAiAssistant
+from apps.assistants.sync import push_assistant_files_to_openai
 from apps.channels.datamodels import Attachment, BaseMessage
 from apps.chat.bots import create_conversation
 from apps.chat.channels import WebChannel
-from apps.experiments.export import filtered_export_to_csv, get_filtered_sessions
+from apps.experiments.export import ExportFormat, get_filtered_sessions, write_export
 from apps.experiments.models import Experiment, ExperimentSession, PromptBuilderHistory, SourceMaterial
 from apps.files.models import File
 from apps.service_providers.models import LlmProvider, LlmProviderModel
 from apps.teams.utils import current_team
 from apps.users.models import CustomUser
-from apps.utils.taskbadger import update_taskbadger_data
+from apps.utils.task_notifications import notify_task_complete
+from apps.utils.taskbadger import update_taskbadger_data, update_taskbadger_progress
 
 logger = logging.getLogger("ocs.experiments")
 
 
 @shared_task(bind=True, base=TaskbadgerTask)
-def async_export_chat(self, experiment_id: int, query_params: dict, include_api: bool) -> dict:
+def async_export_chat(
+    self, experiment_id: int, query_params: dict, include_api: bool, export_format: str = ExportFormat.CSV
+) -> dict:
+    export_format = ExportFormat(export_format)
     experiment = Experiment.objects.get(id=experiment_id)
     filtered_sessions = get_filtered_sessions(self.request, experiment, query_params, include_api)
-    csv_in_memory = filtered_export_to_csv(experiment, filtered_sessions)
-    filename = f"{experiment.name} Chat Export {timezone.now().strftime('%Y-%m-%d_%H-%M-%S')}.csv"
-    file_obj = File.objects.create(
-        name=filename,
-        team=experiment.team,
-        content_type="text/csv",
-        file=ContentFile(csv_in_memory.getvalue().encode("utf-8"), name=filename),
-    )
+    session_count = filtered_sessions.count()
+    update_taskbadger_progress(self, 0, session_count)
+    filename = f"{experiment.name} Chat Export {timezone.now().strftime('%Y-%m-%d_%H-%M-%S')}.{export_format.value}"
+    # Rows are streamed to a temporary file on disk which the storage backend then uploads in chunks
+    with tempfile.TemporaryFile() as export_file:
+        write_export(
+            experiment,
+            filtered_sessions,
+            export_format,
+            export_file,
+            progress_callback=lambda exported: update_taskbadger_progress(self, exported, session_count),
+        )
+        content_size = export_file.tell()
+        export_file.seek(0)
+        file_obj = File.objects.create(
+            name=filename,
+            team=experiment.team,
+            content_type=export_format.content_type,
+            content_size=content_size,
+            file=DjangoFile(export_file, name=filename),
+        )
     return {"file_id": file_obj.id}
 
 
@@ -44,11 +65,35 @@ def async_create_experiment_version(
     try:
         experiment = Experiment.objects.prefetch_related("assistant", "pipeline").get(id=experiment_id)
         with current_team(experiment.team):
+            # The version is created in a transaction so upload the assistant files first. Otherwise, the saved
+            # uploads are rolled back if creating the version fails and a retry uploads every file again.
+            for assistant in _get_working_assistants(experiment):
+                push_assistant_files_to_openai(assistant)
             experiment.create_new_version(version_description, make_default)
     finally:
         Experiment.objects.filter(id=experiment_id).update(create_version_task_id="", audit_action=AuditAction.AUDIT)
 
 
+def _get_working_assistants(experiment: Experiment) -> list[OpenAiAssistant]:
+    """Returns the working assistants that are versioned along with the experiment, including those of its pipeline
+    and its child experiments"""
+    from apps.pipelines.nodes.nodes import AssistantNode
+
+    assistants = []
+    if experiment.assistant and experiment.assistant.is_working_version:
+        assistants.append(experiment.assistant)
+    if experiment.pipeline:
+        assistant_ids = [
+            node.params["assistant_id"]
+            for node in experiment.pipeline.node_set.filter(type=AssistantNode.__name__)
+            if node.params.get("assistant_id")
+        ]
+        assistants.extend(OpenAiAssistant.objects.filter(id__in=assistant_ids, working_version__isnull=True))
+    for route in experiment.child_links.select_related("child"):
+        assistants.extend(_get_working_assistants(route.child))
+    return list({assistant.id: assistant for assistant in assistants}.values())
+
+
 @shared_task(bind=True, base=TaskbadgerTask)
 def get_response_for_webchat_task(
     self, experiment_session_id: int, experiment_id: int, message_text: str, attachments: list | None = None
@@ -84,6 +129,14 @@ def get_response_for_webchat_task(
     return response
 
 
+@task_postrun.connect
+def notify_webchat_response_ready(sender=None, task_id=None, **kwargs):
+    """Let clients that are waiting for the web chat response know that it is ready. This is sent after
+    the task result has been stored so it can be read as soon as the notification is received."""
+    if sender is not None and sender.name == get_response_for_webchat_task.name:
+        notify_task_complete(task_id)
+
+
 @shared_task
 def get_prompt_builder_response_task(team_id: int, user_id, data_dict: dict) -> dict[str, str | int]:
     llm_service = LlmProvider.objects.get(id=data_dict["provider"]).get_llm_service()
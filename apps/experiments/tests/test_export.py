@@ -1,11 +1,14 @@
 import csv
+import gzip
 import io
-from unittest.mock import Mock, patch
+from unittest.mock import patch
 
+import pandas as pd
 import pytest
 
+from apps.annotations.models import Tag
 from apps.chat.models import ChatMessage, ChatMessageType
-from apps.experiments.export import filtered_export_to_csv
+from apps.experiments.export import EXPORT_HEADER, ExportFormat, filtered_export_to_csv, write_export
 from apps.utils.factories.channels import ExperimentChannelFactory
 from apps.utils.factories.experiment import ExperimentFactory, ExperimentSessionFactory
 
@@ -81,46 +84,20 @@ def test_filtered_export_with_mocked_filter(mock_get_filtered_sessions, session_
             assert len(matching_rows) > 0, f"Message for session {i} not found in CSV"
 
 
+@pytest.mark.django_db()
 def test_trace_id_export():
-    # Mock experiment and session
-    experiment = Mock(
-        public_id="exp123", name="Test Experiment", get_llm_provider_model_name=Mock(return_value="test-llm")
-    )
-    session = Mock(
-        external_id="session123",
-        get_platform_name=Mock(return_value="TestPlatform"),
-        participant=Mock(name="Test Participant", identifier="participant123", public_id="public123"),
-        chat=Mock(tags=Mock(all=Mock(return_value=[])), comments=Mock(all=Mock(return_value=[]))),
+    session = ExperimentSessionFactory()
+    ChatMessage.objects.create(
+        chat=session.chat,
+        content="Hello",
+        message_type=ChatMessageType.HUMAN,
+        metadata={"trace_info": {"trace_id": "trace123"}},
     )
-
-    session.chat.messages.all.return_value = [
-        Mock(
-            id="msg1",
-            message_type="human",
-            content="Hello",
-            metadata={"trace_info": {"trace_id": "trace123"}},
-            trace_info={"trace_id": "trace123"},
-            tags=Mock(all=Mock(return_value=[])),
-            comments=Mock(all=Mock(return_value=[])),
-            chat=session.chat,
-        ),
-        Mock(
-            id="msg2",
-            message_type="ai",
-            content="Hi",
-            metadata={},
-            trace_info=None,
-            tags=Mock(all=Mock(return_value=[])),
-            comments=Mock(all=Mock(return_value=[])),
-            chat=session.chat,
-        ),
-    ]
+    ChatMessage.objects.create(chat=session.chat, content="Hi", message_type=ChatMessageType.AI)
 
     rows = list(
         csv.reader(
-            io.StringIO(
-                filtered_export_to_csv(experiment, Mock(prefetch_related=Mock(return_value=[session]))).getvalue()
-            ),
+            io.StringIO(filtered_export_to_csv(session.experiment, session.experiment.sessions.all()).getvalue()),
             delimiter=",",
         )
     )
@@ -128,3 +105,58 @@ def test_trace_id_export():
     assert "Trace ID" in rows[0], "Trace ID not in header"
     assert rows[1][-1] == "trace123", "Trace ID not exported correctly"
     assert rows[2][-1] == "", "Empty trace ID not handled correctly"
+
+
+@pytest.mark.django_db()
+@patch("apps.experiments.export.EXPORT_MESSAGE_BATCH_SIZE", 2)
+@patch("apps.experiments.export.EXPORT_SESSION_BATCH_SIZE", 2)
+def test_export_in_batches():
+    experiment = ExperimentFactory()
+    sessions = ExperimentSessionFactory.create_batch(3, experiment=experiment, team=experiment.team)
+    for session in sessions:
+        for i in range(3):
+            ChatMessage.objects.create(
+                chat=session.chat, content=f"{session.external_id} {i}", message_type=ChatMessageType.HUMAN
+            )
+
+    progress = []
+    csv_file = filtered_export_to_csv(experiment, experiment.sessions.all(), progress_callback=progress.append)
+    rows = list(csv.reader(io.StringIO(csv_file.getvalue())))[1:]
+
+    assert progress == [2, 3]
+    expected = sorted(
+        (str(session.external_id), f"{session.external_id} {i}") for session in sessions for i in range(3)
+    )
+    assert sorted((row[7], row[3]) for row in rows) == expected
+    # messages for each session are exported in order
+    for session in sessions:
+        contents = [row[3] for row in rows if row[7] == str(session.external_id)]
+        assert contents == [f"{session.external_id} {i}" for i in range(3)]
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("export_format", [ExportFormat.CSV, ExportFormat.CSV_GZIP, ExportFormat.PARQUET])
+def test_write_export_formats(export_format):
+    session = ExperimentSessionFactory()
+    message = ChatMessage.objects.create(chat=session.chat, content="Hello", message_type=ChatMessageType.HUMAN)
+    message.add_tag(Tag.objects.create(name="greeting", team=session.team), team=session.team, added_by=None)
+
+    export_file = io.BytesIO()
+    write_export(session.experiment, session.experiment.sessions.all(), export_format, export_file)
+    export_file.seek(0)
+
+    if export_format == ExportFormat.PARQUET:
+        df = pd.read_parquet(export_file)
+        assert list(df.columns) == EXPORT_HEADER
+        assert df["Message ID"].tolist() == [message.id]
+        assert df["Message Date"].tolist() == [pd.Timestamp(message.created_at)]
+        assert df["Message Tags"][0].tolist() == ["greeting"]
+        assert df["Session ID"].tolist() == [str(session.external_id)]
+    else:
+        if export_format == ExportFormat.CSV_GZIP:
+            export_file = gzip.GzipFile(fileobj=export_file)
+        rows = list(csv.reader(io.TextIOWrapper(export_file, encoding="utf-8")))
+        assert rows[0] == EXPORT_HEADER
+        assert rows[1][0] == str(message.id)
+        assert rows[1][3] == "Hello"
+        assert rows[1][14] == "greeting"
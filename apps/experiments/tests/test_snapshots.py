@@ -0,0 +1,107 @@
+from unittest.mock import patch
+
+import pytest
+from django.core.cache import cache
+from field_audit.models import AuditAction
+
+from apps.custom_actions.models import CustomAction, CustomActionOperation
+from apps.experiments.models import Experiment, SafetyLayer
+from apps.experiments.snapshots import experiment_snapshots
+from apps.utils.factories.experiment import ExperimentFactory
+from apps.utils.factories.service_provider_factories import AuthProviderFactory
+
+
+@pytest.fixture()
+def experiment():
+    experiment = ExperimentFactory()
+    layer = SafetyLayer.objects.create(prompt_text="Is this message safe?", team=experiment.team)
+    experiment.safety_layers.add(layer)
+    return experiment
+
+
+@pytest.mark.django_db()
+def test_default_version_is_loaded_from_snapshot(experiment, django_assert_num_queries):
+    version = experiment.create_new_version()
+    assert experiment.default_version == version
+
+    experiment = Experiment.objects.get(id=experiment.id)
+    llm_provider, llm_provider_model = version.llm_provider, version.llm_provider_model
+    experiment_snapshots.clear()
+    # the snapshot is still in Redis. Only the LLM and voice providers are loaded from the database.
+    with django_assert_num_queries(2):
+        snapshot = experiment.get_version(Experiment.DEFAULT_VERSION_NUMBER)
+        assert snapshot == version
+        assert snapshot.llm_provider == llm_provider
+        assert snapshot.llm_provider_model == llm_provider_model
+        assert [layer.prompt_text for layer in snapshot.safety_layers.all()] == ["Is this message safe?"]
+        assert not snapshot.tools_enabled
+        assert snapshot.is_a_version
+
+    # each lookup returns a separate instance
+    assert experiment.get_version(version.version_number) is not snapshot
+
+
+@pytest.mark.django_db()
+def test_snapshot_invalidated_when_working_version_saved(experiment):
+    version = experiment.create_new_version()
+    assert experiment.get_version(version.version_number).name == experiment.name
+
+    Experiment.objects.filter(id=version.id).update(name="renamed", audit_action=AuditAction.AUDIT)
+    assert experiment.get_version(version.version_number).name == experiment.name
+
+    experiment.save()
+    assert experiment.get_version(version.version_number).name == "renamed"
+
+
+@pytest.mark.django_db()
+def test_snapshot_invalidated_when_provider_saved(experiment):
+    version = experiment.create_new_version()
+    assert experiment.get_version(version.version_number).llm_provider.name == version.llm_provider.name
+
+    llm_provider = version.llm_provider
+    llm_provider.name = "new name"
+    llm_provider.save()
+    assert experiment.get_version(version.version_number).llm_provider.name == "new name"
+
+
+@pytest.mark.django_db()
+def test_missing_version(experiment):
+    assert experiment.default_version == experiment
+    with pytest.raises(Experiment.DoesNotExist):
+        experiment.get_version(5)
+
+
+@pytest.mark.django_db()
+def test_provider_secrets_not_stored_in_redis(experiment, django_assert_num_queries):
+    experiment.llm_provider.config = {"openai_api_key": "llm-secret"}
+    experiment.llm_provider.save()
+    auth_provider = AuthProviderFactory(team=experiment.team, config={"username": "user", "api_key": "auth-secret"})
+    custom_action = CustomAction.objects.create(
+        team=experiment.team,
+        name="Weather",
+        api_schema={
+            "openapi": "3.0.0",
+            "info": {"title": "Weather API", "version": "1.0.0"},
+            "servers": [{"url": "https://api.weather.com"}],
+            "paths": {"/weather": {"get": {"summary": "Get weather"}}},
+        },
+        allowed_operations=["weather_get"],
+        server_url="https://api.weather.com",
+        auth_provider=auth_provider,
+    )
+    CustomActionOperation.objects.create(custom_action=custom_action, experiment=experiment, operation_id="weather_get")
+    version = experiment.create_new_version()
+
+    with patch.object(cache, "set", wraps=cache.set) as cache_set:
+        experiment.get_version(version.version_number)
+    [payload] = [call.args[1] for call in cache_set.call_args_list if call.args[0].startswith("experiment_snapshot:")]
+    assert b"llm-secret" not in payload
+    assert b"auth-secret" not in payload
+
+    experiment_snapshots.clear()
+    # the LLM, voice and auth providers
+    with django_assert_num_queries(3):
+        snapshot = experiment.get_version(version.version_number)
+        assert snapshot.llm_provider.config == {"openai_api_key": "llm-secret"}
+        [operation] = snapshot.custom_action_operations.all()
+        assert operation.custom_action.auth_provider.config == {"username": "user", "api_key": "auth-secret"}
@@ -1,11 +1,18 @@
+import io
 from unittest.mock import patch
 
+import pandas as pd
 import pytest
 from django.test import override_settings
 
-from apps.experiments.tasks import async_create_experiment_version, async_export_chat
+from apps.assistants.models import ToolResources
+from apps.chat.models import ChatMessage, ChatMessageType
+from apps.experiments.tasks import async_create_experiment_version, async_export_chat, get_response_for_webchat_task
 from apps.files.models import File
+from apps.utils.factories.assistants import OpenAiAssistantFactory
 from apps.utils.factories.experiment import ExperimentFactory, ExperimentSessionFactory
+from apps.utils.factories.files import FileFactory
+from apps.utils.factories.openai import FileObjectFactory
 
 
 @pytest.mark.django_db()
@@ -15,6 +22,21 @@ def test_async_export_chat_returns_file_id():
     assert result == {"file_id": File.objects.first().id}
 
 
+@pytest.mark.django_db()
+def test_async_export_chat_writes_csv_to_storage():
+    session = ExperimentSessionFactory()
+    ChatMessage.objects.create(chat=session.chat, content="Hello", message_type=ChatMessageType.HUMAN)
+    result = async_export_chat(session.experiment_id, {}, False)
+
+    file_obj = File.objects.get(id=result["file_id"])
+    content = file_obj.file.read().decode("utf-8")
+    assert file_obj.content_size == len(content.encode("utf-8"))
+    rows = content.splitlines()
+    assert rows[0].startswith("Message ID,")
+    assert len(rows) == 2
+    assert "Hello" in rows[1]
+
+
 @pytest.mark.django_db()
 @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
 def test_async_create_experiment_version():
@@ -36,3 +58,45 @@ def test_async_create_experiment_version_fails(create_new_version):
     assert experiment.versions.count() == 0
     experiment.refresh_from_db()
     assert experiment.create_version_task_id == ""
+
+
+@pytest.mark.django_db()
+def test_async_export_chat_parquet():
+    session = ExperimentSessionFactory()
+    ChatMessage.objects.create(chat=session.chat, content="Hello", message_type=ChatMessageType.HUMAN)
+    result = async_export_chat(session.experiment_id, {}, False, "parquet")
+
+    file_obj = File.objects.get(id=result["file_id"])
+    assert file_obj.name.endswith(".parquet")
+    assert file_obj.content_type == "application/vnd.apache.parquet"
+    df = pd.read_parquet(io.BytesIO(file_obj.file.read()))
+    assert df["Message Content"].tolist() == ["Hello"]
+
+
+@pytest.mark.django_db()
+@patch("apps.experiments.tasks.notify_task_complete")
+def test_webchat_response_notifies_on_completion(notify_task_complete):
+    result = get_response_for_webchat_task.apply(
+        kwargs={"experiment_session_id": 0, "experiment_id": 0, "message_text": "hi", "attachments": []}
+    )
+    notify_task_complete.assert_called_once_with(result.id)
+
+
+@pytest.mark.django_db()
+@patch("openai.resources.beta.Assistants.create", side_effect=Exception("Error"))
+@patch("openai.resources.Files.create", side_effect=FileObjectFactory.create_batch(1))
+def test_async_create_experiment_version_keeps_assistant_uploads(mock_file_create, assistant_create):
+    assistant = OpenAiAssistantFactory(builtin_tools=["code_interpreter"])
+    file = FileFactory(team=assistant.team)
+    ToolResources.objects.create(tool_type="code_interpreter", assistant=assistant).files.set([file])
+    experiment = ExperimentFactory(team=assistant.team, assistant=assistant)
+
+    # pushing the new assistant version fails and the version isn't created
+    with pytest.raises(Exception, match="Error"):
+        async_create_experiment_version(experiment.id)
+    assert experiment.versions.count() == 0
+
+    # the upload was saved before the version was created
+    file.refresh_from_db()
+    assert file.external_id
+    assert mock_file_create.call_count == 1
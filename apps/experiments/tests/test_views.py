@@ -1,18 +1,22 @@
 from contextlib import nullcontext as does_not_raise
+from datetime import timedelta
 from io import BytesIO
 from unittest import mock
+from urllib.parse import unquote
 
 import jwt
 import pytest
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.http import HttpResponse
 from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from waffle.testutils import override_flag
 
 from apps.chat.channels import WebChannel
-from apps.chat.models import Chat
+from apps.chat.models import Chat, ChatMessage, ChatMessageType
 from apps.experiments.models import (
     AgentTools,
     Experiment,
@@ -21,6 +25,7 @@ from apps.experiments.models import (
     ParticipantData,
     VoiceResponseBehaviours,
 )
+from apps.experiments.tasks import get_response_for_webchat_task
 from apps.experiments.views.experiment import (
     ExperimentForm,
     ExperimentTableView,
@@ -37,7 +42,9 @@ from apps.utils.factories.experiment import (
 )
 from apps.utils.factories.service_provider_factories import LlmProviderFactory, LlmProviderModelFactory
 from apps.utils.factories.team import TeamWithUsersFactory, UserFactory
+from apps.utils.langchain import mock_llm
 from apps.utils.prompt import get_root_var, validate_prompt_variables
+from apps.utils.task_notifications import TaskWaitUnavailable
 
 
 @pytest.mark.django_db()
@@ -207,7 +214,7 @@ def test_form_fields():
 
 @pytest.mark.django_db()
 @pytest.mark.parametrize("is_user", [False, True])
-@mock.patch("apps.chat.channels.enqueue_static_triggers")
+@mock.patch("apps.chat.channels.queue_static_trigger")
 def test_new_participant_created_on_session_start(_trigger_mock, is_user):
     """For each new experiment session, a participant should be created and linked to the session"""
     identifier = "someone@example.com"
@@ -230,7 +237,7 @@ def test_new_participant_created_on_session_start(_trigger_mock, is_user):
 
 @pytest.mark.django_db()
 @pytest.mark.parametrize("is_user", [False, True])
-@mock.patch("apps.chat.channels.enqueue_static_triggers")
+@mock.patch("apps.chat.channels.queue_static_trigger")
 def test_participant_reused_within_team(_trigger_mock, is_user):
     """Within a team, the same external chat id (or participant identifier) should result in the participant being
     reused, and not result in a new participant being created
@@ -269,7 +276,7 @@ def test_participant_reused_within_team(_trigger_mock, is_user):
 
 @pytest.mark.django_db()
 @pytest.mark.parametrize("is_user", [False, True])
-@mock.patch("apps.chat.channels.enqueue_static_triggers")
+@mock.patch("apps.chat.channels.queue_static_trigger")
 def test_new_participant_created_for_different_teams(_trigger_mock, is_user):
     """A new participant should be created for each team when a user uses the same identifier"""
     experiment1 = ExperimentFactory(team=TeamWithUsersFactory())
@@ -313,7 +320,7 @@ def test_new_participant_created_for_different_teams(_trigger_mock, is_user):
 
 
 @pytest.mark.django_db()
-@mock.patch("apps.chat.channels.enqueue_static_triggers")
+@mock.patch("apps.chat.channels.queue_static_trigger")
 def test_participant_gets_user_when_they_signed_up(_trigger_mock, client):
     """When a non platform user starts a session, a participant without a user is created. When they then sign up
     and start another session, their participant user should be populated
@@ -349,7 +356,7 @@ def test_participant_gets_user_when_they_signed_up(_trigger_mock, client):
 
 
 @pytest.mark.django_db()
-@mock.patch("apps.chat.channels.enqueue_static_triggers")
+@mock.patch("apps.chat.channels.queue_static_trigger")
 def test_user_email_used_for_participant_identifier(_trigger_mock, client):
     """With the `capture_identifier` field enabled on the consent record, logged in users' consent form will
     not contain the `identifier` field, so we pass it as initial data to the form. This test simulates a logged
@@ -372,7 +379,7 @@ def test_user_email_used_for_participant_identifier(_trigger_mock, client):
 
 
 @pytest.mark.django_db()
-@mock.patch("apps.chat.channels.enqueue_static_triggers")
+@mock.patch("apps.chat.channels.queue_static_trigger")
 def test_timezone_saved_in_participant_data(_trigger_mock):
     """A participant's timezone data should be saved in all ParticipantData records"""
     experiment = ExperimentFactory(team=TeamWithUsersFactory())
@@ -397,7 +404,7 @@ def test_timezone_saved_in_participant_data(_trigger_mock):
 
 @pytest.mark.django_db()
 @pytest.mark.parametrize("version", [Experiment.DEFAULT_VERSION_NUMBER, 1])
-@mock.patch("apps.chat.channels.enqueue_static_triggers", mock.Mock())
+@mock.patch("apps.chat.channels.queue_static_trigger", mock.Mock())
 @mock.patch("apps.experiments.views.experiment.get_response_for_webchat_task.delay")
 def test_experiment_session_message_view_creates_files(delay_mock, version, experiment, client):
     task = mock.Mock()
@@ -426,6 +433,102 @@ def test_experiment_session_message_view_creates_files(delay_mock, version, expe
     assert fs_resource.files.filter(name="fs.text").exists()
 
 
+def _get_message_response_url(session, task_id):
+    return reverse(
+        "experiments:get_message_response",
+        args=[session.team.slug, session.experiment.public_id, session.external_id, task_id],
+    )
+
+
+@pytest.mark.django_db()
+@mock.patch("apps.experiments.views.experiment.wait_for_task", return_value=False)
+@mock.patch("apps.experiments.views.experiment.Progress")
+def test_get_message_response_pending(progress, wait_for_task, client):
+    session = ExperimentSessionFactory()
+    progress.return_value.get_info.return_value = {"state": "PENDING", "complete": False, "success": None}
+
+    url = _get_message_response_url(session, "task-1")
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    wait_for_task.assert_called_once_with("task-1", timeout=10, max_waits=2)
+    # the chat messages aren't queried until the response is ready
+    assert not [query for query in queries if '"chat_chatmessage"' in query["sql"]]
+    content = response.content.decode()
+    assert f'hx-get="{url}"' in content
+    # the wait timed out so the browser asks again straight away
+    assert 'hx-trigger="load"' in content
+
+
+@pytest.mark.django_db()
+@mock.patch("apps.experiments.views.experiment.wait_for_task", side_effect=TaskWaitUnavailable)
+@mock.patch("apps.experiments.views.experiment.Progress")
+def test_get_message_response_falls_back_to_polling(progress, wait_for_task, client):
+    session = ExperimentSessionFactory()
+    progress.return_value.get_info.return_value = {"state": "PENDING", "complete": False, "success": None}
+
+    response = client.get(_get_message_response_url(session, "task-1"))
+    assert 'hx-trigger="load delay:1s"' in response.content.decode()
+
+
+@pytest.mark.django_db()
+@mock.patch("apps.experiments.views.experiment.wait_for_task", return_value=True)
+@mock.patch("apps.experiments.views.experiment.Progress")
+def test_get_message_response_pushed(progress, wait_for_task, client):
+    session = ExperimentSessionFactory()
+    progress.return_value.get_info.side_effect = [
+        {"state": "PENDING", "complete": False, "success": None},
+        {"state": "SUCCESS", "complete": True, "success": True, "result": {"response": "how can I help?"}},
+    ]
+
+    response = client.get(_get_message_response_url(session, "task-1"))
+    content = response.content.decode()
+    assert "how can I help?" in content
+    assert "hx-get" not in content
+
+
+@pytest.mark.django_db()
+@mock.patch("apps.chat.channels.queue_static_trigger", mock.Mock())
+@mock.patch("apps.experiments.views.experiment.Progress")
+def test_get_message_response_complete(progress, client):
+    session = ExperimentSessionFactory()
+    with mock_llm(responses=["how can I help?"]):
+        result = get_response_for_webchat_task(session.id, session.experiment.id, "Hi", [])
+    assert result["error"] is None
+    progress.return_value.get_info.return_value = {
+        "state": "SUCCESS",
+        "complete": True,
+        "success": True,
+        "result": result,
+    }
+
+    response = client.get(_get_message_response_url(session, "task-1"))
+    content = response.content.decode()
+    assert "how can I help?" in content
+    assert "hx-get" not in content
+    ai_message = ChatMessage.objects.get(id=result["message_id"])
+    assert ai_message.created_at.isoformat() in unquote(content)
+
+
+@pytest.mark.django_db()
+def test_poll_messages_skips_query_without_new_messages(client):
+    session = ExperimentSessionFactory()
+    session.participant.user = session.experiment.owner
+    session.participant.save()
+    message = ChatMessage.objects.create(chat=session.chat, content="Hello", message_type=ChatMessageType.AI)
+    client.force_login(session.experiment.owner)
+    url = reverse("experiments:poll_messages", args=[session.team.slug, session.experiment_id, session.id])
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, {"since": message.created_at.isoformat()})
+    assert "Hello" not in response.content.decode()
+    assert not [query for query in queries if '"chat_chatmessage"' in query["sql"]]
+
+    earlier = message.created_at - timedelta(seconds=1)
+    response = client.get(url, {"since": earlier.isoformat()})
+    assert "Hello" in response.content.decode()
+
+
 class TestExperimentTableView:
     def test_get_queryset(self, experiment):
         team = experiment.team
@@ -471,7 +574,7 @@ def test_start_authed_web_session_with_version(version_number, client):
 @pytest.mark.django_db()
 class TestPublicSessions:
     @pytest.mark.parametrize("is_user", [False, True])
-    @mock.patch("apps.chat.channels.enqueue_static_triggers")
+    @mock.patch("apps.chat.channels.queue_static_trigger")
     def test_start_session_public_with_emtpy_identifier(self, _trigger_mock, is_user, client):
         """Identifiers can be empty if we choose not to capture it. In this case, use the logged in user's email or in
         the case where it's an external user, use a UUID as the identifier"""
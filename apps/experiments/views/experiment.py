@@ -15,7 +15,14 @@ from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.db import transaction
 from django.db.models import Case, Count, IntegerField, When
-from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, HttpResponseRedirect
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseRedirect,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.response import TemplateResponse
 from django.urls import reverse
@@ -55,6 +62,7 @@ from apps.experiments.decorators import (
 )
 from apps.experiments.email import send_chat_link_email, send_experiment_invitation
 from apps.experiments.exceptions import ChannelAlreadyUtilizedException
+from apps.experiments.export import ExportFormat
 from apps.experiments.filters import apply_dynamic_filters
 from apps.experiments.forms import (
     ConsentForm,
@@ -93,6 +101,7 @@ from apps.service_providers.utils import get_llm_provider_choices
 from apps.teams.decorators import login_and_team_required, team_required
 from apps.teams.mixins import LoginAndTeamRequiredMixin
 from apps.utils.base_experiment_table_view import BaseExperimentTableView
+from apps.utils.task_notifications import TaskWaitUnavailable, wait_for_task
 
 DEFAULT_ERROR_MESSAGE = (
     "Sorry something went wrong. This was likely an intermittent error related to load."
@@ -496,6 +505,7 @@ def single_experiment_home(request, team_slug: str, experiment_id: int):
             "available_tags": [tag.name for tag in experiment.team.tag_set.filter(is_system_tag=False)],
             "experiment_versions": experiment.get_version_name_list(),
             "deployed_version": deployed_version,
+            "export_formats": ExportFormat.choices,
             **_get_events_context(experiment, team_slug),
             **_get_routes_context(experiment, team_slug),
             **_get_terminal_bots_context(experiment, team_slug),
@@ -769,8 +779,24 @@ def _experiment_session_message(request, version_number: int, embedded=False):
 def get_message_response(request, team_slug: str, experiment_id: uuid.UUID, session_id: str, task_id: str):
     experiment = request.experiment
     session = request.experiment_session
-    last_message = ChatMessage.objects.filter(chat=session.chat).order_by("-created_at").first()
     progress = Progress(AsyncResult(task_id)).get_info()
+    # Hold the request until the response is ready so that it can be returned as soon as it is. The browser asks
+    # again straight away if the wait times out, or after a delay if no wait was available.
+    poll_delay = None
+    if not progress["complete"]:
+        try:
+            if wait_for_task(
+                task_id,
+                timeout=settings.WEBCHAT_RESPONSE_WAIT_TIMEOUT,
+                max_waits=settings.WEBCHAT_RESPONSE_MAX_WAITS,
+            ):
+                progress = Progress(AsyncResult(task_id)).get_info()
+        except TaskWaitUnavailable:
+            poll_delay = 1
+    # only look up the last message once the response is ready
+    last_message = None
+    if progress["complete"]:
+        last_message = ChatMessage.objects.filter(chat=session.chat).order_by("-created_at").first()
     # don't render empty messages
     skip_render = progress["complete"] and progress["success"] and not progress["result"]
 
@@ -800,6 +826,7 @@ def get_message_response(request, team_slug: str, experiment_id: uuid.UUID, sess
             "task_id": task_id,
             "message_details": message_details,
             "skip_render": skip_render,
+            "poll_delay": poll_delay,
             "last_message_datetime": last_message and quote(last_message.created_at.isoformat()),
             "attachments": attached_files,
         },
@@ -812,7 +839,11 @@ def poll_messages(request, team_slug: str, experiment_id: int, session_id: int):
     params = request.GET.dict()
     since_param = params.get("since")
     experiment_session = get_object_or_404(
-        ExperimentSession, participant__user=user, experiment_id=experiment_id, id=session_id, team=request.team
+        ExperimentSession.objects.select_related("chat"),
+        participant__user=user,
+        experiment_id=experiment_id,
+        id=session_id,
+        team=request.team,
     )
 
     since = timezone.now()
@@ -821,12 +852,20 @@ def poll_messages(request, team_slug: str, experiment_id: int, session_id: int):
             since = datetime.fromisoformat(since_param)
         except ValueError as e:
             logging.exception(f"Unexpected `since` parameter value. Error: {e}")
-
-    messages = (
-        ChatMessage.objects.filter(message_type=ChatMessageType.AI, chat=experiment_session.chat, created_at__gt=since)
-        .order_by("created_at")
-        .all()
-    )
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+
+    messages = []
+    # skip the message query when the chat hasn't had any messages since the client last checked
+    last_message_at = experiment_session.chat.last_message_at
+    if last_message_at is None or last_message_at > since:
+        messages = (
+            ChatMessage.objects.filter(
+                message_type=ChatMessageType.AI, chat=experiment_session.chat, created_at__gt=since
+            )
+            .order_by("created_at")
+            .all()
+        )
     last_message = messages[0] if messages else None
 
     return TemplateResponse(
@@ -1036,9 +1075,14 @@ def generate_chat_export(request, team_slug: str, experiment_id: str):
     parsed_url = urlparse(request.headers.get("HX-Current-URL"))
     query_params = parse_qs(parsed_url.query)
     include_api = request.POST.get("show-all") == "on"
-    task_id = async_export_chat.delay(experiment_id, query_params, include_api)
+    export_format = request.POST.get("export-format", ExportFormat.CSV)
+    if export_format not in ExportFormat.values:
+        return HttpResponseBadRequest("Invalid export format")
+    task_id = async_export_chat.delay(experiment_id, query_params, include_api, export_format)
     return TemplateResponse(
-        request, "experiments/components/exports.html", {"experiment": experiment, "task_id": task_id}
+        request,
+        "experiments/components/exports.html",
+        {"experiment": experiment, "task_id": task_id, "export_formats": ExportFormat.choices},
     )
 
 
@@ -1047,7 +1091,7 @@ def generate_chat_export(request, team_slug: str, experiment_id: str):
 def get_export_download_link(request, team_slug: str, experiment_id: str, task_id: str):
     experiment = get_object_or_404(Experiment, id=experiment_id, team=request.team)
     info = Progress(AsyncResult(task_id)).get_info()
-    context = {"experiment": experiment}
+    context = {"experiment": experiment, "export_formats": ExportFormat.choices}
     if info["complete"] and info["success"]:
         file_id = info["result"]["file_id"]
         download_url = reverse("files:base", kwargs={"team_slug": team_slug, "pk": file_id})
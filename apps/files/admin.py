@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import File
+from .models import File, RemoteFile
 
 
 @admin.register(File)
@@ -8,3 +8,9 @@ class FileAdmin(admin.ModelAdmin):
     list_display = ("name", "external_source", "external_id", "content_size", "content_type")
     search_fields = ("name", "external_source", "external_id")
     list_filter = ("content_type",)
+
+
+@admin.register(RemoteFile)
+class RemoteFileAdmin(admin.ModelAdmin):
+    list_display = ("external_id", "llm_provider", "content_hash", "team")
+    search_fields = ("external_id", "content_hash")
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:11
+
+import apps.utils.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0004_file_summary'),
+        ('service_providers', '0026_add_google_gemini_models'),
+        ('teams', '0007_create_commcare_connect_flag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='RemoteFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('external_id', models.CharField(max_length=255)),
+                ('llm_provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='remote_files', to='service_providers.llmprovider')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='teams.team', verbose_name='Team')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('llm_provider', 'content_hash'), name='unique_remote_file_content')],
+            },
+            bases=(models.Model, apps.utils.models.VersioningMixin),
+        ),
+    ]
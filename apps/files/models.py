@@ -1,3 +1,4 @@
+import hashlib
 import mimetypes
 import pathlib
 
@@ -22,6 +23,7 @@ class File(BaseTeamModel):
     external_id = models.CharField(max_length=255, blank=True)
     content_size = models.PositiveIntegerField(null=True, blank=True)
     content_type = models.CharField(blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
     schema = models.JSONField(default=dict, blank=True)
     expiry_date = models.DateTimeField(null=True)
     summary = models.TextField(max_length=settings.MAX_SUMMARY_LENGTH, blank=True)  # This is roughly 1 short paragraph
@@ -76,6 +78,14 @@ class File(BaseTeamModel):
         except Exception:
             return "application/octet-stream"
 
+    @staticmethod
+    def get_content_hash(file) -> str:
+        """Returns the SHA-256 hash of the content of `file`"""
+        content_hash = hashlib.sha256()
+        for chunk in file.chunks():
+            content_hash.update(chunk)
+        return content_hash.hexdigest()
+
     @property
     def size_mb(self) -> float:
         """Returns the size of this file in megabytes"""
@@ -89,6 +99,9 @@ class File(BaseTeamModel):
                 self.name = filename
             if not self.content_type:
                 self.content_type = File.get_content_type(self.file)
+            if not self.file._committed:
+                # the content is new so it hasn't been written to the storage yet
+                self.content_hash = File.get_content_hash(self.file)
         super().save(*args, **kwargs)
 
     def duplicate(self):
@@ -98,6 +111,7 @@ class File(BaseTeamModel):
             external_id=self.external_id,
             content_size=self.content_size,
             content_type=self.content_type,
+            content_hash=self.content_hash,
             schema=self.schema,
             team=self.team,
         )
@@ -107,3 +121,19 @@ class File(BaseTeamModel):
             new_file.file = new_file_file
         new_file.save()
         return new_file
+
+
+class RemoteFile(BaseTeamModel):
+    """A copy of a file's content that was uploaded to a provider. Files with the same content share the copy
+    instead of uploading it again."""
+
+    llm_provider = models.ForeignKey(
+        "service_providers.LlmProvider", on_delete=models.CASCADE, related_name="remote_files"
+    )
+    content_hash = models.CharField(max_length=64)
+    external_id = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["llm_provider", "content_hash"], name="unique_remote_file_content"),
+        ]
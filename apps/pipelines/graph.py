@@ -1,4 +1,9 @@
-from collections import Counter, defaultdict
+import hashlib
+import logging
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
 from functools import cached_property, partial
 from typing import Self
 
@@ -13,6 +18,8 @@ from apps.pipelines.exceptions import PipelineBuildError, PipelineNodeBuildError
 from apps.pipelines.models import Pipeline
 from apps.pipelines.nodes.nodes import EndNode, StartNode
 
+logger = logging.getLogger("ocs.pipelines")
+
 
 class Node(pydantic.BaseModel):
     id: str
@@ -86,10 +93,21 @@ class PipelineGraph(pydantic.BaseModel):
     def unconditional_edges(self) -> list[Edge]:
         return [edge for edge in self.edges if not edge.is_conditional()]
 
+    @cached_property
+    def content_hash(self) -> str:
+        return hashlib.sha256(self.model_dump_json().encode()).hexdigest()
+
     @classmethod
     def build_runnable_from_pipeline(cls, pipeline: Pipeline) -> CompiledStateGraph:
         return cls.build_from_pipeline(pipeline).build_runnable()
 
+    @classmethod
+    def get_runnable_for_pipeline(cls, pipeline: Pipeline) -> CompiledStateGraph:
+        """Returns the compiled graph for the pipeline, reusing a previously compiled graph from the
+        process cache if the pipeline nodes and edges have not changed."""
+        graph = cls.build_from_pipeline(pipeline)
+        return compiled_graph_cache.get_or_build((pipeline.id, graph.content_hash), graph.build_runnable)
+
     @classmethod
     def build_from_pipeline(cls, pipeline: Pipeline) -> Self:
         node_data = [
@@ -222,3 +240,61 @@ class PipelineGraph(pydantic.BaseModel):
             raise PipelineBuildError(
                 f"There should be exactly 1 {EndNode.model_config['json_schema_extra'].label} node"
             )
+
+
+@dataclass(frozen=True)
+class CacheInfo:
+    hits: int
+    misses: int
+    size: int
+    maxsize: int
+
+
+class CompiledGraphCache:
+    """A per-process LRU cache of compiled pipeline graphs.
+
+    Keys are tuples whose first item is the pipeline ID so that all the entries for a pipeline can be
+    invalidated when it is edited. Pipeline versions are immutable so their graphs are only ever evicted
+    when the cache is full.
+    """
+
+    def __init__(self, maxsize=128) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.graphs: OrderedDict[Hashable, CompiledStateGraph] = OrderedDict()
+        self.lock = threading.RLock()
+
+    def get_or_build(self, key: tuple, build: Callable[[], CompiledStateGraph]) -> CompiledStateGraph:
+        with self.lock:
+            if key in self.graphs:
+                self.hits += 1
+                self.graphs.move_to_end(key)
+                return self.graphs[key]
+            self.misses += 1
+
+        logger.debug("Compiling pipeline graph for key '%s'", key)
+        graph = build()
+        with self.lock:
+            self.graphs[key] = graph
+            self.graphs.move_to_end(key)
+            while len(self.graphs) > self.maxsize:
+                self.graphs.popitem(last=False)
+        return graph
+
+    def invalidate(self, pipeline_id: int):
+        with self.lock:
+            for key in [key for key in self.graphs if key[0] == pipeline_id]:
+                del self.graphs[key]
+
+    def clear(self):
+        with self.lock:
+            self.graphs.clear()
+            self.hits = self.misses = 0
+
+    def info(self) -> CacheInfo:
+        with self.lock:
+            return CacheInfo(hits=self.hits, misses=self.misses, size=len(self.graphs), maxsize=self.maxsize)
+
+
+compiled_graph_cache = CompiledGraphCache()
@@ -0,0 +1,120 @@
+"""Buffering of the history written while a pipeline runs.
+
+Instead of each node saving its history as it runs, the messages are collected by a `PipelineHistoryBuffer` and
+saved with a few bulk inserts when the run ends. Nodes look up the buffer for the session with
+`get_history_buffer` and fall back to saving immediately when there isn't one, for example when the pipeline is
+run outside of `Pipeline.invoke`.
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import models, transaction
+
+from apps.annotations.models import CustomTaggedItem
+from apps.annotations.tag_cache import tag_cache
+from apps.chat.models import ChatMessage, ChatMessageType
+from apps.experiments.models import ExperimentSession
+from apps.pipelines.models import PipelineChatHistory, PipelineChatMessages
+
+_current_buffer: ContextVar["PipelineHistoryBuffer | None"] = ContextVar("pipeline_history_buffer", default=None)
+
+
+def get_history_buffer(session: ExperimentSession | None) -> "PipelineHistoryBuffer | None":
+    """Returns the buffer collecting the history of the current pipeline run if it is running for `session`"""
+    buffer = _current_buffer.get()
+    if buffer is not None and session is not None and buffer.session.id == session.id:
+        return buffer
+    return None
+
+
+class PipelineHistoryBuffer:
+    def __init__(self, session: ExperimentSession):
+        self.session = session
+        # nodes may run in parallel threads
+        self.lock = threading.Lock()
+        self.pipeline_messages: list[tuple[str, str, PipelineChatMessages]] = []
+        self.chat_messages: list[ChatMessage] = []
+        self.system_tags: list[tuple[ChatMessage, str, str]] = []
+
+    @contextmanager
+    def collect(self):
+        """Collect the history written by the nodes that run within this block"""
+        token = _current_buffer.set(self)
+        try:
+            yield self
+        finally:
+            _current_buffer.reset(token)
+
+    def add_pipeline_message(
+        self, history_type: str, history_name: str, node_id: str, human_message: str, ai_message: str
+    ) -> PipelineChatMessages:
+        message = PipelineChatMessages(node_id=node_id, human_message=human_message, ai_message=ai_message)
+        with self.lock:
+            self.pipeline_messages.append((history_type, history_name, message))
+        return message
+
+    def add_chat_message(
+        self, content: str, type_: ChatMessageType, metadata: dict, system_tags: list[tuple[str, str]] | None = None
+    ) -> ChatMessage:
+        """Adds a message to the session's chat. `system_tags` is a list of (name, category) tuples. The message
+        only gets an ID once the buffer is saved."""
+        message = ChatMessage(chat=self.session.chat, message_type=type_.value, content=content, metadata=metadata)
+        with self.lock:
+            self.chat_messages.append(message)
+            self.system_tags.extend((message, name, category) for name, category in system_tags or [])
+        return message
+
+    def save_pipeline_history(self, history_type: str, history_name: str):
+        """Saves the buffered messages for a single history. This is used before the history is read so that
+        nodes see messages written earlier in the same run."""
+        with self.lock:
+            pending = [item for item in self.pipeline_messages if item[:2] == (history_type, history_name)]
+            self.pipeline_messages = [item for item in self.pipeline_messages if item not in pending]
+        if pending:
+            with transaction.atomic():
+                self._save_pipeline_messages(pending)
+
+    def save(self):
+        """Saves everything in the buffer. This doesn't create a savepoint when called inside a transaction so
+        that it can be combined with other writes in a single transaction."""
+        with self.lock:
+            pipeline_messages, self.pipeline_messages = self.pipeline_messages, []
+            chat_messages, self.chat_messages = self.chat_messages, []
+            system_tags, self.system_tags = self.system_tags, []
+
+        with transaction.atomic(savepoint=False):
+            self._save_pipeline_messages(pipeline_messages)
+            ChatMessage.bulk_create_for_chat(chat_messages)
+            self._save_system_tags(system_tags)
+
+    def _save_pipeline_messages(self, pipeline_messages: list[tuple[str, str, PipelineChatMessages]]):
+        if not pipeline_messages:
+            return
+
+        keys = {(history_type, history_name) for history_type, history_name, _ in pipeline_messages}
+        query = models.Q()
+        for history_type, history_name in keys:
+            query |= models.Q(type=history_type, name=history_name)
+        histories = {
+            (history.type, history.name): history for history in self.session.pipeline_chat_history.filter(query)
+        }
+        for history_type, history_name in keys - histories.keys():
+            histories[(history_type, history_name)], _ = PipelineChatHistory.objects.get_or_create(
+                session=self.session, type=history_type, name=history_name
+            )
+
+        for history_type, history_name, message in pipeline_messages:
+            message.chat_history = histories[(history_type, history_name)]
+        PipelineChatMessages.objects.bulk_create([message for _, _, message in pipeline_messages])
+
+    def _save_system_tags(self, system_tags: list[tuple[ChatMessage, str, str]]):
+        if not system_tags:
+            return
+
+        team = self.session.team
+        tags = tag_cache.get_tags(team, [(name, category) for _, name, category in system_tags])
+        CustomTaggedItem.bulk_add(
+            [(message, tags[(name, category)]) for message, name, category in system_tags], team=team
+        )
@@ -1,8 +1,14 @@
+import threading
 import uuid
 
 from langchain_core.callbacks import BaseCallbackHandler
 from loguru import logger
 
+# The maximum number of entries kept in a run's log. Errors are always kept.
+MAX_LOG_ENTRIES = 500
+# The maximum length of the input or output of a log entry
+MAX_LOG_VALUE_LENGTH = 5000
+
 
 class LoggingCallbackHandler(BaseCallbackHandler):
     def __init__(self, verbose=False) -> None:
@@ -118,8 +124,8 @@ class MemLogHandler:
                 "time": record["time"].strftime("%Y-%m-%d %H:%M:%S.%f"),
                 "level": record["level"].name,
                 "message": record["message"],
-                "output": str(output) if output else None,
-                "input": str(input) if input else None,
+                "output": truncate_log_value(str(output)) if output else None,
+                "input": truncate_log_value(str(input)) if input else None,
             }
         )
         self._save(log_entry)
@@ -129,11 +135,28 @@ class MemLogHandler:
 
 
 class LogHandler(MemLogHandler):
+    """Collects the log entries in the run's log, which is saved once the pipeline has finished.
+
+    The number of entries is capped at `MAX_LOG_ENTRIES`. Entries that don't fit are counted in the log's
+    `dropped_entries` so that the run details can show that the log is incomplete.
+    """
+
     def __init__(self, pipeline_run):
         super().__init__()
         self.pipeline_run = pipeline_run
+        # nodes may run in parallel threads
+        self.lock = threading.Lock()
 
     def _save(self, entry):
-        # Appending to a list is thread safe in python
-        self.pipeline_run.log["entries"].append(entry.model_dump())
-        self.pipeline_run.save()
+        log = self.pipeline_run.log
+        with self.lock:
+            if len(log["entries"]) < MAX_LOG_ENTRIES or entry.level == "ERROR":
+                log["entries"].append(entry.model_dump())
+            else:
+                log["dropped_entries"] = log.get("dropped_entries", 0) + 1
+
+
+def truncate_log_value(value: str) -> str:
+    if len(value) <= MAX_LOG_VALUE_LENGTH:
+        return value
+    return f"{value[:MAX_LOG_VALUE_LENGTH]}... ({len(value) - MAX_LOG_VALUE_LENGTH} characters truncated)"
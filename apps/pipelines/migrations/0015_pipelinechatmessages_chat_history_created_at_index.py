@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pipelines', '0014_set_default_history_mode'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pipelinechatmessages',
+            index=models.Index(fields=['chat_history', 'created_at'], name='pipelines_p_chat_hi_a95aac_idx'),
+        ),
+    ]
@@ -1,7 +1,9 @@
+import logging
 from collections import defaultdict
 from collections.abc import Iterator
 from datetime import datetime
 from functools import cached_property
+from typing import TYPE_CHECKING
 from uuid import uuid4
 
 import pydantic
@@ -12,6 +14,7 @@ from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, System
 from langchain_core.runnables import RunnableConfig
 from pydantic import ConfigDict
 
+from apps.annotations.models import TagCategories
 from apps.chat.models import ChatMessage, ChatMessageType
 from apps.custom_actions.form_utils import set_custom_actions
 from apps.custom_actions.mixins import CustomActionOperationMixin
@@ -24,8 +27,14 @@ from apps.pipelines.logging import PipelineLoggingCallbackHandler
 from apps.pipelines.nodes.base import PipelineState
 from apps.pipelines.nodes.helpers import temporary_session
 from apps.teams.models import BaseTeamModel
+from apps.utils.django_db import iterate_newest_first
 from apps.utils.models import BaseModel
 
+if TYPE_CHECKING:
+    from apps.pipelines.history import PipelineHistoryBuffer
+
+logger = logging.getLogger("ocs.pipelines")
+
 
 class PipelineManager(VersionsObjectManagerMixin, models.Manager):
     def get_queryset(self):
@@ -121,6 +130,9 @@ class Pipeline(BaseTeamModel, VersionsMixin):
 
     def update_nodes_from_data(self) -> None:
         """Set the nodes on the pipeline from data coming from the frontend"""
+        from apps.pipelines.graph import compiled_graph_cache
+
+        compiled_graph_cache.invalidate(self.id)
         nodes = [FlowNode(**node) for node in self.data["nodes"]]
         # Delete old nodes
         current_ids = set(self.node_ids)
@@ -218,7 +230,7 @@ class Pipeline(BaseTeamModel, VersionsMixin):
         from apps.pipelines.graph import PipelineGraph
 
         with temporary_session(self.team, user_id) as session:
-            runnable = PipelineGraph.build_runnable_from_pipeline(self)
+            runnable = PipelineGraph.get_runnable_for_pipeline(self)
             input = PipelineState(messages=[input], experiment_session=session, pipeline_version=self.version_number)
             with patch_executor():
                 output = runnable.invoke(input, config={"max_concurrency": 1})
@@ -235,15 +247,19 @@ class Pipeline(BaseTeamModel, VersionsMixin):
     ) -> dict:
         from apps.experiments.models import AgentTools
         from apps.pipelines.graph import PipelineGraph
+        from apps.pipelines.history import PipelineHistoryBuffer
 
-        runnable = PipelineGraph.build_runnable_from_pipeline(self)
+        runnable = PipelineGraph.get_runnable_for_pipeline(self)
         pipeline_run = self._create_pipeline_run(input, session)
         logging_callback = PipelineLoggingCallbackHandler(pipeline_run)
+        # The history and log written during the run are saved along with the run once it has finished
+        history = PipelineHistoryBuffer(session)
+        ai_message = None
 
         logging_callback.logger.debug("Starting pipeline run", input=input["messages"][-1])
+        trace_service = session.experiment.trace_service
         try:
             callbacks = [logging_callback]
-            trace_service = session.experiment.trace_service
             if trace_service:
                 trace_service_callback = trace_service.get_callback(
                     trace_name=session.experiment.name,
@@ -259,7 +275,8 @@ class Pipeline(BaseTeamModel, VersionsMixin):
                     "disabled_tools": AgentTools.reminder_tools() if disable_reminder_tools else [],
                 },
             )
-            output = runnable.invoke(input, config=config)
+            with history.collect():
+                output = runnable.invoke(input, config=config)
             output = PipelineState(**output).json_safe()
             pipeline_run.output = output
             if save_run_to_history and session is not None:
@@ -271,22 +288,33 @@ class Pipeline(BaseTeamModel, VersionsMixin):
                     output_metadata.update(trace_metadata)
 
                 if save_input_to_history:
-                    self._save_message_to_history(
-                        session, input["messages"][-1], ChatMessageType.HUMAN, metadata=input_metadata
-                    )
-                ai_message = self._save_message_to_history(
-                    session, output["messages"][-1], ChatMessageType.AI, metadata=output_metadata
+                    history.add_chat_message(input["messages"][-1], ChatMessageType.HUMAN, metadata=input_metadata)
+                version_tag = ChatMessage.get_version_tag_name(self.version_number, self.is_a_version)
+                ai_message = history.add_chat_message(
+                    output["messages"][-1],
+                    ChatMessageType.AI,
+                    metadata=output_metadata,
+                    system_tags=[(version_tag, TagCategories.EXPERIMENT_VERSION)],
                 )
-                output["ai_message_id"] = ai_message.id
+        except Exception:
+            pipeline_run.status = PipelineRunStatus.ERROR
+            logging_callback.logger.debug("Pipeline run failed", input=input["messages"][-1])
+            try:
+                self._save_pipeline_run(pipeline_run, history, ai_message)
+            except Exception:
+                # don't replace the error that failed the run
+                logger.exception("Error saving failed pipeline run %s", pipeline_run.id)
+            raise
         finally:
             if trace_service:
                 trace_service.end()
-            if pipeline_run.status == PipelineRunStatus.ERROR:
-                logging_callback.logger.debug("Pipeline run failed", input=input["messages"][-1])
-            else:
-                pipeline_run.status = PipelineRunStatus.SUCCESS
-                logging_callback.logger.debug("Pipeline run finished", output=output["messages"][-1])
-            pipeline_run.save()
+
+        if pipeline_run.status == PipelineRunStatus.ERROR:
+            logging_callback.logger.debug("Pipeline run failed", input=input["messages"][-1])
+        else:
+            pipeline_run.status = PipelineRunStatus.SUCCESS
+            logging_callback.logger.debug("Pipeline run finished", output=output["messages"][-1])
+        self._save_pipeline_run(pipeline_run, history, ai_message)
         return output
 
     def _create_pipeline_run(self, input: PipelineState, session: ExperimentSession) -> "PipelineRun":
@@ -301,16 +329,14 @@ class Pipeline(BaseTeamModel, VersionsMixin):
             session=session,
         )
 
-    def _save_message_to_history(
-        self, session: ExperimentSession, message: str, type_: ChatMessageType, metadata: dict
-    ) -> ChatMessage:
-        chat_message = ChatMessage.objects.create(
-            chat=session.chat, message_type=type_.value, content=message, metadata=metadata
-        )
-
-        if type_ == ChatMessageType.AI:
-            chat_message.add_version_tag(version_number=self.version_number, is_a_version=self.is_a_version)
-        return chat_message
+    @transaction.atomic()
+    def _save_pipeline_run(
+        self, pipeline_run: "PipelineRun", history: "PipelineHistoryBuffer", ai_message: ChatMessage | None
+    ):
+        history.save()
+        if ai_message:
+            pipeline_run.output["ai_message_id"] = ai_message.id
+        pipeline_run.save()
 
     @transaction.atomic()
     def create_new_version(self, *args, **kwargs):
@@ -517,6 +543,44 @@ class PipelineRun(BaseModel):
     def get_absolute_url(self):
         return reverse("pipelines:run_details", args=[self.pipeline.team.slug, self.pipeline_id, self.id])
 
+    def get_log_entries(self) -> "PipelineRunLogEntries":
+        return PipelineRunLogEntries(self.id)
+
+
+class PipelineRunLogEntries:
+    """A sequence of a run's log entries that can be paginated. Only the requested entries are loaded from the
+    database instead of the whole log."""
+
+    def __init__(self, pipeline_run_id: int):
+        self.queryset = PipelineRun.objects.filter(id=pipeline_run_id)
+
+    @cached_property
+    def _stats(self) -> tuple[int | None, int | None]:
+        count = models.Func(models.F("log__entries"), function="jsonb_array_length", output_field=models.IntegerField())
+        return self.queryset.annotate(count=count).values_list("count", "log__dropped_entries").first() or (0, 0)
+
+    def count(self) -> int:
+        return self._stats[0] or 0
+
+    @property
+    def dropped_entries(self) -> int:
+        """The number of entries that were not logged because the log was full"""
+        return self._stats[1] or 0
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key: slice) -> list[dict]:
+        start, stop, _ = key.indices(self.count())
+        if start >= stop:
+            return []
+        entries = models.expressions.RawSQL(
+            "jsonb_path_query_array(log, %s::jsonpath)",
+            (f"$.entries[{start} to {stop - 1}]",),
+            output_field=models.JSONField(),
+        )
+        return self.queryset.annotate(entries=entries).values_list("entries", flat=True).first() or []
+
 
 class LogEntry(pydantic.BaseModel):
     model_config = ConfigDict(json_encoders={datetime: lambda v: v.strftime("%Y-%m-%d %H:%M:%S.%f")})
@@ -563,7 +627,7 @@ class PipelineChatHistory(BaseModel):
         ordering = ["-created_at"]
 
     def message_iterator(self) -> Iterator["PipelineChatMessages"]:
-        yield from self.messages.order_by("-created_at").iterator(100)
+        yield from iterate_newest_first(self.messages.all())
 
     def get_messages_until_summary(self):
         messages = []
@@ -574,11 +638,20 @@ class PipelineChatHistory(BaseModel):
         return messages
 
     def get_langchain_messages_until_summary(self):
-        messages = self.get_messages_until_summary()
-        langchain_messages_to_last_summary = [
-            message for message_pair in messages for message in message_pair.as_langchain_messages()
-        ]
-        return list(reversed(langchain_messages_to_last_summary))
+        return list(reversed(list(self.iter_langchain_messages_until_summary())))
+
+    def iter_langchain_messages_until_summary(self) -> Iterator[BaseMessage]:
+        """Yields messages from newest to oldest, ending with the most recent summary (if any).
+        Messages are loaded lazily so callers that only need part of the history can stop early."""
+        for message in self.message_iterator():
+            yield from message.as_langchain_messages()
+            if message.summary:
+                break
+
+    def get_last_summary_message(self) -> BaseMessage | None:
+        """Returns the most recent summary, i.e. the last message yielded by `iter_langchain_messages_until_summary`"""
+        message = self.messages.filter(summary__isnull=False).exclude(summary="").order_by("-created_at", "-id").first()
+        return message.as_langchain_messages()[-1] if message else None
 
 
 class PipelineChatMessages(BaseModel):
@@ -588,6 +661,9 @@ class PipelineChatMessages(BaseModel):
     ai_message = models.TextField()
     summary = models.TextField(null=True)  # noqa: DJ001
 
+    class Meta:
+        indexes = [models.Index(fields=["chat_history", "created_at"])]
+
     def __str__(self):
         if self.summary:
             return f"Human: {self.human_message}, AI: {self.ai_message}, System: {self.summary}"
@@ -132,7 +132,7 @@ class PipelineNode(BaseModel, ABC):
     ) -> PipelineState:
         from apps.channels.datamodels import Attachment
 
-        self._config = config
+        node = self._copy_for_run(config)
 
         if not incoming_edges:
             # This is the first node in the graph
@@ -174,15 +174,25 @@ class PipelineNode(BaseModel, ABC):
                             "state_outputs": state["outputs"],
                         },
                     )
-        return self._process(input=node_input, state=state, node_id=node_id)
+        return node._process(input=node_input, state=state, node_id=node_id)
 
-    def process_conditional(self, state: PipelineState, node_id: str | None = None) -> str:
-        conditional_branch = self._process_conditional(state, node_id)
+    def process_conditional(
+        self, state: PipelineState, config: RunnableConfig | None = None, node_id: str | None = None
+    ) -> str:
+        node = self._copy_for_run(config) if config is not None else self
+        conditional_branch = node._process_conditional(state, node_id)
         output_map = self.get_output_map()
         output_handle = next((k for k, v in output_map.items() if v == conditional_branch), None)
         state["outputs"][node_id]["output_handle"] = output_handle
         return conditional_branch
 
+    def _copy_for_run(self, config: RunnableConfig) -> Self:
+        """Compiled graphs are cached and shared between pipeline runs so any state that is specific to a
+        run is stored on a copy of the node instead of the node itself."""
+        node = self.model_copy()
+        node._config = config
+        return node
+
     def _process(self, input: str, state: PipelineState, node_id: str) -> PipelineState:
         """The method that executes node specific functionality"""
         raise NotImplementedError
@@ -1,9 +1,11 @@
 import datetime
+import functools
 import inspect
 import json
 import logging
 import random
 import time
+from types import CodeType
 from typing import Literal
 
 import tiktoken
@@ -27,6 +29,7 @@ from apps.chat.agent.tools import get_node_tools
 from apps.chat.conversation import compress_chat_history, compress_pipeline_chat_history
 from apps.experiments.models import ExperimentSession, ParticipantData
 from apps.pipelines.exceptions import PipelineNodeBuildError, PipelineNodeRunError
+from apps.pipelines.history import get_history_buffer
 from apps.pipelines.models import Node, PipelineChatHistory, PipelineChatHistoryModes, PipelineChatHistoryTypes
 from apps.pipelines.nodes.base import (
     NodeSchema,
@@ -187,6 +190,9 @@ class HistoryMixin(LLMResponseMixin):
                 history_mode=self.history_mode,
             )
 
+        if history_buffer := get_history_buffer(session):
+            history_buffer.save_pipeline_history(self.history_type, self._get_history_name(node_id))
+
         try:
             history: PipelineChatHistory = session.pipeline_chat_history.get(
                 type=self.history_type, name=self._get_history_name(node_id)
@@ -214,6 +220,11 @@ class HistoryMixin(LLMResponseMixin):
             # Global History is saved outside of the node
             return
 
+        if history_buffer := get_history_buffer(session):
+            return history_buffer.add_pipeline_message(
+                self.history_type, self._get_history_name(node_id), node_id, human_message, ai_message
+            )
+
         history, _ = session.pipeline_chat_history.get_or_create(
             type=self.history_type, name=self._get_history_name(node_id)
         )
@@ -845,43 +856,14 @@ class CodeNode(PipelineNode):
         if not value:
             value = DEFAULT_FUNCTION
         try:
-            byte_code = compile_restricted(
-                value,
-                filename="<inline code>",
-                mode="exec",
-            )
-            custom_locals = {}
-            try:
-                exec(byte_code, {}, custom_locals)
-            except Exception as exc:
-                raise PydanticCustomError("invalid_code", "{error}", {"error": str(exc)})
-
-            try:
-                main = custom_locals["main"]
-            except KeyError:
-                raise SyntaxError("You must define a 'main' function")
-
-            for name, item in custom_locals.items():
-                if name != "main" and inspect.isfunction(item):
-                    raise SyntaxError(
-                        "You can only define a single function, 'main' at the top level. "
-                        "You may use nested functions inside that function if required"
-                    )
-
-            if list(inspect.signature(main).parameters) != ["input", "kwargs"]:
-                raise SyntaxError("The main function should have the signature main(input, **kwargs) only.")
-
+            _validate_code(value)
         except SyntaxError as exc:
             raise PydanticCustomError("invalid_code", "{error}", {"error": exc.msg})
         return value
 
     def _process(self, input: str, state: PipelineState, node_id: str) -> PipelineState:
         function_name = "main"
-        byte_code = compile_restricted(
-            self.code,
-            filename="<inline code>",
-            mode="exec",
-        )
+        byte_code = _compile_code(self.code)
 
         custom_locals = {}
         custom_globals = self._get_custom_globals(state)
@@ -894,23 +876,11 @@ class CodeNode(PipelineNode):
         return PipelineState.from_node_output(node_name=self.name, node_id=node_id, output=result)
 
     def _get_custom_globals(self, state: PipelineState):
-        from RestrictedPython.Eval import (
-            default_guarded_getitem,
-            default_guarded_getiter,
-        )
-
-        custom_globals = safe_globals.copy()
+        custom_globals = _get_code_globals_template().copy()
 
         participant_data_proxy = self.get_participant_data_proxy(state)
         custom_globals.update(
             {
-                "__builtins__": self._get_custom_builtins(),
-                "json": json,
-                "datetime": datetime,
-                "time": time,
-                "_getitem_": default_guarded_getitem,
-                "_getiter_": default_guarded_getiter,
-                "_write_": lambda x: x,
                 "get_participant_data": participant_data_proxy.get,
                 "set_participant_data": participant_data_proxy.set,
                 "get_participant_schedules": participant_data_proxy.get_schedules,
@@ -949,32 +919,91 @@ class CodeNode(PipelineNode):
 
         return set_temp_state_key
 
-    def _get_custom_builtins(self):
-        allowed_modules = {
-            "json",
-            "re",
-            "datetime",
-            "time",
-            "random",
+
+@functools.lru_cache(maxsize=256)
+def _compile_code(code: str) -> CodeType:
+    """Compile the code of a Python node. The result is cached since the code of a node rarely changes
+    and compiling it is much slower than running it."""
+    return compile_restricted(code, filename="<inline code>", mode="exec")
+
+
+@functools.lru_cache(maxsize=256)
+def _validate_code(code: str):
+    """Validate the code of a Python node. Only successful validations are cached, errors are raised
+    every time."""
+    byte_code = _compile_code(code)
+    custom_locals = {}
+    try:
+        exec(byte_code, {}, custom_locals)
+    except Exception as exc:
+        raise PydanticCustomError("invalid_code", "{error}", {"error": str(exc)})
+
+    try:
+        main = custom_locals["main"]
+    except KeyError:
+        raise SyntaxError("You must define a 'main' function")
+
+    for name, item in custom_locals.items():
+        if name != "main" and inspect.isfunction(item):
+            raise SyntaxError(
+                "You can only define a single function, 'main' at the top level. "
+                "You may use nested functions inside that function if required"
+            )
+
+    if list(inspect.signature(main).parameters) != ["input", "kwargs"]:
+        raise SyntaxError("The main function should have the signature main(input, **kwargs) only.")
+
+
+@functools.cache
+def _get_code_globals_template() -> dict:
+    """The globals that are shared by every run of a Python node. Callers must copy the result
+    before adding run specific values to it."""
+    from RestrictedPython.Eval import (
+        default_guarded_getitem,
+        default_guarded_getiter,
+    )
+
+    custom_globals = safe_globals.copy()
+    custom_globals.update(
+        {
+            "__builtins__": _get_code_builtins(),
+            "json": json,
+            "datetime": datetime,
+            "time": time,
+            "_getitem_": default_guarded_getitem,
+            "_getiter_": default_guarded_getiter,
+            "_write_": lambda x: x,
         }
-        custom_builtins = safe_builtins.copy()
-        custom_builtins.update(
-            {
-                "min": min,
-                "max": max,
-                "sum": sum,
-                "abs": abs,
-                "all": all,
-                "any": any,
-                "datetime": datetime,
-                "random": random,
-            }
-        )
+    )
+    return custom_globals
+
+
+def _get_code_builtins():
+    allowed_modules = {
+        "json",
+        "re",
+        "datetime",
+        "time",
+        "random",
+    }
+    custom_builtins = safe_builtins.copy()
+    custom_builtins.update(
+        {
+            "min": min,
+            "max": max,
+            "sum": sum,
+            "abs": abs,
+            "all": all,
+            "any": any,
+            "datetime": datetime,
+            "random": random,
+        }
+    )
 
-        def guarded_import(name, *args, **kwargs):
-            if name not in allowed_modules:
-                raise ImportError(f"Importing '{name}' is not allowed")
-            return __import__(name, *args, **kwargs)
+    def guarded_import(name, *args, **kwargs):
+        if name not in allowed_modules:
+            raise ImportError(f"Importing '{name}' is not allowed")
+        return __import__(name, *args, **kwargs)
 
-        custom_builtins["__import__"] = guarded_import
-        return custom_builtins
+    custom_builtins["__import__"] = guarded_import
+    return custom_builtins
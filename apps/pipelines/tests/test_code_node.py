@@ -1,13 +1,16 @@
 import json
+import time
 from unittest import mock
 
 import pytest
+from RestrictedPython import compile_restricted
 
 from apps.channels.datamodels import Attachment
 from apps.experiments.models import ExperimentSession, Participant, ParticipantData
 from apps.files.models import File
 from apps.pipelines.exceptions import PipelineNodeBuildError, PipelineNodeRunError
 from apps.pipelines.nodes.base import PipelineState
+from apps.pipelines.nodes.nodes import CodeNode, _compile_code
 from apps.pipelines.tests.utils import (
     code_node,
     create_runnable,
@@ -527,3 +530,42 @@ def main(input, **kwargs):
 
     experiment_session.refresh_from_db()
     assert experiment_session.state["message_count"] == 2
+
+
+@pytest.mark.django_db()
+@mock.patch("apps.pipelines.nodes.base.PipelineNode.logger", mock.Mock())
+def test_code_node_compiles_code_once(experiment_session):
+    """Running a Python node repeatedly should only compile its code once"""
+    _compile_code.cache_clear()
+    runs = 200
+    state = PipelineState(messages=["abc"], experiment_session=experiment_session, temp_state={})
+    with mock.patch("apps.pipelines.nodes.nodes.compile_restricted", wraps=compile_restricted) as compile_mock:
+        node = CodeNode(name="code", code="def main(input, **kwargs):\n\treturn input[::-1]")
+        for _ in range(runs):
+            node._process("abc", state, node_id="123")
+
+    assert compile_mock.call_count == 1
+
+
+@pytest.mark.benchmark()
+@pytest.mark.django_db()
+@mock.patch("apps.pipelines.nodes.base.PipelineNode.logger", mock.Mock())
+def test_code_node_compile_benchmark(experiment_session):
+    """Compares the time per run of a Python node when its code is compiled every time and when the compiled code
+    is cached"""
+    runs = 200
+    state = PipelineState(messages=["abc"], experiment_session=experiment_session, temp_state={})
+    node = CodeNode(name="code", code="def main(input, **kwargs):\n\treturn input[::-1]")
+
+    def _time_per_run(clear_cache: bool) -> float:
+        _compile_code.cache_clear()
+        start = time.perf_counter()
+        for _ in range(runs):
+            if clear_cache:
+                _compile_code.cache_clear()
+            node._process("abc", state, node_id="123")
+        return (time.perf_counter() - start) / runs
+
+    cold = _time_per_run(clear_cache=True)
+    cached = _time_per_run(clear_cache=False)
+    print(f"\nCodeNode run: {cold * 1000:.3f}ms compiling every run, {cached * 1000:.3f}ms with cached compile")
@@ -6,6 +6,7 @@ import pytest
 from apps.channels.models import ExperimentChannel
 from apps.events.models import EventActionType
 from apps.experiments.models import Experiment, ExperimentSession, Participant
+from apps.pipelines.graph import compiled_graph_cache
 from apps.pipelines.tests.utils import create_runnable, end_node, llm_response_with_prompt_node, start_node
 from apps.utils.factories.assistants import OpenAiAssistantFactory
 from apps.utils.factories.events import EventActionFactory, ExperimentFactory, StaticTriggerFactory
@@ -129,6 +130,21 @@ class TestPipeline:
 
         assert ExperimentSession.objects.count() == 0
 
+    @pytest.mark.django_db()
+    def test_invoke_reuses_compiled_graph(self, team_with_users):
+        compiled_graph_cache.clear()
+        user = team_with_users.members.first()
+        pipeline = PipelineFactory(team=team_with_users)
+
+        pipeline.simple_invoke("test", user.id)
+        pipeline.simple_invoke("test", user.id)
+        info = compiled_graph_cache.info()
+        assert (info.hits, info.misses, info.size) == (1, 1, 1)
+
+        # editing the pipeline clears its compiled graphs
+        pipeline.update_nodes_from_data()
+        assert compiled_graph_cache.info().size == 0
+
     @pytest.mark.django_db()
     def test_archive_pipeline(self):
         assistant = OpenAiAssistantFactory()
@@ -1,7 +1,12 @@
+import re
+from collections import Counter
 from unittest import mock
 
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
+from apps.chat.models import ChatMessageType
 from apps.pipelines.models import PipelineChatHistory
 from apps.pipelines.nodes.base import PipelineState
 from apps.pipelines.tests.utils import create_runnable, end_node, llm_response_with_prompt_node, start_node
@@ -389,3 +394,73 @@ def test_llm_with_no_history(get_llm_service, provider, pipeline, experiment_ses
     assert [
         [(message.type, message.content) for message in call] for call in llm.get_call_messages()
     ] == expected_call_messages
+
+
+@django_db_with_data(available_apps=("apps.service_providers",))
+@mock.patch("apps.service_providers.models.LlmProvider.get_llm_service")
+@mock.patch("apps.pipelines.nodes.base.PipelineNode.logger", mock.Mock())
+def test_pipeline_run_history_saved_in_bulk(get_llm_service, provider, pipeline, experiment_session):
+    llm = FakeLlmEcho()
+    get_llm_service.return_value = build_fake_llm_service(None, [0], llm)
+    llm_provider_model_id = str(experiment_session.experiment.llm_provider_model.id)
+    llm_1 = llm_response_with_prompt_node(
+        str(provider.id), llm_provider_model_id, prompt="Node 1:", history_type="named", history_name="history1"
+    )
+    llm_2 = llm_response_with_prompt_node(
+        str(provider.id), llm_provider_model_id, prompt="Node 2:", history_type="named", history_name="history1"
+    )
+    llm_3 = llm_response_with_prompt_node(
+        str(provider.id), llm_provider_model_id, prompt="Node 3:", history_type="node"
+    )
+    create_runnable(pipeline, [start_node(), llm_1, llm_2, llm_3, end_node()])
+
+    pipeline.invoke(
+        PipelineState(messages=["Hi"], experiment_session=experiment_session, pipeline_version=pipeline.version_number),
+        experiment_session,
+    )
+    with CaptureQueriesContext(connection) as queries:
+        output = pipeline.invoke(
+            PipelineState(
+                messages=["Bye"], experiment_session=experiment_session, pipeline_version=pipeline.version_number
+            ),
+            experiment_session,
+        )
+
+    # Node 2 sees the message that node 1 added to the shared history in the same run
+    assert [(message.type, message.content) for message in llm.get_call_messages()[-2]][-3:] == [
+        ("human", "Bye"),
+        ("ai", "Node 1: Bye"),
+        ("human", "Node 1: Bye"),
+    ]
+    named_history = PipelineChatHistory.objects.get(session=experiment_session, name="history1")
+    assert named_history.messages.count() == 4
+    node_history = PipelineChatHistory.objects.get(session=experiment_session, name=llm_3["id"])
+    assert [message.as_tuples() for message in node_history.messages.order_by("created_at")] == [
+        [("human", "Node 2: Node 1: Hi"), ("ai", "Node 3: Node 2: Node 1: Hi")],
+        [("human", "Node 2: Node 1: Bye"), ("ai", "Node 3: Node 2: Node 1: Bye")],
+    ]
+
+    chat_messages = list(experiment_session.chat.messages.order_by("created_at"))
+    assert [(message.message_type, message.content) for message in chat_messages[-2:]] == [
+        (ChatMessageType.HUMAN, "Bye"),
+        (ChatMessageType.AI, "Node 3: Node 2: Node 1: Bye"),
+    ]
+    assert output["ai_message_id"] == chat_messages[-1].id
+    assert chat_messages[-1].all_tag_names() == [f"v{pipeline.version_number}-unreleased"]
+    experiment_session.chat.refresh_from_db()
+    assert experiment_session.chat.last_human_message_id == chat_messages[-2].id
+    assert pipeline.runs.last().output["ai_message_id"] == chat_messages[-1].id
+
+    # each table is written to once at the end of the run, except for the named history that was read mid-run
+    inserts = Counter(
+        re.match(r'INSERT INTO "(\w+)"', query["sql"]).group(1)
+        for query in queries.captured_queries
+        if query["sql"].startswith("INSERT")
+    )
+    assert inserts == {
+        "pipelines_pipelinechatmessages": 2,
+        "chat_chatmessage": 1,
+        "annotations_customtaggeditem": 1,
+        "field_audit_auditevent": 1,
+        "pipelines_pipelinerun": 1,
+    }
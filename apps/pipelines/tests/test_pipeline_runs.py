@@ -1,12 +1,16 @@
+from datetime import datetime
 from unittest.mock import patch
 
 import pytest
+from django.db import DatabaseError
+from django.urls import reverse
 from langchain_core.runnables import RunnableLambda
 
 from apps.channels.datamodels import Attachment
 from apps.chat.models import ChatMessage, ChatMessageType
 from apps.experiments.models import ExperimentSession
-from apps.pipelines.models import LogEntry, Pipeline, PipelineRunStatus
+from apps.pipelines.logging import MAX_LOG_VALUE_LENGTH, get_logger
+from apps.pipelines.models import LogEntry, Pipeline, PipelineRun, PipelineRunStatus
 from apps.pipelines.nodes.base import PipelineNode, PipelineState
 from apps.pipelines.nodes.nodes import StartNode
 from apps.service_providers.models import TraceProvider
@@ -162,6 +166,48 @@ def test_running_failed_pipeline_logs_error(pipeline: Pipeline, session: Experim
     )
 
 
+@django_db_transactional()
+def test_pipeline_run_created_before_running(pipeline: Pipeline, session: ExperimentSession):
+    run_statuses = []
+
+    class RecordingNode(PipelineNode):
+        name: str = "recording"
+
+        def process(self, *args, **kwargs) -> RunnableLambda:
+            run_statuses.extend(pipeline.runs.values_list("status", flat=True))
+            raise Exception("Stop")
+
+    from apps.pipelines.nodes import nodes
+
+    with patch.object(nodes, StartNode.__name__, RecordingNode):
+        with pytest.raises(Exception, match="Stop"):
+            pipeline.invoke(PipelineState(messages=["Hi"]), session)
+
+    assert run_statuses == [PipelineRunStatus.RUNNING]
+    assert list(pipeline.runs.values_list("status", flat=True)) == [PipelineRunStatus.ERROR]
+
+
+@django_db_transactional()
+def test_failed_pipeline_run_save_error_keeps_original_error(pipeline: Pipeline, session: ExperimentSession):
+    class FailingNode(PipelineNode):
+        name: str = "failure"
+
+        def process(self, *args, **kwargs) -> RunnableLambda:
+            raise Exception("Bad things are afoot")
+
+    from apps.pipelines.nodes import nodes
+
+    with (
+        patch.object(nodes, StartNode.__name__, FailingNode),
+        patch.object(Pipeline, "_save_pipeline_run", side_effect=DatabaseError("Save failed")),
+    ):
+        with pytest.raises(Exception, match="Bad things are afoot"):
+            pipeline.invoke(PipelineState(messages=["Hi"]), session)
+
+    # the run was created when it started
+    assert pipeline.runs.get().status == PipelineRunStatus.RUNNING
+
+
 @django_db_transactional()
 def test_running_pipeline_stores_session(pipeline: Pipeline, session: ExperimentSession):
     input = "foo"
@@ -189,3 +235,38 @@ def test_save_trace_metadata(pipeline: Pipeline, session: ExperimentSession):
     assert "trace_info" in human_message.metadata
     ai_message = session.chat.messages.filter(message_type=ChatMessageType.AI).first()
     assert "trace_info" in ai_message.metadata
+
+
+@pytest.mark.django_db()
+def test_log_entries_capped(pipeline: Pipeline):
+    run = PipelineRun.objects.create(pipeline=pipeline, status=PipelineRunStatus.RUNNING, log={"entries": []})
+    log = get_logger("test", run)
+    with patch("apps.pipelines.logging.MAX_LOG_ENTRIES", 3):
+        for i in range(5):
+            log.info(f"message {i}", input="x" * (MAX_LOG_VALUE_LENGTH + 10))
+        log.error("failed")
+
+    assert [entry["message"] for entry in run.log["entries"]] == ["message 0", "message 1", "message 2", "failed"]
+    assert run.log["dropped_entries"] == 2
+    assert run.log["entries"][0]["input"] == f"{'x' * MAX_LOG_VALUE_LENGTH}... (10 characters truncated)"
+
+
+@pytest.mark.django_db()
+def test_run_logs_view_paginates_entries(client, team_with_users):
+    pipeline = PipelineFactory(team=team_with_users)
+    entries = [LogEntry(time=datetime.now(), level="INFO", message=f"message {i}").model_dump() for i in range(75)]
+    run = PipelineRun.objects.create(
+        pipeline=pipeline, status=PipelineRunStatus.SUCCESS, log={"entries": entries, "dropped_entries": 3}
+    )
+    client.force_login(team_with_users.members.first())
+    response = client.get(run.get_absolute_url())
+    assert reverse("pipelines:run_logs", args=[team_with_users.slug, pipeline.id, run.id]) in response.content.decode()
+
+    url = reverse("pipelines:run_logs", args=[team_with_users.slug, pipeline.id, run.id])
+
+    response = client.get(url)
+    assert [entry["message"] for entry in response.context["page_obj"]] == [f"message {i}" for i in range(50)]
+    assert response.context["dropped_entries"] == 3
+
+    response = client.get(url, {"page": 2})
+    assert [entry["message"] for entry in response.context["page_obj"]] == [f"message {i}" for i in range(50, 75)]
@@ -10,6 +10,7 @@ from langchain_core.runnables import RunnableConfig
 from apps.channels.datamodels import Attachment
 from apps.experiments.models import ParticipantData
 from apps.pipelines.exceptions import PipelineBuildError, PipelineNodeBuildError
+from apps.pipelines.graph import CompiledGraphCache
 from apps.pipelines.logging import LoggingCallbackHandler
 from apps.pipelines.nodes.base import PipelineState, merge_dicts
 from apps.pipelines.nodes.nodes import EndNode, RouterNode, StartNode, StaticRouterNode
@@ -1078,3 +1079,17 @@ def test_pipeline_history_manager_metadata_storage(get_llm_service, pipeline):
 )
 def test_merge_dicts(left, right, expected):
     assert merge_dicts(left, right) == expected
+
+
+def test_compiled_graph_cache_evicts_least_recently_used():
+    cache = CompiledGraphCache(maxsize=2)
+    cache.get_or_build((1, "a"), lambda: "graph 1")
+    cache.get_or_build((2, "a"), lambda: "graph 2")
+    assert cache.get_or_build((1, "a"), Mock()) == "graph 1"
+    cache.get_or_build((3, "a"), lambda: "graph 3")
+
+    assert list(cache.graphs) == [(1, "a"), (3, "a")]
+    assert (cache.info().hits, cache.info().misses) == (1, 3)
+
+    cache.invalidate(1)
+    assert list(cache.graphs) == [(3, "a")]
@@ -11,6 +11,7 @@ urlpatterns = [
     path("<int:pk>/details", views.pipeline_details, name="details"),
     path("<int:pk>/runs_table/", views.PipelineRunsTableView.as_view(), name="runs_table"),
     path("<int:pipeline_pk>/run/<int:run_pk>", views.run_details, name="run_details"),
+    path("<int:pipeline_pk>/run/<int:run_pk>/logs/", views.run_logs, name="run_logs"),
     path("<int:pipeline_pk>/message/", views.simple_pipeline_message, name="pipeline_message"),
     path(
         "<int:pipeline_pk>/message/get_response/<slug:task_id>",
@@ -6,6 +6,7 @@ from celery_progress.backend import Progress
 from django.contrib import messages
 from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.core.paginator import Paginator
 from django.db.models import Count, QuerySet, Subquery
 from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
@@ -35,6 +36,8 @@ from apps.teams.models import Flag
 from ..generics.chips import Chip
 from ..generics.help import render_help_with_link
 
+LOG_ENTRIES_PER_PAGE = 50
+
 
 class PipelineHome(LoginAndTeamRequiredMixin, TemplateView, PermissionRequiredMixin):
     permission_required = "pipelines.view_pipeline"
@@ -290,7 +293,7 @@ class PipelineRunsTableView(SingleTableView, PermissionRequiredMixin):
 @login_and_team_required
 @permission_required("pipelines.view_pipelinerun")
 def run_details(request, team_slug: str, run_pk: int, pipeline_pk: int):
-    pipeline_run = get_object_or_404(PipelineRun, id=run_pk, pipeline__id=pipeline_pk)
+    pipeline_run = get_object_or_404(PipelineRun.objects.defer("log"), id=run_pk, pipeline__id=pipeline_pk)
     if pipeline_run.pipeline.team.slug != team_slug:
         raise Http404()
     return render(
@@ -300,6 +303,23 @@ def run_details(request, team_slug: str, run_pk: int, pipeline_pk: int):
     )
 
 
+@login_and_team_required
+@permission_required("pipelines.view_pipelinerun")
+def run_logs(request, team_slug: str, run_pk: int, pipeline_pk: int):
+    pipeline_run = get_object_or_404(
+        PipelineRun.objects.defer("log", "input", "output"), id=run_pk, pipeline__id=pipeline_pk
+    )
+    if pipeline_run.pipeline.team.slug != team_slug:
+        raise Http404()
+    log_entries = pipeline_run.get_log_entries()
+    page = Paginator(log_entries, LOG_ENTRIES_PER_PAGE).get_page(request.GET.get("page"))
+    return render(
+        request,
+        "pipelines/components/pipeline_run_logs.html",
+        {"pipeline_run": pipeline_run, "page_obj": page, "dropped_entries": log_entries.dropped_entries},
+    )
+
+
 @login_and_team_required
 @require_POST
 @csrf_exempt
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LlmProvidersConfig(AppConfig):
     name = "apps.service_providers"
     label = "service_providers"
+
+    def ready(self):
+        from . import signals  # noqa  F401
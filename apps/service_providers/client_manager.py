@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterable
+from threading import RLock
+from typing import Generic, TypeVar
+
+logger = logging.getLogger("ocs.service_providers")
+
+ClientT = TypeVar("ClientT")
+
+
+class KeyedClientManager(Generic[ClientT]):
+    """This class keeps API clients in a registry so that they can be shared between requests instead of creating a
+    new client for every request. Clients are registered under a key made from the parts that identify them, e.g. the
+    credentials and base URL they are used with. The key parts are hashed so that credentials aren't kept in memory
+    or logged.
+
+    Clients that haven't been requested for `stale_timeout` seconds are removed from the registry, as are the
+    oldest clients when there are more than `max_clients`. Removed clients are closed unless
+    `close_removed_clients` is `False`. All the clients are closed on `shutdown`.
+    """
+
+    close_removed_clients = True
+
+    def __init__(self, stale_timeout=300, prune_interval=60, max_clients=50) -> None:
+        self.clients: dict[str, tuple[float, ClientT]] = {}
+        self.stale_timeout = stale_timeout
+        self.max_clients = max_clients
+        self.prune_interval = prune_interval
+        self.lock = RLock()
+        self._start_prune_thread()
+
+    def get_client(self, key_parts: Iterable, build_client: Callable[[], ClientT]) -> ClientT:
+        """Returns the client for `key_parts`, calling `build_client` to create it if there isn't one yet"""
+        key = self._get_key(key_parts)
+        with self.lock:
+            if key not in self.clients:
+                logger.debug("Creating new %s with key '%s'", type(self).__name__, key)
+                client = build_client()
+            else:
+                client = self.clients[key][1]
+            self.clients[key] = (time.time(), client)
+        return client
+
+    def close_client(self, client: ClientT):
+        raise NotImplementedError
+
+    def _get_key(self, key_parts: Iterable) -> str:
+        return hashlib.sha256("\0".join(map(str, key_parts)).encode()).hexdigest()
+
+    def _start_prune_thread(self):
+        self._prune_thread = threading.Thread(target=self._prune_worker, daemon=True)
+        self._prune_thread.start()
+
+    def _prune_worker(self):
+        while True:
+            time.sleep(self.prune_interval)
+            self._prune_stale()
+
+    def _prune_stale(self):
+        if not self.clients:
+            return
+
+        removed = []
+        with self.lock:
+            now = time.time()
+            for key in [key for key, (timestamp, _) in self.clients.items() if now - timestamp > self.stale_timeout]:
+                logger.debug("Pruning old client with key '%s'", key)
+                removed.append(self.clients.pop(key)[1])
+
+            if len(self.clients) > self.max_clients:
+                # remove the oldest clients until we are below the max
+                sorted_keys = sorted(self.clients, key=lambda key: self.clients[key][0])
+                keys_to_remove = sorted_keys[: len(self.clients) - self.max_clients]
+                logger.debug("Pruned %d clients above max limit", len(keys_to_remove))
+                removed.extend(self.clients.pop(key)[1] for key in keys_to_remove)
+
+        if self.close_removed_clients:
+            for client in removed:
+                self.close_client(client)
+
+    def shutdown(self):
+        if not self.clients:
+            return
+
+        with self.lock:
+            clients = [client for _, client in self.clients.values()]
+            self.clients = {}
+        logger.debug("Closing all clients (%s)", len(clients))
+        for client in clients:
+            self.close_client(client)
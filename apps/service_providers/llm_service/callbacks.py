@@ -1,9 +1,13 @@
 import threading
+from collections.abc import Callable
+from contextlib import contextmanager
+from contextvars import ContextVar
 from typing import Any
 from uuid import UUID
 
 from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
 
 from apps.service_providers.llm_service.token_counters import TokenCounter
 
@@ -57,3 +61,37 @@ class TokenCountingCallbackHandler(BaseCallbackHandler):
         if not response:
             return
         self.on_llm_end(response, run_id=run_id)
+
+
+# LLM runs with this tag produce the response that is sent to the user and may have their tokens streamed
+STREAM_OUTPUT_TAG = "ocs:stream_output"
+
+
+class TokenStreamCallbackHandler(BaseCallbackHandler):
+    """Passes the tokens of LLM runs tagged with `STREAM_OUTPUT_TAG` to `on_token` as they are generated."""
+
+    def __init__(self, on_token: Callable[[str], Any]):
+        super().__init__()
+        self.on_token = on_token
+
+    def on_llm_new_token(self, token: str, *, tags: list[str] | None = None, **kwargs: Any) -> None:
+        if token and tags and STREAM_OUTPUT_TAG in tags:
+            self.on_token(token)
+
+
+_token_stream_handler: ContextVar[TokenStreamCallbackHandler | None] = ContextVar("token_stream_handler", default=None)
+register_configure_hook(_token_stream_handler, inheritable=True)
+
+
+@contextmanager
+def stream_output_tokens(on_token: Callable[[str], Any]):
+    """Call `on_token` with each output token generated by LLM runs within this context.
+
+    The handler is attached to every callback manager that LangChain configures in this context
+    so it doesn't need to be passed down through the bots and runnables.
+    """
+    reset_token = _token_stream_handler.set(TokenStreamCallbackHandler(on_token))
+    try:
+        yield
+    finally:
+        _token_stream_handler.reset(reset_token)
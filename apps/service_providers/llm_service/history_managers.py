@@ -5,10 +5,11 @@ from typing import Self
 
 from langchain_core.language_models.chat_models import BaseChatModel
 
-from apps.annotations.models import Tag, TagCategories
+from apps.annotations.models import TagCategories
 from apps.chat.conversation import compress_chat_history, compress_pipeline_chat_history
 from apps.chat.models import ChatMessage, ChatMessageType
 from apps.experiments.models import Experiment, ExperimentSession
+from apps.pipelines.history import get_history_buffer
 from apps.pipelines.models import PipelineChatHistory, PipelineChatHistoryTypes
 
 
@@ -47,6 +48,8 @@ class ExperimentHistoryManager(BaseHistoryManager):
         self.trace_service = trace_service
         self.ai_message = None
         self.history_mode = history_mode
+        # messages that are held back from the history until the caller decides whether to save them
+        self.held_back_messages: list[dict] | None = None
 
         # TODO: Think about passing this in as context metadata rather
         self.experiment_version_number = experiment.version_number
@@ -90,6 +93,20 @@ class ExperimentHistoryManager(BaseHistoryManager):
         experiment_tag: str,
         output_message_metadata: dict,
     ):
+        if self.held_back_messages is not None:
+            self.held_back_messages.append(
+                {
+                    "input": input,
+                    "save_input_to_history": save_input_to_history,
+                    "input_message_metadata": input_message_metadata,
+                    "output": output,
+                    "save_output_to_history": save_output_to_history,
+                    "experiment_tag": experiment_tag,
+                    "output_message_metadata": output_message_metadata,
+                }
+            )
+            return
+
         if save_input_to_history:
             self.save_message_to_history(input, type_=ChatMessageType.HUMAN, message_metadata=input_message_metadata)
 
@@ -101,6 +118,17 @@ class ExperimentHistoryManager(BaseHistoryManager):
                 experiment_tag=experiment_tag,
             )
 
+    def hold_back_messages(self):
+        """Hold back the messages added to the history until `release_held_back_messages` is called"""
+        self.held_back_messages = []
+
+    def release_held_back_messages(self, save: bool):
+        """Saves the held back messages to the history, or discards them if `save` is `False`"""
+        messages, self.held_back_messages = self.held_back_messages or [], None
+        if save:
+            for message_kwargs in messages:
+                self.add_messages_to_history(**message_kwargs)
+
     def save_message_to_history(
         self,
         message: str,
@@ -122,21 +150,17 @@ class ExperimentHistoryManager(BaseHistoryManager):
             metadata=metadata,
         )
 
+        tags = []
         if experiment_tag:
-            tag, _ = Tag.objects.get_or_create(
-                name=experiment_tag,
-                team=self.session.team,
-                is_system_tag=True,
-                category=TagCategories.BOT_RESPONSE,
-            )
-            chat_message.add_tag(tag, team=self.session.team, added_by=None)
+            tags.append((experiment_tag, TagCategories.BOT_RESPONSE))
 
         if type_ == ChatMessageType.AI:
             self.ai_message = chat_message
-            chat_message.add_version_tag(
-                version_number=self.experiment_version_number, is_a_version=self.experiment_is_a_version
-            )
+            version_tag = ChatMessage.get_version_tag_name(self.experiment_version_number, self.experiment_is_a_version)
+            tags.append((version_tag, TagCategories.EXPERIMENT_VERSION))
 
+        if tags:
+            chat_message.add_system_tags_to_new_message(tags)
         return chat_message
 
     def get_trace_metadata(self) -> dict:
@@ -210,6 +234,9 @@ class PipelineHistoryManager(BaseHistoryManager):
                 input_messages=input_messages,
             )
 
+        if history_buffer := get_history_buffer(self.session):
+            history_buffer.save_pipeline_history(self.history_type, self._get_history_name())
+
         try:
             history: PipelineChatHistory = self.session.pipeline_chat_history.get(
                 type=self.history_type, name=self._get_history_name()
@@ -241,10 +268,14 @@ class PipelineHistoryManager(BaseHistoryManager):
             # Global History is saved outside of the node
             return
 
+        output = output or ""  # generation likely errored resulting in a None output
+        if history_buffer := get_history_buffer(self.session):
+            return history_buffer.add_pipeline_message(
+                self.history_type, self._get_history_name(), self.node_id, input, output
+            )
+
         history, _ = self.session.pipeline_chat_history.get_or_create(
             type=self.history_type, name=self._get_history_name()
         )
-
-        output = output or ""  # generation likely errored resulting in a None output
         message = history.messages.create(human_message=input, ai_message=output, node_id=self.node_id)
         return message
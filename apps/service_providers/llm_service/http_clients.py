@@ -0,0 +1,34 @@
+import atexit
+from collections.abc import Callable
+
+import httpx
+
+from apps.service_providers.client_manager import KeyedClientManager
+
+
+class HttpClientManager(KeyedClientManager[httpx.Client]):
+    """This class manages the HTTP clients used by the LLM chat models so that models with the same credentials and
+    base URL share a connection pool instead of opening new connections for every message.
+
+    Removed clients aren't closed since a chat model may still be using them. Their connections are closed once
+    they are garbage collected."""
+
+    close_removed_clients = False
+
+    def get(self, build_client: Callable[..., httpx.Client], *key_parts, **client_kwargs) -> httpx.Client:
+        """Returns the client for `key_parts`, calling `build_client` with `client_kwargs` to create it if there isn't
+        one yet. The key parts should identify the credentials and base URL the client will be used with."""
+        key_parts = (build_client.__module__, build_client.__qualname__, *key_parts)
+        return self.get_client(key_parts, lambda: build_client(**client_kwargs))
+
+    def close_client(self, client: httpx.Client):
+        client.close()
+
+
+http_client_manager = HttpClientManager()
+
+
+@atexit.register
+def _shutdown():
+    """Close the shared HTTP clients when the program exits."""
+    http_client_manager.shutdown()
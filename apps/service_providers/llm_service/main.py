@@ -1,8 +1,15 @@
+import logging
+import time
+from dataclasses import dataclass
 from io import BytesIO
 from time import sleep
-from typing import Any
+from typing import Any, Self
 
+import anthropic
+import httpx
+import openai
 import pydantic
+from django.conf import settings
 from langchain.agents.openai_assistant import OpenAIAssistantRunnable as BrokenOpenAIAssistantRunnable
 from langchain_anthropic import ChatAnthropic
 from langchain_core.callbacks import BaseCallbackHandler, CallbackManager
@@ -12,18 +19,51 @@ from langchain_core.messages import HumanMessage
 from langchain_core.runnables import RunnableConfig, ensure_config
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_openai.chat_models import AzureChatOpenAI, ChatOpenAI
-from openai import OpenAI
+from openai import OpenAI, Stream
 from openai._base_client import SyncAPIClient
+from openai.types.beta import AssistantStreamEvent
+from openai.types.beta.threads import Run
+from pydantic import Field, model_validator
 
 from apps.service_providers.llm_service.callbacks import TokenCountingCallbackHandler
+from apps.service_providers.llm_service.http_clients import http_client_manager
 from apps.service_providers.llm_service.token_counters import (
     AnthropicTokenCounter,
     GeminiTokenCounter,
     OpenAITokenCounter,
 )
 
+logger = logging.getLogger("ocs.llm_service")
+
+# Run states in which a run stream ends
+STREAM_END_STATES = ("completed", "requires_action", "failed", "cancelled", "expired", "incomplete")
+# The first interval (in seconds) when polling runs. The interval grows by `POLL_BACKOFF_FACTOR` after every poll.
+MIN_POLL_INTERVAL = 0.1
+POLL_BACKOFF_FACTOR = 1.5
+
+
+def get_http_client(client_class: type[httpx.Client], api_key: str, api_base: str | None) -> httpx.Client:
+    """Returns the HTTP client shared by the chat models that use the provider account.
+
+    The client's connection limit caps the number of concurrent requests each worker process sends to the account.
+    Requests above the limit wait for a connection to be freed instead of being rejected by the provider.
+    """
+    max_requests = settings.LLM_PROVIDER_MAX_CONCURRENT_REQUESTS
+    limits = httpx.Limits(max_connections=max_requests, max_keepalive_connections=max_requests)
+    return http_client_manager.get(client_class, api_key, api_base, limits=limits)
+
+
+@dataclass
+class RunPollStats:
+    polls: int = 0
+
 
 class OpenAIAssistantRunnable(BrokenOpenAIAssistantRunnable):
+    stream_runs: bool = True
+    """Follow runs through their streamed events instead of polling them"""
+    poll_stats: RunPollStats = Field(default_factory=RunPollStats, exclude=True)
+    """The total number of times runs were polled by this runnable"""
+
     # This is a temporary solution to fix langchain's compatability with the assistants v2 API. This code is
     # copied from:
     # `https://github.com/langchain-ai/langchain/blob/54adcd9e828e24bb24b2055f410137aca6a12834/libs/langchain/
@@ -43,7 +83,7 @@ class OpenAIAssistantRunnable(BrokenOpenAIAssistantRunnable):
             # Being run within AgentExecutor and there are tool outputs to submit.
             if self.as_agent and input.get("intermediate_steps"):
                 tool_outputs = self._parse_intermediate_steps(input["intermediate_steps"])
-                run = self.client.beta.threads.runs.submit_tool_outputs(**tool_outputs)
+                run = self.client.beta.threads.runs.submit_tool_outputs(**tool_outputs, stream=self.stream_runs)
             # Starting a new thread and a new run.
             elif "thread_id" not in input:
                 thread = {
@@ -71,8 +111,8 @@ class OpenAIAssistantRunnable(BrokenOpenAIAssistantRunnable):
             # Submitting tool outputs to an existing run, outside the AgentExecutor
             # framework.
             else:
-                run = self.client.beta.threads.runs.submit_tool_outputs(**input)
-            run = self._wait_for_run(run.id, run.thread_id)
+                run = self.client.beta.threads.runs.submit_tool_outputs(**input, stream=self.stream_runs)
+            run = self._wait_for_run_result(run)
         except BaseException as e:
             run_manager.on_chain_error(e)
             raise e
@@ -85,15 +125,95 @@ class OpenAIAssistantRunnable(BrokenOpenAIAssistantRunnable):
             run_manager.on_chain_end(response)
             return response
 
-    def _wait_for_run(self, run_id: str, thread_id: str, progress_states=("in_progress", "queued")) -> Any:
-        in_progress = True
-        while in_progress:
-            run = self.client.beta.threads.runs.retrieve(run_id, thread_id=thread_id)
-            in_progress = run.status in progress_states
-            if in_progress:
-                sleep(self.check_every_ms / 1000)
+    def _create_run(self, input: dict) -> Any:
+        params = {k: v for k, v in input.items() if k in ("instructions", "model", "tools", "run_metadata")}
+        return self.client.beta.threads.runs.create(
+            input["thread_id"], assistant_id=self.assistant_id, stream=self.stream_runs, **params
+        )
+
+    def _create_thread_and_run(self, input: dict, thread: dict) -> Any:
+        params = {k: v for k, v in input.items() if k in ("instructions", "model", "tools", "run_metadata")}
+        return self.client.beta.threads.create_and_run(
+            assistant_id=self.assistant_id, thread=thread, stream=self.stream_runs, **params
+        )
+
+    def _wait_for_run_result(self, response: Run | Stream[AssistantStreamEvent]) -> Run:
+        """Waits for the run to finish or to require an action. Streamed runs are followed through their events.
+        Runs are polled if the response isn't a stream or the stream ends before the run is done."""
+        start = time.monotonic()
+        stats = RunPollStats()
+        streamed = isinstance(response, Stream)
+        run = self._wait_for_stream(response) if streamed else response
+        # a run that isn't streamed is only a snapshot of when it was created
+        if not streamed or run.status not in STREAM_END_STATES:
+            run = self._wait_for_run(run.id, run.thread_id, stats=stats)
+
+        self.poll_stats.polls += stats.polls
+        logger.info(
+            "Assistant run %s %s after %d polls in %.2f seconds",
+            run.id,
+            run.status,
+            stats.polls,
+            time.monotonic() - start,
+            extra={"run_id": run.id, "streamed": streamed, "polls": stats.polls},
+        )
         return run
 
+    def _wait_for_stream(self, stream: Stream[AssistantStreamEvent]) -> Run:
+        run = None
+        with stream:
+            for event in stream:
+                if isinstance(event.data, Run):
+                    run = event.data
+                    if run.status in STREAM_END_STATES:
+                        break
+        if run is None:
+            raise ValueError("The run stream ended without any run events")
+        return run
+
+    def _wait_for_run(
+        self, run_id: str, thread_id: str, progress_states=("in_progress", "queued"), stats: "RunPollStats" = None
+    ) -> Any:
+        """Polls the run until it leaves `progress_states`. The polling interval starts at `MIN_POLL_INTERVAL` and
+        backs off to `check_every_ms` so that short runs aren't delayed by a full interval."""
+        stats = stats or RunPollStats()
+        interval = MIN_POLL_INTERVAL
+        while True:
+            run = self.client.beta.threads.runs.retrieve(run_id, thread_id=thread_id)
+            stats.polls += 1
+            if run.status not in progress_states:
+                return run
+            sleep(interval)
+            interval = min(interval * POLL_BACKOFF_FACTOR, self.check_every_ms / 1000)
+
+
+class PooledChatAnthropic(ChatAnthropic):
+    """ChatAnthropic that accepts the HTTP client to use so that it can be shared between models.
+
+    langchain-anthropic doesn't accept an HTTP client so this replaces `ChatAnthropic.post_init`, which creates the
+    clients. It must be kept in line with the pinned version of langchain-anthropic. Only the sync client is pooled.
+    """
+
+    http_client: Any = Field(default=None, exclude=True)
+
+    @model_validator(mode="after")
+    def post_init(self) -> Self:
+        client_params: dict[str, Any] = {
+            "api_key": self.anthropic_api_key.get_secret_value(),
+            "base_url": self.anthropic_api_url,
+            "max_retries": self.max_retries,
+            "default_headers": (self.default_headers or None),
+        }
+        # value <= 0 indicates the param should be ignored. None is a meaningful value
+        # for Anthropic client and treated differently than not specifying the param at
+        # all.
+        if self.default_request_timeout is None or self.default_request_timeout > 0:
+            client_params["timeout"] = self.default_request_timeout
+
+        self._client = anthropic.Client(**client_params, http_client=self.http_client)
+        self._async_client = anthropic.AsyncClient(**client_params)
+        return self
+
 
 class LlmService(pydantic.BaseModel):
     _type: str
@@ -142,8 +262,12 @@ class OpenAIGenericService(LlmService):
         return {
             "openai_api_key": self.openai_api_key,
             "openai_api_base": self.openai_api_base,
+            "http_client": self._get_http_client(),
         }
 
+    def _get_http_client(self):
+        return get_http_client(openai.DefaultHttpxClient, self.openai_api_key, self.openai_api_base)
+
 
 class OpenAILlmService(OpenAIGenericService):
     openai_api_base: str = None
@@ -156,7 +280,12 @@ class OpenAILlmService(OpenAIGenericService):
         }
 
     def get_raw_client(self) -> OpenAI:
-        return OpenAI(api_key=self.openai_api_key, organization=self.openai_organization, base_url=self.openai_api_base)
+        return OpenAI(
+            api_key=self.openai_api_key,
+            organization=self.openai_organization,
+            base_url=self.openai_api_base,
+            http_client=self._get_http_client(),
+        )
 
     def get_assistant(self, assistant_id: str, as_agent=False):
         return OpenAIAssistantRunnable(assistant_id=assistant_id, as_agent=as_agent, client=self.get_raw_client())
@@ -181,6 +310,7 @@ class AzureLlmService(LlmService):
             openai_api_key=self.openai_api_key,
             deployment_name=llm_model,
             temperature=temperature,
+            http_client=get_http_client(openai.DefaultHttpxClient, self.openai_api_key, self.openai_api_base),
         )
 
     def get_callback_handler(self, model: str) -> BaseCallbackHandler:
@@ -192,11 +322,12 @@ class AnthropicLlmService(LlmService):
     anthropic_api_base: str
 
     def get_chat_model(self, llm_model: str, temperature: float) -> BaseChatModel:
-        return ChatAnthropic(
+        return PooledChatAnthropic(
             anthropic_api_key=self.anthropic_api_key,
             anthropic_api_url=self.anthropic_api_base,
             model=llm_model,
             temperature=temperature,
+            http_client=get_http_client(anthropic.DefaultHttpxClient, self.anthropic_api_key, self.anthropic_api_base),
         )
 
     def get_callback_handler(self, model: str) -> BaseCallbackHandler:
@@ -213,6 +344,7 @@ class DeepSeekLlmService(LlmService):
             temperature=temperature,
             openai_api_key=self.deepseek_api_key,
             openai_api_base=self.deepseek_api_base,
+            http_client=get_http_client(openai.DefaultHttpxClient, self.deepseek_api_key, self.deepseek_api_base),
         )
 
     def get_callback_handler(self, model: str) -> BaseCallbackHandler:
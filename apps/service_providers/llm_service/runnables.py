@@ -502,7 +502,7 @@ class AssistantChat(RunnableSerializable[dict, ChainOutput]):
             file_ids = [att.file_id for att in attachments if att.type == resource_name]
             if resource_files := File.objects.filter(id__in=file_ids):
                 # Upload the files to OpenAI
-                openai_file_ids = create_files_remote(client, resource_files)
+                openai_file_ids = create_files_remote(client, resource_files, self.adapter.assistant.llm_provider)
                 resource_file_ids[resource_name] = openai_file_ids
         return resource_file_ids
 
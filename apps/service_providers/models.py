@@ -136,6 +136,15 @@ class LlmProvider(BaseTeamModel, ProviderMixin):
     def type_enum(self):
         return LlmProviderTypes[str(self.type)]
 
+    @transaction.atomic()
+    def save(self, *args, **kwargs):
+        if self.pk and not self._state.adding:
+            previous_config = LlmProvider.objects.filter(pk=self.pk).values_list("config", flat=True).first()
+            if previous_config is not None and previous_config != self.config:
+                # files uploaded with the old credentials may not be accessible with the new ones
+                self.remote_files.all().delete()
+        super().save(*args, **kwargs)
+
     def get_llm_service(self):
         config = {k: v for k, v in self.config.items() if v}
         return self.type_enum.get_llm_service(config)
@@ -269,7 +278,11 @@ class VoiceProvider(BaseTeamModel, ProviderMixin):
 
     def get_speech_service(self) -> speech_service.SpeechService:
         config = {k: v for k, v in self.config.items() if v}
-        return self.type_enum.get_speech_service(config)
+        return self.type_enum.get_speech_service({**config, "cache_namespace": self.speech_cache_namespace})
+
+    @property
+    def speech_cache_namespace(self) -> str:
+        return f"team_{self.team_id}/voice_provider_{self.id}"
 
     @transaction.atomic()
     def add_files(self, files):
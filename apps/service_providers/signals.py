@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import VoiceProvider
+from .speech_cache import speech_cache
+
+
+@receiver(post_delete, sender=VoiceProvider)
+def clear_voice_provider_speech_cache(sender, instance, **kwargs):
+    # this also runs when the provider is deleted along with its team
+    namespace = instance.speech_cache_namespace
+    transaction.on_commit(lambda: speech_cache.clear_namespace(namespace))
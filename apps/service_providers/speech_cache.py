@@ -0,0 +1,141 @@
+"""Content-addressed cache of synthesized voice replies.
+
+Bots often reply with the same text, e.g. seed messages, consent prompts, reminders and error messages. The audio
+synthesized for a text and voice is stored in the default storage backend, along with each encoding that channels
+convert it to, so that repeated phrases skip both synthesis and transcoding.
+
+Most replies are only ever sent once, so audio is only stored the second time its key is seen. A Redis counter per
+key tracks how often it was seen, which keeps the storage backend out of the reply path for unique replies.
+
+Files are stored under the namespace of the voice provider they were synthesized with and named after the hash of
+their cache key. An index in Redis tracks when each file was last used and its size. Once the total size exceeds
+`SPEECH_CACHE_MAX_SIZE` bytes, the least recently used files are deleted. All the files of a namespace are deleted
+with `clear_namespace`, e.g. when the voice provider is deleted.
+"""
+
+import hashlib
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django_redis import get_redis_connection
+
+log = logging.getLogger("ocs.speech")
+
+# How long (in seconds) a key is remembered when it isn't seen again
+SEEN_TIMEOUT = 7 * 24 * 60 * 60
+
+
+def get_cache_key(*parts) -> str:
+    return hashlib.sha256("\0".join(str(part) for part in parts).encode()).hexdigest()
+
+
+class SpeechCache:
+    def __init__(self, location="speech_cache"):
+        # used for the storage location and to prefix the Redis keys of the index
+        self.location = location
+        self.index_key = f"{location}:index"
+        self.entries_key = f"{location}:entries"
+        self.size_key = f"{location}:size"
+
+    @property
+    def enabled(self) -> bool:
+        return settings.SPEECH_CACHE_MAX_SIZE > 0
+
+    def get(self, key: str) -> tuple[bytes, dict] | None:
+        """Returns the cached audio and its metadata, or `None` if the audio isn't cached"""
+        if not self.enabled:
+            return None
+
+        try:
+            redis = get_redis_connection("default")
+            entry = redis.hget(self.entries_key, key)
+            if entry is None:
+                return None
+
+            entry = json.loads(entry)
+            try:
+                with default_storage.open(entry["name"]) as f:
+                    data = f.read()
+            except FileNotFoundError:
+                self._remove(redis, key, entry)
+                return None
+
+            redis.zadd(self.index_key, {key: time.time()})
+            return data, entry["metadata"]
+        except Exception:
+            log.exception("Unable to read audio from the speech cache")
+            return None
+
+    def set(self, namespace: str, key: str, data: bytes, extension: str, metadata: dict):
+        """Stores the audio if `key` was seen before. The cache is trimmed to `SPEECH_CACHE_MAX_SIZE` afterwards."""
+        if not self.enabled:
+            return
+
+        name = f"{self.location}/{namespace}/{key}.{extension}"
+        entry = {"name": name, "namespace": namespace, "size": len(data), "metadata": metadata}
+        try:
+            redis = get_redis_connection("default")
+            if not self._seen_before(redis, key):
+                return
+
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(data))
+            if redis.hsetnx(self.entries_key, key, json.dumps(entry)):
+                redis.incrby(self.size_key, entry["size"])
+                redis.sadd(self._get_namespace_key(namespace), key)
+            redis.zadd(self.index_key, {key: time.time()})
+            self._trim(redis)
+        except Exception:
+            log.exception("Unable to add audio to the speech cache")
+
+    def clear_namespace(self, namespace: str):
+        """Deletes all the audio stored under `namespace`"""
+        try:
+            redis = get_redis_connection("default")
+            namespace_key = self._get_namespace_key(namespace)
+            for key in redis.smembers(namespace_key):
+                key = key.decode()
+                entry = redis.hget(self.entries_key, key)
+                if entry is not None:
+                    self._delete(redis, key, json.loads(entry))
+            redis.delete(namespace_key)
+        except Exception:
+            log.exception("Unable to clear the speech cache for %s", namespace)
+
+    def _seen_before(self, redis, key: str) -> bool:
+        seen_key = f"{self.location}:seen:{key}"
+        with redis.pipeline() as pipe:
+            pipe.incr(seen_key)
+            pipe.expire(seen_key, SEEN_TIMEOUT)
+            count, _ = pipe.execute()
+        return count > 1
+
+    def _get_namespace_key(self, namespace: str) -> str:
+        return f"{self.location}:namespace:{namespace}"
+
+    def _trim(self, redis):
+        while int(redis.get(self.size_key) or 0) > settings.SPEECH_CACHE_MAX_SIZE:
+            popped = redis.zpopmin(self.index_key)
+            if not popped:
+                break
+            key = popped[0][0].decode()
+            entry = redis.hget(self.entries_key, key)
+            if entry is not None:
+                self._delete(redis, key, json.loads(entry))
+
+    def _delete(self, redis, key: str, entry: dict):
+        self._remove(redis, key, entry)
+        default_storage.delete(entry["name"])
+
+    def _remove(self, redis, key: str, entry: dict):
+        if redis.hdel(self.entries_key, key):
+            redis.decrby(self.size_key, entry["size"])
+        redis.zrem(self.index_key, key)
+        redis.srem(self._get_namespace_key(entry["namespace"]), key)
+
+
+speech_cache = SpeechCache()
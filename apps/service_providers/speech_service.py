@@ -1,5 +1,8 @@
 import logging
+import re
 import tempfile
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
 from dataclasses import dataclass
 from io import BytesIO
@@ -9,44 +12,134 @@ import azure.cognitiveservices.speech as speechsdk
 import boto3
 import pydantic
 import requests
+from django.conf import settings
+from django.db import connections
 from openai import OpenAI
 from pydub import AudioSegment
 
-from apps.channels.audio import convert_audio
+from apps.channels.audio import convert_audio, transcode_audio
 from apps.chat.exceptions import AudioSynthesizeException, AudioTranscriptionException
 from apps.experiments.models import SyntheticVoice
+from apps.service_providers.speech_cache import get_cache_key, speech_cache
 
 log = logging.getLogger("ocs.speech")
 
+SENTENCE_END_REGEX = re.compile(r"(?<=[.!?])\s+")
+# The minimum length of the text chunks when synthesizing long replies in chunks
+MIN_CHUNK_LENGTH = 200
+
 
 @dataclass
 class SynthesizedAudio:
     audio: BytesIO
     duration: float
     format: str
+    # Identifies the audio in the speech cache. Conversions are only cached when these are set.
+    cache_namespace: str | None = None
+    cache_key: str | None = None
+    # Convert the audio by streaming it through ffmpeg instead of decoding it in memory
+    stream_conversion: bool = False
 
     def get_audio_bytes(self, format: str, codec: str | None = None) -> bytes:
         """Returns the audio bytes in the specified `format` and `codec`. A conversion will always be triggered
         when `codec` is specified to ensure that this codec was used.
         """
-        audio = self.audio
-        if self.format != format or codec is not None:
+        if self.format == format and codec is None:
+            return self.audio.getvalue()
+
+        cache_key = get_cache_key(self.cache_key, format, codec) if self.cache_namespace and self.cache_key else None
+        if cache_key and (cached := speech_cache.get(cache_key)):
+            return cached[0]
+
+        if self.stream_conversion:
+            audio_bytes = transcode_audio(
+                self.audio.getvalue(), target_format=format, source_format=self.format, codec=codec
+            )
+        else:
+            self.audio.seek(0)
             audio = convert_audio(audio=self.audio, target_format=format, source_format=self.format, codec=codec)
-        return audio.getvalue()
+            audio_bytes = audio.getvalue()
+        if cache_key:
+            speech_cache.set(self.cache_namespace, cache_key, audio_bytes, format, metadata={})
+        return audio_bytes
+
+
+def split_into_chunks(text: str, min_length=MIN_CHUNK_LENGTH) -> list[str]:
+    """Splits the text into chunks of whole sentences. Sentences are combined until the chunk has at least
+    `min_length` characters so that short sentences aren't sent as separate messages."""
+    chunks = []
+    current = ""
+    for sentence in SENTENCE_END_REGEX.split(text.strip()):
+        current = f"{current} {sentence}" if current else sentence
+        if len(current) >= min_length:
+            chunks.append(current)
+            current = ""
+    if current:
+        if chunks and len(current) < min_length // 2:
+            chunks[-1] = f"{chunks[-1]} {current}"
+        else:
+            chunks.append(current)
+    return chunks
 
 
 class SpeechService(pydantic.BaseModel):
     _type: ClassVar[str]
     supports_transcription: ClassVar[bool] = False
+    # Identifies the provider account in the speech cache. Audio is only cached when this is set.
+    cache_namespace: str | None = None
 
     def synthesize_voice(self, text: str, synthetic_voice: SyntheticVoice) -> SynthesizedAudio:
         assert synthetic_voice.service == self._type
+        cache_key = self._get_cache_key(text, synthetic_voice)
+        if cache_key and (cached := speech_cache.get(cache_key)):
+            audio_bytes, metadata = cached
+            return SynthesizedAudio(
+                audio=BytesIO(audio_bytes), cache_namespace=self.cache_namespace, cache_key=cache_key, **metadata
+            )
+
         try:
-            return self._synthesize_voice(text, synthetic_voice)
+            audio = self._synthesize_voice(text, synthetic_voice)
         except Exception as e:
             log.exception(e)
             raise AudioSynthesizeException(f"Unable to synthesize audio with {self._type}: {e}") from e
 
+        if cache_key:
+            metadata = {"duration": audio.duration, "format": audio.format}
+            speech_cache.set(self.cache_namespace, cache_key, audio.audio.getvalue(), audio.format, metadata=metadata)
+            audio.cache_namespace = self.cache_namespace
+            audio.cache_key = cache_key
+        return audio
+
+    def synthesize_voice_chunks(self, chunks: list[str], synthetic_voice: SyntheticVoice) -> Iterator[SynthesizedAudio]:
+        """Synthesizes the chunks concurrently and yields the audio for each chunk in order as soon as it is ready.
+        At most `SPEECH_SYNTHESIS_MAX_PARALLEL_REQUESTS` chunks are synthesized at the same time.
+
+        Raises `AudioSynthesizeException` when the chunk that failed is reached.
+        """
+        max_workers = max(1, min(settings.SPEECH_SYNTHESIS_MAX_PARALLEL_REQUESTS, len(chunks)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._synthesize_chunk, chunk, synthetic_voice) for chunk in chunks]
+            try:
+                for future in futures:
+                    audio = future.result()
+                    audio.stream_conversion = True
+                    yield audio
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _synthesize_chunk(self, text: str, synthetic_voice: SyntheticVoice) -> SynthesizedAudio:
+        try:
+            return self.synthesize_voice(text, synthetic_voice)
+        finally:
+            # close any connections opened by this thread
+            connections.close_all()
+
+    def _get_cache_key(self, text: str, synthetic_voice: SyntheticVoice) -> str | None:
+        if not self.cache_namespace or not synthetic_voice.id or not speech_cache.enabled:
+            return None
+        return get_cache_key(self.cache_namespace, self._type, synthetic_voice.id, text)
+
     def transcribe_audio(self, audio: BytesIO) -> str:
         try:
             self._transcribe_audio(audio)
@@ -0,0 +1,11 @@
+import pytest
+
+from apps.service_providers.tests.fake_assistants_server import FakeAssistantsServer
+
+
+@pytest.fixture()
+def fake_assistants_server():
+    """A fake OpenAI Assistants API. Use `fake_assistants_server.client` as the OpenAI client."""
+    server = FakeAssistantsServer()
+    yield server
+    server.client.close()
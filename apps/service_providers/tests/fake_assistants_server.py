@@ -0,0 +1,99 @@
+"""A fake OpenAI Assistants API used to test and benchmark how assistant runs are awaited.
+
+Runs complete `run_duration` seconds after they are created. Streamed runs send their events as the run progresses,
+polled runs report their status based on the time that has passed.
+"""
+
+import json
+import time
+from uuid import uuid4
+
+import httpx
+from openai import OpenAI
+
+
+class FakeAssistantsServer:
+    def __init__(self, run_duration=0.5, response="Hi there"):
+        self.run_duration = run_duration
+        self.response = response
+        self.runs = {}
+        self.retrieve_count = 0
+        self.client = OpenAI(
+            api_key="fake_key",
+            base_url="https://fake-assistants.test/v1",
+            http_client=httpx.Client(transport=httpx.MockTransport(self.handle_request)),
+        )
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        parts = request.url.path.removeprefix("/v1/").split("/")
+        body = json.loads(request.content) if request.content else {}
+        match request.method, parts:
+            case "POST", ["threads", "runs"]:
+                return self._create_run(f"thread_{uuid4().hex}", body)
+            case "POST", ["threads", thread_id, "runs"]:
+                return self._create_run(thread_id, body)
+            case "POST", ["threads", thread_id, "messages"]:
+                return httpx.Response(200, json=self._message(thread_id, run_id=None, role="user"))
+            case "GET", ["threads", thread_id, "runs", run_id]:
+                self.retrieve_count += 1
+                return httpx.Response(200, json=self._get_run(run_id))
+            case "GET", ["threads", thread_id, "messages"]:
+                messages = []
+                if not request.url.params.get("after"):
+                    messages = [self._message(thread_id, run_id) for run_id, run in self.runs.items() if run["done"]]
+                return httpx.Response(200, json={"object": "list", "data": messages, "has_more": False})
+        return httpx.Response(404, json={"error": {"message": f"Unexpected request: {request.method} {request.url}"}})
+
+    def _create_run(self, thread_id: str, body: dict) -> httpx.Response:
+        run_id = f"run_{uuid4().hex}"
+        self.runs[run_id] = {"thread_id": thread_id, "created": time.monotonic(), "done": False}
+        if body.get("stream"):
+            return httpx.Response(
+                200, headers={"content-type": "text/event-stream"}, content=self._stream_run_events(run_id)
+            )
+        return httpx.Response(200, json=self._run_data(run_id, "queued"))
+
+    def _stream_run_events(self, run_id: str):
+        yield self._event("thread.run.created", self._run_data(run_id, "queued"))
+        yield self._event("thread.run.in_progress", self._run_data(run_id, "in_progress"))
+        time.sleep(self.run_duration)
+        yield self._event("thread.run.completed", self._get_run(run_id))
+        yield b"event: done\ndata: [DONE]\n\n"
+
+    def _get_run(self, run_id: str) -> dict:
+        run = self.runs[run_id]
+        if time.monotonic() - run["created"] >= self.run_duration:
+            run["done"] = True
+            return self._run_data(run_id, "completed")
+        return self._run_data(run_id, "in_progress")
+
+    def _event(self, event: str, data: dict) -> bytes:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+    def _run_data(self, run_id: str, status: str) -> dict:
+        return {
+            "id": run_id,
+            "object": "thread.run",
+            "thread_id": self.runs[run_id]["thread_id"],
+            "assistant_id": "asst_123",
+            "status": status,
+            "created_at": 0,
+            "instructions": "",
+            "model": "gpt-4o",
+            "tools": [],
+            "parallel_tool_calls": True,
+        }
+
+    def _message(self, thread_id: str, run_id: str | None, role="assistant") -> dict:
+        return {
+            "id": f"msg_{uuid4().hex}",
+            "object": "thread.message",
+            "thread_id": thread_id,
+            "run_id": run_id,
+            "role": role,
+            "status": "completed",
+            "created_at": 0,
+            "attachments": [],
+            "metadata": {},
+            "content": [{"type": "text", "text": {"value": self.response, "annotations": []}}],
+        }
@@ -0,0 +1,65 @@
+import time
+from unittest import mock
+
+import pytest
+
+from apps.service_providers.llm_service.main import OpenAIAssistantRunnable
+
+
+@pytest.fixture()
+def assistant(fake_assistants_server):
+    return OpenAIAssistantRunnable(assistant_id="asst_123", client=fake_assistants_server.client)
+
+
+def _invoke(assistant: OpenAIAssistantRunnable):
+    start = time.monotonic()
+    response = assistant.invoke({"content": "Hi"})
+    return response, time.monotonic() - start
+
+
+def test_streamed_run_not_polled(assistant, fake_assistants_server):
+    response, _ = _invoke(assistant)
+
+    assert response[0].content[0].text.value == "Hi there"
+    assert fake_assistants_server.retrieve_count == 0
+    assert assistant.poll_stats.polls == 0
+
+
+def test_polling_backs_off(assistant, fake_assistants_server):
+    assistant.stream_runs = False
+    assistant.check_every_ms = 300
+    fake_assistants_server.run_duration = 1
+    with mock.patch("apps.service_providers.llm_service.main.sleep", side_effect=time.sleep) as sleep:
+        response, _ = _invoke(assistant)
+
+    assert response[0].content[0].text.value == "Hi there"
+    assert assistant.poll_stats.polls == fake_assistants_server.retrieve_count
+    intervals = [call.args[0] for call in sleep.call_args_list]
+    assert intervals[:3] == pytest.approx([0.1, 0.15, 0.225])
+    assert max(intervals) == 0.3
+
+
+def test_polling_existing_thread(assistant, fake_assistants_server):
+    assistant.stream_runs = False
+    fake_assistants_server.run_duration = 0
+    _invoke(assistant)
+    thread_id = next(iter(fake_assistants_server.runs.values()))["thread_id"]
+    response = assistant.invoke({"content": "Hi again", "thread_id": thread_id})
+
+    assert response[0].content[0].text.value == "Hi there"
+    assert assistant.poll_stats.polls == 2
+
+
+@pytest.mark.benchmark()
+def test_run_wait_benchmark(assistant, fake_assistants_server):
+    """Compares how long after a run completes its response is returned when the run is streamed and when it is
+    polled"""
+    runs = 5
+    for stream_runs in (True, False):
+        assistant.stream_runs = stream_runs
+        assistant.poll_stats.polls = 0
+        overheads = [_invoke(assistant)[1] - fake_assistants_server.run_duration for _ in range(runs)]
+        print(
+            f"\n{'streamed' if stream_runs else 'polled'}: {sum(overheads) / runs * 1000:.0f}ms mean wait after the "
+            f"run completed, {max(overheads) * 1000:.0f}ms max, {assistant.poll_stats.polls / runs:.1f} polls per run"
+        )
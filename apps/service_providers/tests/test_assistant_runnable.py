@@ -36,7 +36,7 @@ ASSISTANT_ID = "test_assistant_id"
 @pytest.fixture(params=[True, False], ids=["with_tools", "without_tools"])
 def session(request):
     chat = Chat()
-    chat.save = lambda: None
+    chat.save = lambda *args, **kwargs: None
     session = ExperimentSessionFactory.build(chat=chat)
     local_assistant = OpenAiAssistantFactory.build(id=1, assistant_id=ASSISTANT_ID, include_file_info=False)
     if request.param:
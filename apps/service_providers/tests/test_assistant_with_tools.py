@@ -53,6 +53,7 @@ def test_assistant_tool_response(submit_tool_outputs, session):
             "tool_outputs": [{"output": "test tool output", "tool_call_id": "call1"}],
             "run_id": "test",
             "thread_id": "test_thread_id",
+            "stream": True,
         },
     )
 
@@ -99,7 +100,9 @@ def test_assistant_tool_artifact_response(create_run, create_message, create_fil
     )
     # check that the run was created with the correct tools (excluding the artifact tool)
     assert create_run.call_args_list == [
-        mock.call("test_thread_id", assistant_id="assistant_1", tools=[{"type": tool} for tool in builtin_tools])
+        mock.call(
+            "test_thread_id", assistant_id="assistant_1", tools=[{"type": tool} for tool in builtin_tools], stream=True
+        )
     ]
 
 
@@ -0,0 +1,110 @@
+import time
+from unittest import mock
+
+import openai
+import pytest
+from langchain_anthropic import ChatAnthropic
+
+from apps.service_providers.llm_service.http_clients import HttpClientManager
+from apps.service_providers.llm_service.main import AnthropicLlmService, OpenAILlmService, PooledChatAnthropic
+
+
+@pytest.fixture()
+def client_manager():
+    return HttpClientManager(stale_timeout=1, max_clients=2)
+
+
+def test_get_reuses_existing_client(client_manager):
+    first_client = client_manager.get(openai.DefaultHttpxClient, "key", "https://api.example.com")
+    second_client = client_manager.get(openai.DefaultHttpxClient, "key", "https://api.example.com")
+
+    assert first_client is second_client
+    assert len(client_manager.clients) == 1
+
+
+def test_get_creates_different_clients_for_different_keys(client_manager):
+    first_client = client_manager.get(openai.DefaultHttpxClient, "key", "https://api.example.com")
+    other_key = client_manager.get(openai.DefaultHttpxClient, "other key", "https://api.example.com")
+    other_base = client_manager.get(openai.DefaultHttpxClient, "key", "https://other.example.com")
+
+    assert len({id(first_client), id(other_key), id(other_base)}) == 3
+    assert len(client_manager.clients) == 3
+
+
+def test_credentials_not_stored_in_keys(client_manager):
+    client_manager.get(openai.DefaultHttpxClient, "secret key", "https://api.example.com")
+    assert not any("secret key" in key for key in client_manager.clients)
+
+
+def test_prune_stale_clients(client_manager):
+    client = client_manager.get(openai.DefaultHttpxClient, "key", "https://api.example.com")
+    client_manager.get(openai.DefaultHttpxClient, "other key", "https://api.example.com")
+
+    with mock.patch("time.time", return_value=time.time() + 2):
+        client_manager.get(openai.DefaultHttpxClient, "key", "https://api.example.com")
+        client_manager._prune_stale()
+
+    assert list(client_manager.clients.values()) == [(mock.ANY, client)]
+    # pruned clients may still be in use so they aren't closed
+    assert not client.is_closed
+
+
+def test_prune_clients_above_max(client_manager):
+    for i in range(4):
+        client_manager.get(openai.DefaultHttpxClient, f"key {i}", "https://api.example.com")
+    client_manager._prune_stale()
+    assert len(client_manager.clients) == 2
+
+
+def test_shutdown_closes_clients(client_manager):
+    client = client_manager.get(openai.DefaultHttpxClient, "key", "https://api.example.com")
+    client_manager.shutdown()
+    assert client.is_closed
+    assert client_manager.clients == {}
+
+
+def test_chat_models_share_http_client():
+    service = OpenAILlmService(openai_api_key="key", openai_api_base="https://api.example.com")
+    with mock.patch("langchain_openai.ChatOpenAI.get_num_tokens_from_messages"):
+        first = service.get_chat_model("gpt-4o", 0.7)
+        second = service.get_chat_model("gpt-4o-mini", 0.1)
+    assert first.root_client._client is second.root_client._client
+    assert service.get_raw_client()._client is first.root_client._client
+
+
+def test_anthropic_chat_models_share_http_client():
+    service = AnthropicLlmService(anthropic_api_key="key", anthropic_api_base="https://api.example.com")
+    first = service.get_chat_model("claude-3-5-sonnet-20240620", 0.7)
+    second = service.get_chat_model("claude-3-5-sonnet-20240620", 0.1)
+    assert first._client._client is second._client._client
+    assert first._client.api_key == "key"
+
+
+@pytest.mark.parametrize("timeout", [None, 0, 30.0])
+def test_pooled_anthropic_clients_match_chat_anthropic(timeout):
+    """PooledChatAnthropic replaces the client setup of the installed langchain-anthropic so the clients it creates
+    should only differ in the HTTP client"""
+    kwargs = {
+        "anthropic_api_key": "key",
+        "anthropic_api_url": "https://api.example.com",
+        "model": "claude-3-5-sonnet-20240620",
+        "max_retries": 5,
+        "default_request_timeout": timeout,
+        "default_headers": {"X-Test": "1"},
+    }
+    http_client = openai.DefaultHttpxClient()
+    pooled = PooledChatAnthropic(**kwargs, http_client=http_client)
+    expected = ChatAnthropic(**kwargs)
+
+    assert pooled._client._client is http_client
+    for client, expected_client in [(pooled._client, expected._client), (pooled._async_client, expected._async_client)]:
+        assert type(client) is type(expected_client)
+        for attr in ["api_key", "base_url", "max_retries", "timeout", "_custom_headers"]:
+            assert getattr(client, attr) == getattr(expected_client, attr), attr
+
+
+def test_http_client_connections_limited(settings):
+    settings.LLM_PROVIDER_MAX_CONCURRENT_REQUESTS = 3
+    service = AnthropicLlmService(anthropic_api_key="limited key", anthropic_api_base="https://api.example.com")
+    model = service.get_chat_model("claude-3-5-sonnet-20240620", 0.7)
+    assert model._client._client._transport._pool._max_connections == 3
@@ -0,0 +1,134 @@
+from io import BytesIO
+from unittest import mock
+from uuid import uuid4
+
+import pytest
+from django.core.files.storage import default_storage
+
+from apps.experiments.models import SyntheticVoice
+from apps.service_providers.models import VoiceProvider, VoiceProviderType
+from apps.service_providers.speech_cache import SpeechCache
+from apps.service_providers.speech_service import SynthesizedAudio
+
+
+@pytest.fixture()
+def speech_cache(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    settings.SPEECH_CACHE_MAX_SIZE = 1024
+    cache = SpeechCache(location=f"speech_cache_{uuid4().hex}")
+    with mock.patch("apps.service_providers.speech_service.speech_cache", cache):
+        yield cache
+
+
+@pytest.fixture()
+def voice_provider(team_with_users):
+    return VoiceProvider.objects.create(
+        team=team_with_users, name="OpenAI", type=VoiceProviderType.openai, config={"openai_api_key": "123"}
+    )
+
+
+@pytest.fixture()
+def synthetic_voice(voice_provider):
+    return SyntheticVoice.objects.create(
+        name="alloy",
+        neural=True,
+        language="English",
+        language_code="en",
+        gender="female",
+        service=SyntheticVoice.OpenAI,
+        voice_provider=voice_provider,
+    )
+
+
+def _synthesize(voice_provider, synthetic_voice, text):
+    speech_service = voice_provider.get_speech_service()
+    mock_synthesize = mock.Mock(return_value=SynthesizedAudio(audio=BytesIO(b"mp3 audio"), duration=2.0, format="mp3"))
+    # bypass pydantic validation
+    object.__setattr__(speech_service, "_synthesize_voice", mock_synthesize)
+    return speech_service.synthesize_voice(text, synthetic_voice), mock_synthesize
+
+
+def _convert(audio):
+    with mock.patch(
+        "apps.service_providers.speech_service.convert_audio", return_value=BytesIO(b"ogg audio")
+    ) as convert:
+        assert audio.get_audio_bytes("ogg", codec="libopus") == b"ogg audio"
+    return convert
+
+
+def test_repeated_text_not_synthesized_or_converted_again(speech_cache, voice_provider, synthetic_voice):
+    with mock.patch("apps.service_providers.speech_cache.default_storage.save") as save:
+        audio, synthesize = _synthesize(voice_provider, synthetic_voice, "Hi there")
+        assert synthesize.call_count == 1
+        assert _convert(audio).call_count == 1
+    # nothing is stored the first time the text is seen
+    save.assert_not_called()
+
+    audio, synthesize = _synthesize(voice_provider, synthetic_voice, "Hi there")
+    assert synthesize.call_count == 1
+    assert _convert(audio).call_count == 1
+
+    audio, synthesize = _synthesize(voice_provider, synthetic_voice, "Hi there")
+    synthesize.assert_not_called()
+    assert (audio.audio.getvalue(), audio.duration, audio.format) == (b"mp3 audio", 2.0, "mp3")
+    _convert(audio).assert_not_called()
+    assert default_storage.listdir(f"{speech_cache.location}/{voice_provider.speech_cache_namespace}")[1]
+
+    _, synthesize = _synthesize(voice_provider, synthetic_voice, "Bye")
+    assert synthesize.call_count == 1
+
+
+def _store(speech_cache, key, data, namespace="team"):
+    # audio is only stored once its key is seen again
+    for _ in range(2):
+        speech_cache.set(namespace, key, data, "mp3", metadata={})
+
+
+def test_least_recently_used_audio_removed(speech_cache, settings):
+    settings.SPEECH_CACHE_MAX_SIZE = 10
+    _store(speech_cache, "first", b"12345")
+    _store(speech_cache, "second", b"12345")
+    assert speech_cache.get("first") == (b"12345", {})
+
+    _store(speech_cache, "third", b"12345")
+    assert speech_cache.get("second") is None
+    assert not default_storage.exists(f"{speech_cache.location}/team/second.mp3")
+    assert speech_cache.get("first") is not None
+    assert speech_cache.get("third") is not None
+
+
+def test_cache_disabled(speech_cache, settings):
+    settings.SPEECH_CACHE_MAX_SIZE = 0
+    _store(speech_cache, "first", b"12345")
+    assert speech_cache.get("first") is None
+    assert not default_storage.exists(f"{speech_cache.location}/team/first.mp3")
+
+
+def test_clear_namespace(speech_cache):
+    _store(speech_cache, "first", b"1", namespace="team_1")
+    _store(speech_cache, "second", b"2", namespace="team_2")
+
+    speech_cache.clear_namespace("team_1")
+    assert speech_cache.get("first") is None
+    assert not default_storage.exists(f"{speech_cache.location}/team_1/first.mp3")
+    assert speech_cache.get("second") == (b"2", {})
+
+
+@pytest.mark.parametrize("delete_team", [False, True])
+def test_audio_deleted_with_voice_provider(
+    delete_team, speech_cache, voice_provider, synthetic_voice, django_capture_on_commit_callbacks
+):
+    for _ in range(2):
+        audio, _ = _synthesize(voice_provider, synthetic_voice, "Hi there")
+    cache_key = audio.cache_key
+    assert speech_cache.get(cache_key) is not None
+
+    with (
+        mock.patch("apps.service_providers.signals.speech_cache", speech_cache),
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        if delete_team:
+            voice_provider.team.delete()
+        else:
+            voice_provider.delete()
+    assert speech_cache.get(cache_key) is None
@@ -1,9 +1,12 @@
+import time
 from io import BytesIO
 from unittest import mock
 
 import pytest
 
-from apps.service_providers.speech_service import SynthesizedAudio
+from apps.chat.exceptions import AudioSynthesizeException
+from apps.experiments.models import SyntheticVoice
+from apps.service_providers.speech_service import OpenAISpeechService, SynthesizedAudio, split_into_chunks
 
 
 @pytest.mark.parametrize(
@@ -21,3 +24,59 @@ def test_synthesized_audio(source_format, target_format, codec, conversion_expec
             convert_audio.assert_called()
         else:
             convert_audio.assert_not_called()
+
+
+def test_stream_conversion():
+    audio = SynthesizedAudio(audio=BytesIO(b"123"), duration=10.0, format="mp3", stream_conversion=True)
+    with (
+        mock.patch("apps.service_providers.speech_service.transcode_audio", return_value=b"321") as transcode_audio,
+        mock.patch("apps.service_providers.speech_service.convert_audio") as convert_audio,
+    ):
+        assert audio.get_audio_bytes("ogg", "libopus") == b"321"
+    transcode_audio.assert_called_once_with(b"123", target_format="ogg", source_format="mp3", codec="libopus")
+    convert_audio.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("Hi there.", ["Hi there."]),
+        ("One. Two! Three? Four.", ["One. Two!", "Three? Four."]),
+        ("One two three. Four five six. A.", ["One two three.", "Four five six. A."]),
+    ],
+)
+def test_split_into_chunks(text, expected):
+    assert split_into_chunks(text, min_length=9) == expected
+
+
+def test_synthesize_voice_chunks_in_order(settings):
+    settings.SPEECH_SYNTHESIS_MAX_PARALLEL_REQUESTS = 2
+    service = OpenAISpeechService(openai_api_key="123")
+    voice = SyntheticVoice(name="alloy", service=SyntheticVoice.OpenAI)
+
+    def _synthesize(text, synthetic_voice):
+        # the first chunk takes the longest
+        time.sleep(0.1 if text == "one" else 0)
+        return SynthesizedAudio(audio=BytesIO(text.encode()), duration=1.0, format="mp3")
+
+    with mock.patch.object(OpenAISpeechService, "_synthesize_voice", side_effect=_synthesize):
+        chunks = list(service.synthesize_voice_chunks(["one", "two", "three"], voice))
+
+    assert [chunk.audio.getvalue() for chunk in chunks] == [b"one", b"two", b"three"]
+    assert all(chunk.stream_conversion for chunk in chunks)
+
+
+def test_synthesize_voice_chunks_failure():
+    service = OpenAISpeechService(openai_api_key="123")
+    voice = SyntheticVoice(name="alloy", service=SyntheticVoice.OpenAI)
+
+    def _synthesize(text, synthetic_voice):
+        if text == "two":
+            raise Exception("failed")
+        return SynthesizedAudio(audio=BytesIO(text.encode()), duration=1.0, format="mp3")
+
+    with mock.patch.object(OpenAISpeechService, "_synthesize_voice", side_effect=_synthesize):
+        chunks = service.synthesize_voice_chunks(["one", "two", "three"], voice)
+        assert next(chunks).audio.getvalue() == b"one"
+        with pytest.raises(AudioSynthesizeException):
+            next(chunks)
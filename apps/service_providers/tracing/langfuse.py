@@ -1,11 +1,9 @@
 from __future__ import annotations
 
 import atexit
-import logging
-import threading
-import time
-from threading import RLock
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING
+
+from apps.service_providers.client_manager import KeyedClientManager
 
 from . import TraceService
 from .base import ServiceNotInitializedException, ServiceReentryException
@@ -16,9 +14,6 @@ if TYPE_CHECKING:
     from langfuse import Langfuse
 
 
-logger = logging.getLogger("ocs.tracing.langfuse")
-
-
 class LangFuseTraceService(TraceService):
     """
     Notes on langfuse:
@@ -66,74 +61,19 @@ class LangFuseTraceService(TraceService):
         self.client.flush()
 
 
-class ClientManager:
-    """This class manages the langfuse clients to avoid creating a new client for every request.
-    On requests for a client it will also remove any clients that have been inactive for a
-    certain amount of time."""
+class ClientManager(KeyedClientManager["Langfuse"]):
+    """This class manages the langfuse clients to avoid creating a new client for every request."""
 
     def __init__(self, stale_timeout=300, prune_interval=60, max_clients=20) -> None:
-        self.clients: dict[int, tuple[float, Any]] = {}
-        self.stale_timeout = stale_timeout
-        self.max_clients = max_clients
-        self.prune_interval = prune_interval
-        self.lock = RLock()
-        self._start_prune_thread()
+        super().__init__(stale_timeout=stale_timeout, prune_interval=prune_interval, max_clients=max_clients)
 
     def get(self, config: dict) -> Langfuse:
         from langfuse import Langfuse
 
-        key = hash(frozenset(config.items()))
-        with self.lock:
-            if key not in self.clients:
-                logger.debug("Creating new client with key '%s'", key)
-                client = Langfuse(**config)
-            else:
-                client = self.clients[key][1]
-            self.clients[key] = (time.time(), client)
-        return client
-
-    def _start_prune_thread(self):
-        self._prune_thread = threading.Thread(target=self._prune_worker, daemon=True)
-        self._prune_thread.start()
-
-    def _prune_worker(self):
-        while True:
-            time.sleep(self.prune_interval)
-            self._prune_stale()
-
-    def _prune_stale(self):
-        if not self.clients:
-            return
-
-        logger.debug("Pruning clients...")
-        for key in list(self.clients.keys()):
-            timestamp, client = self.clients[key]
-            if time.time() - timestamp > self.stale_timeout:
-                logger.debug("Pruning old client with key '%s'", key)
-                self._remove_client(key, client)
-
-        if len(self.clients) > self.max_clients:
-            # remove the oldest clients until we are below the max
-            sorted_clients = sorted(self.clients.items(), key=lambda x: x[1][0])
-            clients_to_remove = sorted_clients[: len(self.clients) - self.max_clients]
-            logger.debug("Pruned %d clients above max limit", len(clients_to_remove))
-            for key, (_, client) in clients_to_remove:
-                self._remove_client(key, client)
-
-    def _remove_client(self, key, client):
-        with self.lock:
-            self.clients.pop(key)
-        client.shutdown()
-
-    def shutdown(self):
-        if not self.clients:
-            return
+        return self.get_client(sorted(config.items()), lambda: Langfuse(**config))
 
-        with self.lock:
-            logger.debug("Shutting down all langfuse clients (%s)", len(self.clients))
-            for key, (_, client) in self.clients.items():
-                client.shutdown()
-            self.clients = {}
+    def close_client(self, client: Langfuse):
+        client.shutdown()
 
 
 client_manager = ClientManager()
@@ -1,4 +1,7 @@
+from collections.abc import Iterator, Sequence
+
 from django.db import models
+from django.db.models import Q
 
 
 class MakeInterval(models.Func):
@@ -21,3 +24,45 @@ class UnquotedValue(models.Value):
 
     def as_sql(self, compiler, connection):
         return self.value, []
+
+
+def iterate_newest_first(queryset: models.QuerySet, page_size: int = 100) -> Iterator[models.Model]:
+    """Iterates over a queryset from newest to oldest using keyset pagination on `(created_at, id)`.
+
+    Each page is a separate query that continues from the last row of the previous page, so callers
+    that stop iterating early only read the pages they consumed.
+    """
+    queryset = queryset.order_by("-created_at", "-id")
+    page = list(queryset[:page_size])
+    while page:
+        yield from page
+        if len(page) < page_size:
+            return
+        last = page[-1]
+        page = list(
+            queryset.filter(Q(created_at__lt=last.created_at) | Q(created_at=last.created_at, id__lt=last.id))[
+                :page_size
+            ]
+        )
+
+
+def iterate_in_pages(
+    queryset: models.QuerySet, ordering: Sequence[str] = ("id",), page_size: int = 1000
+) -> Iterator[list[models.Model]]:
+    """Iterates over a queryset in ascending `ordering` one page at a time using keyset pagination.
+
+    The last field in `ordering` must be unique (e.g. `id`) so that every row is returned exactly once. Unlike
+    `queryset.iterator()` this doesn't hold a server side cursor open and works with `prefetch_related`.
+    """
+    queryset = queryset.order_by(*ordering)
+    page = list(queryset[:page_size])
+    while page:
+        yield page
+        if len(page) < page_size:
+            return
+        last = page[-1]
+        values = [getattr(last, field) for field in ordering]
+        after_last = Q()
+        for i, field in enumerate(ordering):
+            after_last |= Q(**dict(zip(ordering[:i], values[:i], strict=True)), **{f"{field}__gt": values[i]})
+        page = list(queryset.filter(after_last)[:page_size])
@@ -7,5 +7,7 @@ class FileFactory(factory.django.DjangoModelFactory):
 
     team = factory.SubFactory("apps.utils.factories.team.TeamFactory")
     name = factory.Faker("file_name")
-    file = factory.django.FileField(filename=factory.Faker("file_name"))
+    file = factory.django.FileField(
+        filename=factory.Faker("file_name"), data=factory.Sequence(lambda n: f"file content {n}".encode())
+    )
     content_type = "text/plain"
@@ -0,0 +1,63 @@
+"""Redis pub/sub notifications for Celery task completion.
+
+These allow a request to wait for a task to finish without repeatedly polling the result backend.
+"""
+
+import threading
+import time
+
+from celery.result import AsyncResult
+from django_redis import get_redis_connection
+
+
+class TaskWaitUnavailable(Exception):
+    """Raised when the process is already running the maximum number of concurrent waits."""
+
+
+_waits_lock = threading.Lock()
+_active_waits = 0
+
+
+def _get_channel_name(task_id: str) -> str:
+    return f"ocs:task_complete:{task_id}"
+
+
+def notify_task_complete(task_id: str):
+    get_redis_connection("default").publish(_get_channel_name(task_id), "complete")
+
+
+def wait_for_task(task_id: str, timeout: float, max_waits: int) -> bool:
+    """Waits up to `timeout` seconds for the task to complete and returns whether it has completed.
+
+    Each wait holds a web server thread so at most `max_waits` requests in a process can wait at the same time.
+    Raises `TaskWaitUnavailable` straight away when the limit has been reached, in which case the caller should
+    fall back to polling.
+    """
+    global _active_waits
+    with _waits_lock:
+        if _active_waits >= max_waits:
+            raise TaskWaitUnavailable()
+        _active_waits += 1
+
+    try:
+        return _wait_for_notification(task_id, timeout)
+    finally:
+        with _waits_lock:
+            _active_waits -= 1
+
+
+def _wait_for_notification(task_id: str, timeout: float) -> bool:
+    pubsub = get_redis_connection("default").pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(_get_channel_name(task_id))
+    try:
+        # check after subscribing so that a notification sent before we subscribed isn't missed
+        if AsyncResult(task_id).ready():
+            return True
+
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            if pubsub.get_message(timeout=remaining):
+                return True
+        return False
+    finally:
+        pubsub.close()
@@ -11,3 +11,9 @@ def update_taskbadger_data(celery_task, message_handler, message):
             data_merge_strategy="default",
             tags={"platform": message_handler.experiment_channel.platform, "team": team_slug},
         )
+
+
+def update_taskbadger_progress(celery_task, value: int, value_max: int | None = None):
+    tb_task = celery_task.taskbadger_task
+    if tb_task:
+        tb_task.safe_update(value=value, value_max=value_max)
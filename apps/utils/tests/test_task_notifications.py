@@ -0,0 +1,51 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from apps.utils.task_notifications import TaskWaitUnavailable, notify_task_complete, wait_for_task
+
+
+@pytest.fixture()
+def task_ready():
+    with patch("apps.utils.task_notifications.AsyncResult") as async_result:
+        async_result.return_value.ready.return_value = False
+        yield async_result.return_value.ready
+
+
+def test_wait_for_task_notified(task_ready):
+    timer = threading.Timer(0.1, notify_task_complete, args=("task-1",))
+    timer.start()
+    assert wait_for_task("task-1", timeout=5, max_waits=1) is True
+    timer.join()
+
+
+def test_wait_for_task_already_complete(task_ready):
+    task_ready.return_value = True
+    assert wait_for_task("task-2", timeout=5, max_waits=1) is True
+
+
+def test_wait_for_task_timeout(task_ready):
+    # notifications for other tasks are ignored
+    timer = threading.Timer(0.1, notify_task_complete, args=("other-task",))
+    timer.start()
+    assert wait_for_task("task-3", timeout=0.3, max_waits=1) is False
+    timer.join()
+
+
+def test_wait_for_task_limit(task_ready):
+    waiting = threading.Event()
+    task_ready.side_effect = lambda: waiting.set() or False
+
+    waiter = threading.Thread(target=wait_for_task, args=("task-4",), kwargs={"timeout": 5, "max_waits": 1})
+    waiter.start()
+    waiting.wait(timeout=5)
+    with pytest.raises(TaskWaitUnavailable):
+        wait_for_task("task-5", timeout=5, max_waits=1)
+
+    notify_task_complete("task-4")
+    waiter.join()
+    # the slot is released once the first wait ends
+    task_ready.side_effect = None
+    task_ready.return_value = True
+    assert wait_for_task("task-5", timeout=5, max_waits=1) is True
@@ -0,0 +1,20 @@
+import pytest
+
+from gpt_playground.celery import app
+
+
+@pytest.mark.parametrize(
+    ("task_name", "queue"),
+    [
+        ("apps.channels.tasks.handle_telegram_message", "chat"),
+        ("apps.channels.tasks.handle_buffered_messages", "chat"),
+        ("apps.experiments.tasks.get_response_for_webchat_task", "chat"),
+        ("apps.experiments.tasks.async_export_chat", "batch"),
+        ("apps.experiments.tasks.async_create_experiment_version", "batch"),
+        ("apps.events.tasks.poll_scheduled_messages", "batch"),
+        ("apps.events.tasks.fire_trigger", "celery"),
+    ],
+)
+def test_task_routing(task_name, queue):
+    route = app.amqp.router.route({}, task_name)
+    assert route["queue"].name == queue
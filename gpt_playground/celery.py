@@ -2,6 +2,7 @@ import os
 
 from celery import Celery
 from celery.app import trace
+from kombu import Queue
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gpt_playground.settings")
@@ -19,6 +20,34 @@ app.autodiscover_tasks()
 
 app.conf.result_expires = 86400  # expire results in redis in 1 day
 
+# Tasks are split into queues so that live conversations don't wait behind batch jobs. Workers consume the queues
+# in the order they are listed here (see `queue_order_strategy` in `CELERY_BROKER_TRANSPORT_OPTIONS`) and a
+# worker started without `-Q` consumes all of them. In production a separate worker consumes only the chat queue.
+CHAT_QUEUE = "chat"
+DEFAULT_QUEUE = "celery"
+BATCH_QUEUE = "batch"
+
+app.conf.task_queues = [Queue(CHAT_QUEUE), Queue(DEFAULT_QUEUE), Queue(BATCH_QUEUE)]
+app.conf.task_default_queue = DEFAULT_QUEUE
+app.conf.task_routes = {
+    # Someone is waiting for the response to these
+    "apps.channels.tasks.*": {"queue": CHAT_QUEUE},
+    "apps.experiments.tasks.get_response_for_webchat_task": {"queue": CHAT_QUEUE},
+    "apps.experiments.tasks.get_prompt_builder_response_task": {"queue": CHAT_QUEUE},
+    "apps.pipelines.tasks.get_response_for_pipeline_test_message": {"queue": CHAT_QUEUE},
+    # Long running or bulk work
+    "apps.experiments.tasks.async_export_chat": {"queue": BATCH_QUEUE},
+    "apps.experiments.tasks.async_create_experiment_version": {"queue": BATCH_QUEUE},
+    "apps.events.tasks.poll_scheduled_messages": {"queue": BATCH_QUEUE},
+    "apps.events.tasks.enqueue_timed_out_events": {"queue": BATCH_QUEUE},
+    "apps.assistants.tasks.*": {"queue": BATCH_QUEUE},
+    "apps.api.tasks.setup_connect_channels_for_bots": {"queue": BATCH_QUEUE},
+    "apps.files.tasks.clean_up_expired_files": {"queue": BATCH_QUEUE},
+    "apps.teams.tasks.delete_team_async": {"queue": BATCH_QUEUE},
+}
+# Only reserve one task per worker process at a time so that queued chat tasks can be picked up by any idle worker
+app.conf.worker_prefetch_multiplier = 1
+
 trace.LOG_SUCCESS = """\
 Task %(name)s[%(id)s] succeeded in %(runtime)ss\
 """
@@ -396,6 +396,28 @@ if REDIS_URL.startswith("rediss"):
     REDIS_URL = f"{REDIS_URL}?ssl_cert_reqs=none"
 
 CELERY_BROKER_URL = CELERY_RESULT_BACKEND = REDIS_URL
+# Consume the queues in the order they are listed in `task_queues` so that chat tasks are always picked up first
+CELERY_BROKER_TRANSPORT_OPTIONS = {"queue_order_strategy": "priority"}
+# How long (in seconds) to wait for more messages from a participant before handling channel webhook messages.
+# Messages received within this window are handled as a single turn. Set to 0 to handle every message separately.
+CHANNEL_MESSAGE_DEBOUNCE_SECONDS = env.int("CHANNEL_MESSAGE_DEBOUNCE_SECONDS", default=2)
+# The maximum number of concurrent requests each process sends to an LLM provider account. Requests above the limit
+# wait for an earlier request to complete.
+LLM_PROVIDER_MAX_CONCURRENT_REQUESTS = env.int("LLM_PROVIDER_MAX_CONCURRENT_REQUESTS", default=20)
+# The maximum total size (in bytes) of the synthesized voice replies that are kept in the storage backend so that
+# repeated replies don't need to be synthesized again. Set to 0 to disable the cache.
+SPEECH_CACHE_MAX_SIZE = env.int("SPEECH_CACHE_MAX_SIZE", default=500 * 1024 * 1024)
+# The maximum number of chunks of a voice reply that are synthesized at the same time when chunked voice replies are
+# enabled for a team
+SPEECH_SYNTHESIS_MAX_PARALLEL_REQUESTS = env.int("SPEECH_SYNTHESIS_MAX_PARALLEL_REQUESTS", default=3)
+# The maximum number of requests made at the same time when files are synced between an assistant and OpenAI
+OPENAI_SYNC_MAX_WORKERS = env.int("OPENAI_SYNC_MAX_WORKERS", default=8)
+# How long (in seconds) a web chat request waits for a pending response to be pushed to it before it returns and
+# the browser asks again
+WEBCHAT_RESPONSE_WAIT_TIMEOUT = env.int("WEBCHAT_RESPONSE_WAIT_TIMEOUT", default=10)
+# The maximum number of web chat requests in each web process that wait for a response at the same time. Each wait
+# holds a web server thread so this must stay well below the number of threads. Further requests poll instead.
+WEBCHAT_RESPONSE_MAX_WAITS = env.int("WEBCHAT_RESPONSE_MAX_WAITS", default=2)
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 CACHES = {
     "default": {
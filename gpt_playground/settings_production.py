@@ -68,6 +68,6 @@ MAILCHIMP_LIST_ID = env("MAILCHIMP_LIST_ID", default=None)
 # (the default is 1 hour). If this number is too low, a task may
 # get executed more than once at a time. The higher the number,
 # the longer it will take for a lost task to get rescheduled.
-CELERY_BROKER_TRANSPORT_OPTIONS = {"visibility_timeout": 60 * 5}
+CELERY_BROKER_TRANSPORT_OPTIONS = {**CELERY_BROKER_TRANSPORT_OPTIONS, "visibility_timeout": 60 * 5}
 # Reschedule un-acked tasks on worker failure (ie SIGKILL)
 CELERY_REJECT_ON_WORKER_LOST = True